@@ -0,0 +1,48 @@
+"""Store booking stays as a tsrange with a no-overlap exclusion constraint
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-19 10:00:00.000000
+
+The generated stay_range column is half-open ([check_in, check_out)) so a
+checkout and the next check-in on the same day do not conflict. The
+exclusion constraint is backed by a GiST index on (listing_id, stay_range)
+and only covers bookings that hold their dates (pending, confirmed), which
+makes PostgreSQL reject concurrent double bookings atomically.
+
+Existing overlapping active bookings must be resolved before upgrading,
+otherwise adding the constraint fails.
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    # btree_gist provides the GiST operator class for the integer listing_id
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+    op.execute(
+        "ALTER TABLE bookings ADD COLUMN stay_range tsrange "
+        "GENERATED ALWAYS AS (tsrange(check_in_date, check_out_date, '[)')) STORED"
+    )
+    op.execute(
+        "ALTER TABLE bookings ADD CONSTRAINT bookings_no_overlap "
+        "EXCLUDE USING gist (listing_id WITH =, stay_range WITH &&) "
+        "WHERE (status IN ('pending', 'confirmed'))"
+    )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute("ALTER TABLE bookings DROP CONSTRAINT IF EXISTS bookings_no_overlap")
+    op.execute("ALTER TABLE bookings DROP COLUMN IF EXISTS stay_range")
@@ -0,0 +1,45 @@
+"""Add listing rate rules and pricing version
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('listings', sa.Column('pricing_version', sa.Integer(), nullable=False, server_default='1'))
+
+    op.create_table('listing_rate_rules',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('listing_id', sa.Integer(), nullable=False),
+        sa.Column('rule_type', sa.String(), nullable=False),
+        sa.Column('weekdays', sa.JSON(), nullable=True),
+        sa.Column('start_date', sa.Date(), nullable=True),
+        sa.Column('end_date', sa.Date(), nullable=True),
+        sa.Column('price', sa.Float(), nullable=True),
+        sa.Column('min_nights', sa.Integer(), nullable=True),
+        sa.Column('discount_percent', sa.Float(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['listing_id'], ['listings.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_listing_rate_rules_id'), 'listing_rate_rules', ['id'], unique=False)
+    op.create_index(op.f('ix_listing_rate_rules_listing_id'), 'listing_rate_rules', ['listing_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_listing_rate_rules_listing_id'), table_name='listing_rate_rules')
+    op.drop_index(op.f('ix_listing_rate_rules_id'), table_name='listing_rate_rules')
+    op.drop_table('listing_rate_rules')
+
+    op.drop_column('listings', 'pricing_version')
@@ -0,0 +1,47 @@
+"""Add indexes backing guest and host booking lists
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-19 12:00:00.000000
+
+Built with CREATE INDEX CONCURRENTLY, as in 007, so the upgrade does not
+block bookings while they build; a failed build leaves an INVALID index
+to drop before rerunning.
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_listings_host_id', 'listings', ['host_id']),
+    ('ix_bookings_customer_id_check_in_date', 'bookings', ['customer_id', 'check_in_date']),
+    ('ix_bookings_listing_id_status_check_in_date', 'bookings', ['listing_id', 'status', 'check_in_date']),
+]
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False)
+        return
+
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, if_not_exists=True, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table)
+        return
+
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
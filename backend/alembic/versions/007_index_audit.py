@@ -0,0 +1,58 @@
+"""Index audit: foreign keys, filter columns and location search
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-19 13:00:00.000000
+
+Indexes are built with CREATE INDEX CONCURRENTLY so the upgrade does not
+block writes on large production tables. Concurrent builds cannot run in
+a transaction, hence the autocommit block. If a concurrent build fails
+it leaves an INVALID index behind; drop it and rerun the upgrade.
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_listings_is_active', 'listings', ['is_active']),
+    ('ix_reviews_listing_id', 'reviews', ['listing_id']),
+    ('ix_reviews_host_id', 'reviews', ['host_id']),
+    ('ix_reviews_reviewer_id', 'reviews', ['reviewer_id']),
+    ('ix_bookings_status', 'bookings', ['status']),
+]
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False)
+        return
+
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, if_not_exists=True, postgresql_concurrently=True)
+
+        # Trigram index for the substring location search in GET /listings/
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_listings_location_trgm "
+            "ON listings USING gin (location gin_trgm_ops)"
+        )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table)
+        return
+
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_listings_location_trgm")
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
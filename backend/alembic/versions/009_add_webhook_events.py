@@ -0,0 +1,45 @@
+"""Add Stripe webhook event inbox
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('webhook_events',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('event_id', sa.String(), nullable=False),
+        sa.Column('event_type', sa.String(), nullable=False),
+        sa.Column('payment_intent_id', sa.String(), nullable=True),
+        sa.Column('stripe_created', sa.Integer(), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('available_at', sa.DateTime(), nullable=False),
+        sa.Column('received_at', sa.DateTime(), nullable=False),
+        sa.Column('processed_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('event_id')
+    )
+    op.create_index(op.f('ix_webhook_events_id'), 'webhook_events', ['id'], unique=False)
+    op.create_index('ix_webhook_events_status_available_at', 'webhook_events', ['status', 'available_at'], unique=False)
+    op.create_index('ix_webhook_events_payment_intent_id_created', 'webhook_events', ['payment_intent_id', 'stripe_created'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_webhook_events_payment_intent_id_created', table_name='webhook_events')
+    op.drop_index('ix_webhook_events_status_available_at', table_name='webhook_events')
+    op.drop_index(op.f('ix_webhook_events_id'), table_name='webhook_events')
+    op.drop_table('webhook_events')
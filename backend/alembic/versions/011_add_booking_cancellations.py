@@ -0,0 +1,44 @@
+"""Add booking cancellations
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '011'
+down_revision = '010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('booking_cancellations',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('batch_id', sa.String(length=32), nullable=False),
+        sa.Column('booking_id', sa.Integer(), nullable=False),
+        sa.Column('cancelled_by_id', sa.Integer(), nullable=False),
+        sa.Column('reason', sa.Text(), nullable=True),
+        sa.Column('outcome', sa.String(), nullable=False),
+        sa.Column('refund_id', sa.String(), nullable=True),
+        sa.Column('refund_amount', sa.Float(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['booking_id'], ['bookings.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['cancelled_by_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_booking_cancellations_id'), 'booking_cancellations', ['id'], unique=False)
+    op.create_index(op.f('ix_booking_cancellations_batch_id'), 'booking_cancellations', ['batch_id'], unique=False)
+    op.create_index(op.f('ix_booking_cancellations_booking_id'), 'booking_cancellations', ['booking_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_booking_cancellations_booking_id'), table_name='booking_cancellations')
+    op.drop_index(op.f('ix_booking_cancellations_batch_id'), table_name='booking_cancellations')
+    op.drop_index(op.f('ix_booking_cancellations_id'), table_name='booking_cancellations')
+    op.drop_table('booking_cancellations')
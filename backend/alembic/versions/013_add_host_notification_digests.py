@@ -0,0 +1,40 @@
+"""Add host notification digests
+
+Revision ID: 013
+Revises: 012
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '013'
+down_revision = '012'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('notification_digest', sa.String(), nullable=False, server_default='immediate'))
+
+    op.create_table('host_notifications',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('host_id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('digested_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['host_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_host_notifications_id'), 'host_notifications', ['id'], unique=False)
+    op.create_index('ix_host_notifications_digested_at_host_id', 'host_notifications', ['digested_at', 'host_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_host_notifications_digested_at_host_id', table_name='host_notifications')
+    op.drop_index(op.f('ix_host_notifications_id'), table_name='host_notifications')
+    op.drop_table('host_notifications')
+    op.drop_column('users', 'notification_digest')
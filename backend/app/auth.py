@@ -1,22 +1,36 @@
+import hashlib
+import secrets
+import uuid
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from . import models, schemas
 from .database import get_db
 from .config import settings
+from .services.password_hashing import PasswordHasher, check_password, hash_password
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
+password_hasher = PasswordHasher(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING
+)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return check_password(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return hash_password(password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.verify(plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await password_hasher.hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -34,14 +48,74 @@ def get_user_by_email(db: Session, email: str):
 def get_user_by_username(db: Session, username: str):
     return db.query(models.User).filter(models.User.username == username).first()
 
-def authenticate_user(db: Session, email: str, password: str):
-    user = get_user_by_email(db, email)
+async def authenticate_user(db: Session, email: str, password: str):
+    user = await run_in_threadpool(get_user_by_email, db, email)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password_async(password, user.hashed_password):
         return False
     return user
 
+def _hash_refresh_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def create_refresh_token(db: Session, user: models.User, family_id: Optional[str] = None) -> Tuple[str, models.RefreshToken]:
+    """Issue an opaque refresh token; only its hash is stored"""
+    token = secrets.token_urlsafe(48)
+    db_token = models.RefreshToken(
+        user_id=user.id,
+        token_hash=_hash_refresh_token(token),
+        family_id=family_id or uuid.uuid4().hex,
+        expires_at=datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+    )
+    db.add(db_token)
+    db.flush()
+    return token, db_token
+
+def revoke_refresh_token_family(db: Session, family_id: str) -> None:
+    db.query(models.RefreshToken).filter(
+        models.RefreshToken.family_id == family_id,
+        models.RefreshToken.revoked_at.is_(None)
+    ).update({models.RefreshToken.revoked_at: datetime.utcnow()}, synchronize_session=False)
+
+def revoke_refresh_token(db: Session, token: str) -> None:
+    db_token = db.query(models.RefreshToken).filter(
+        models.RefreshToken.token_hash == _hash_refresh_token(token)
+    ).first()
+    if db_token:
+        revoke_refresh_token_family(db, db_token.family_id)
+
+def rotate_refresh_token(db: Session, token: str) -> Tuple[models.User, str]:
+    """Exchange a refresh token for a new one in the same family.
+
+    Presenting an already rotated token means it leaked, so the whole
+    family is revoked and the caller has to log in again.
+    """
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    db_token = db.query(models.RefreshToken).filter(
+        models.RefreshToken.token_hash == _hash_refresh_token(token)
+    ).with_for_update().first()
+    if db_token is None:
+        raise credentials_exception
+
+    if db_token.revoked_at is not None:
+        revoke_refresh_token_family(db, db_token.family_id)
+        db.commit()
+        raise credentials_exception
+
+    if db_token.expires_at < datetime.utcnow():
+        raise credentials_exception
+
+    new_token, new_db_token = create_refresh_token(db, db_token.user, family_id=db_token.family_id)
+    db_token.revoked_at = datetime.utcnow()
+    db_token.replaced_by_id = new_db_token.id
+    db.commit()
+    return db_token.user, new_token
+
 async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -71,4 +145,12 @@ def get_current_host(current_user: models.User = Depends(get_current_active_user
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not enough permissions. Host access required."
         )
-    return current_user 
\ No newline at end of file
+    return current_user
+
+def get_current_admin(current_user: models.User = Depends(get_current_active_user)):
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions. Admin access required."
+        )
+    return current_user
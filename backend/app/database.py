@@ -1,9 +1,55 @@
-from sqlalchemy import create_engine
+from typing import Optional
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import NullPool
 from .config import settings
 
-engine = create_engine(settings.DATABASE_URL)
+# SQLSTATE raised by PostgreSQL when statement_timeout cancels a statement
+QUERY_CANCELED = "57014"
+
+def engine_options(url: str) -> dict:
+    """create_engine() arguments for ``url`` from the DB_* settings.
+
+    Only PostgreSQL is tuned; SQLite (tests, local tools) keeps SQLAlchemy's
+    defaults. Behind PgBouncer in transaction mode the bouncer does the
+    pooling, and it rejects startup options, so the statement timeout is
+    set per transaction by ``_set_transaction_timeout`` instead.
+    """
+    if not url.startswith("postgresql"):
+        return {}
+    if settings.DB_PGBOUNCER_TRANSACTION_MODE:
+        return {"poolclass": NullPool}
+    options = {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING
+    }
+    if settings.DB_STATEMENT_TIMEOUT_MS:
+        options["connect_args"] = {"options": f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"}
+    return options
+
+def _set_transaction_timeout(conn):
+    # One extra round trip per transaction; setting statement_timeout on the
+    # database role instead (and DB_STATEMENT_TIMEOUT_MS=0) avoids it
+    conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(settings.DB_STATEMENT_TIMEOUT_MS)}")
+
+def make_engine(url: str, connect_args: Optional[dict] = None) -> Engine:
+    """Engine for ``url`` with the DB_* settings applied; the primary and every replica use it"""
+    options = engine_options(url)
+    if connect_args:
+        options["connect_args"] = {**options.get("connect_args", {}), **connect_args}
+    new_engine = create_engine(url, **options)
+    if new_engine.dialect.name == "postgresql" and settings.DB_PGBOUNCER_TRANSACTION_MODE and settings.DB_STATEMENT_TIMEOUT_MS:
+        event.listen(new_engine, "begin", _set_transaction_timeout)
+    return new_engine
+
+engine = make_engine(settings.DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -13,4 +59,13 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+def set_statement_timeout(db: Session, milliseconds: int):
+    """Override statement_timeout until the session's transaction ends (PostgreSQL only)"""
+    if milliseconds and db.get_bind().dialect.name == "postgresql":
+        db.execute(text(f"SET LOCAL statement_timeout = {int(milliseconds)}"))
+
+def is_statement_timeout(error: DBAPIError) -> bool:
+    """Whether a DBAPIError is a statement cancelled by statement_timeout"""
+    return getattr(error.orig, "pgcode", None) == QUERY_CANCELED
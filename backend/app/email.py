@@ -1,16 +1,104 @@
+import asyncio
+import logging
+import socket
+from contextlib import asynccontextmanager
 import aiosmtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from jinja2 import Environment, FileSystemLoader
-from typing import List, Optional
+from jinja2 import Environment, FileSystemLoader, Template, select_autoescape
+from opentelemetry.trace import SpanKind
+from typing import Dict, List, Optional
 import os
 from .config import settings
+from .services.resilience import register_breaker, retry_async
+from .tracing import traced
 
-# Initialize Jinja2 environment for email templates
+logger = logging.getLogger(__name__)
+
+# Initialize Jinja2 environment for email templates; templates are compiled once
+# by EmailService.warm_up and never re-checked on disk
 template_env = Environment(
-    loader=FileSystemLoader(os.path.join(os.path.dirname(__file__), "email_templates"))
+    loader=FileSystemLoader(os.path.join(os.path.dirname(__file__), "email_templates")),
+    autoescape=select_autoescape(["html"]),
+    auto_reload=False
+)
+
+def is_transient_smtp_error(error: BaseException) -> bool:
+    """Connection drops, timeouts and 4xx replies; worth retrying and counted by the breaker"""
+    if isinstance(error, aiosmtplib.SMTPResponseException):
+        return 400 <= error.code < 500
+    return isinstance(error, OSError)
+
+smtp_breaker = register_breaker(
+    "smtp",
+    failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=settings.CIRCUIT_RESET_SECONDS,
+    is_failure=is_transient_smtp_error
 )
 
+class SMTPConnectionPool:
+    """Up to ``size`` persistent, logged-in SMTP connections reused across messages.
+
+    A connection that errors is closed rather than returned to the pool;
+    one the server dropped while idle is replaced on checkout.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._idle: List[aiosmtplib.SMTP] = []
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop = None
+        # socket.getfqdn() in EHLO would block the event loop on every connect
+        self._local_hostname = socket.gethostname()
+
+    def _bind_to_running_loop(self):
+        # Connections belong to one event loop; start over if a new loop uses the pool
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._idle = []
+            self._semaphore = asyncio.Semaphore(self.size)
+
+    def _client(self) -> aiosmtplib.SMTP:
+        return aiosmtplib.SMTP(
+            hostname=settings.SMTP_SERVER,
+            port=settings.SMTP_PORT,
+            username=settings.SMTP_USERNAME or None,
+            password=settings.SMTP_PASSWORD or None,
+            use_tls=settings.SMTP_USE_TLS,
+            start_tls=settings.SMTP_START_TLS,
+            timeout=settings.SMTP_TIMEOUT_SECONDS,
+            local_hostname=self._local_hostname
+        )
+
+    @asynccontextmanager
+    async def connection(self):
+        self._bind_to_running_loop()
+        async with self._semaphore:
+            smtp = None
+            while self._idle and smtp is None:
+                candidate = self._idle.pop()
+                if candidate.is_connected:
+                    smtp = candidate
+            try:
+                if smtp is None:
+                    smtp = self._client()
+                    await smtp.connect()
+                yield smtp
+            except BaseException:
+                if smtp is not None:
+                    smtp.close()
+                raise
+            self._idle.append(smtp)
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for smtp in idle:
+            try:
+                await smtp.quit()
+            except Exception:
+                smtp.close()
+
 class EmailService:
     def __init__(self):
         self.smtp_server = settings.SMTP_SERVER
@@ -19,6 +107,59 @@ class EmailService:
         self.smtp_password = settings.SMTP_PASSWORD
         self.from_email = settings.FROM_EMAIL
         self.from_name = settings.FROM_NAME
+        self.pool = SMTPConnectionPool(settings.SMTP_POOL_SIZE)
+        self._templates: Dict[str, Template] = {}
+
+    def warm_up(self) -> int:
+        """Compile every email template up front, so sending never parses one"""
+        for name in template_env.list_templates(filter_func=lambda name: name.endswith(".html")):
+            self._templates[name] = template_env.get_template(name)
+        return len(self._templates)
+
+    def render(self, template_name: str, **context) -> str:
+        template = self._templates.get(template_name)
+        if template is None:
+            template = self._templates[template_name] = template_env.get_template(template_name)
+        return template.render(app_name="StayHub", **context)
+
+    def build_message(
+        self,
+        to_email: str,
+        subject: str,
+        html_content: str,
+        text_content: Optional[str] = None
+    ) -> MIMEMultipart:
+        message = MIMEMultipart("alternative")
+        message["Subject"] = subject
+        message["From"] = f"{self.from_name} <{self.from_email}>"
+        message["To"] = to_email
+
+        # Add text part if provided
+        if text_content:
+            text_part = MIMEText(text_content, "plain")
+            message.attach(text_part)
+
+        # Add HTML part
+        html_part = MIMEText(html_content, "html")
+        message.attach(html_part)
+        return message
+
+    async def _send_once(self, message: MIMEMultipart):
+        async with self.pool.connection() as smtp:
+            await smtp.send_message(message)
+
+    @traced("smtp.send", SpanKind.CLIENT)
+    async def send_message(self, message: MIMEMultipart):
+        """Send over a pooled connection, retrying transient failures; raises on failure"""
+        await retry_async(
+            smtp_breaker.call_async,
+            self._send_once,
+            message,
+            attempts=settings.SMTP_MAX_ATTEMPTS,
+            base_delay=0.5,
+            max_delay=5.0,
+            retry_if=is_transient_smtp_error
+        )
 
     async def send_email(
         self,
@@ -29,33 +170,11 @@ class EmailService:
     ) -> bool:
         """Send an email using SMTP"""
         try:
-            # Create message
-            message = MIMEMultipart("alternative")
-            message["Subject"] = subject
-            message["From"] = f"{self.from_name} <{self.from_email}>"
-            message["To"] = to_email
-
-            # Add text part if provided
-            if text_content:
-                text_part = MIMEText(text_content, "plain")
-                message.attach(text_part)
-
-            # Add HTML part
-            html_part = MIMEText(html_content, "html")
-            message.attach(html_part)
-
-            # Send email
-            await aiosmtplib.send(
-                message,
-                hostname=self.smtp_server,
-                port=self.smtp_port,
-                username=self.smtp_username,
-                password=self.smtp_password,
-                use_tls=True,
-            )
+            message = self.build_message(to_email, subject, html_content, text_content)
+            await self.send_message(message)
             return True
         except Exception as e:
-            print(f"Failed to send email: {e}")
+            logger.error(f"Failed to send email: {e}")
             return False
 
     async def send_booking_confirmation(
@@ -65,12 +184,10 @@ class EmailService:
         booking_data: dict
     ) -> bool:
         """Send booking confirmation email"""
-        template = template_env.get_template("booking_confirmation.html")
-        
-        html_content = template.render(
+        html_content = self.render(
+            "booking_confirmation.html",
             customer_name=customer_name,
-            booking=booking_data,
-            app_name="StayHub"
+            booking=booking_data
         )
         
         subject = f"Booking Confirmation - {booking_data['listing_title']}"
@@ -85,13 +202,11 @@ class EmailService:
         status: str
     ) -> bool:
         """Send booking status update email"""
-        template = template_env.get_template("booking_status_update.html")
-        
-        html_content = template.render(
+        html_content = self.render(
+            "booking_status_update.html",
             customer_name=customer_name,
             booking=booking_data,
-            status=status,
-            app_name="StayHub"
+            status=status
         )
         
         subject = f"Booking {status.title()} - {booking_data['listing_title']}"
@@ -105,12 +220,10 @@ class EmailService:
         booking_data: dict
     ) -> bool:
         """Send new booking notification to host"""
-        template = template_env.get_template("new_booking_notification.html")
-        
-        html_content = template.render(
+        html_content = self.render(
+            "new_booking_notification.html",
             host_name=host_name,
-            booking=booking_data,
-            app_name="StayHub"
+            booking=booking_data
         )
         
         subject = f"New Booking Request - {booking_data['listing_title']}"
@@ -124,12 +237,10 @@ class EmailService:
         review_data: dict
     ) -> bool:
         """Send review notification to host"""
-        template = template_env.get_template("review_notification.html")
-        
-        html_content = template.render(
+        html_content = self.render(
+            "review_notification.html",
             host_name=host_name,
-            review=review_data,
-            app_name="StayHub"
+            review=review_data
         )
         
         subject = f"New Review - {review_data['listing_title']}"
@@ -1,20 +1,71 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
+from prometheus_client import CONTENT_TYPE_LATEST
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import Session
+import logging
 import os
-from .database import engine, get_db
-from . import models
-from .routers import auth, listings, bookings, reviews, payments
+from .database import engine, get_db, is_statement_timeout
+from . import models, auth as auth_module
+from .routers import auth, listings, bookings, reviews, payments, admin
 from .config import settings
+from .scheduler import scheduler
+from .services.webhook_inbox import webhook_worker
+from .services.email_outbox import email_outbox_worker
+from .email import email_service
+from . import memory, metrics, profiling, query_log, tracing
+from .replicas import READ_PRIMARY_HEADER, ReadYourWritesMiddleware, replica_router
+
+logger = logging.getLogger(__name__)
+
+metrics.instrument_engine(engine, settings.DB_POOL_WAIT_LOG_MS / 1000)
+query_log.instrument_engine(engine)
+tracing_enabled = tracing.configure_tracing()
+if tracing_enabled:
+    tracing.instrument_engine(engine)
+# Replica statements count towards Server-Timing and traces; the db_pool_* metrics stay the primary's
+for replica in replica_router.replicas:
+    query_log.instrument_engine(replica.engine)
+    if tracing_enabled:
+        tracing.instrument_engine(replica.engine)
 
 # Create database tables
 models.Base.metadata.create_all(bind=engine)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Jobs are declared with @scheduler.job next to the routers they belong to
+    if settings.SCHEDULER_ENABLED:
+        await scheduler.start()
+    if settings.WEBHOOK_WORKERS > 0:
+        await webhook_worker.start(settings.WEBHOOK_WORKERS, settings.WEBHOOK_POLL_SECONDS)
+    email_service.warm_up()
+    if settings.MEMORY_TRACE_ON_STARTUP:
+        memory.allocation_tracker.start(settings.MEMORY_TRACE_FRAMES)
+    if settings.MEMORY_STATS_INTERVAL_SECONDS > 0:
+        await memory.memory_monitor.start(settings.MEMORY_STATS_INTERVAL_SECONDS)
+    if settings.EMAIL_OUTBOX_WORKERS > 0:
+        await email_outbox_worker.start(
+            settings.EMAIL_OUTBOX_WORKERS, settings.EMAIL_OUTBOX_POLL_SECONDS, settings.EMAIL_OUTBOX_BATCH_SIZE
+        )
+    yield
+    await memory.memory_monitor.stop()
+    await email_outbox_worker.stop()
+    await webhook_worker.stop()
+    await scheduler.stop()
+    await email_service.pool.close()
+    auth_module.password_hasher.shutdown()
+    tracing.shutdown_tracing()
+    metrics.mark_process_dead()
+
 app = FastAPI(
     title="StayHub API",
     description="A full-featured StayHub backend API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -24,8 +75,38 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Idempotent-Replayed", "Server-Timing", "X-Profile-Id", "X-Trace-Id", READ_PRIMARY_HEADER],
 )
 
+if settings.PROFILING_ENABLED:
+    app.add_middleware(profiling.ProfilingMiddleware)
+app.add_middleware(memory.MemorySamplingMiddleware)
+if replica_router.replicas:
+    app.add_middleware(ReadYourWritesMiddleware)
+app.add_middleware(query_log.QueryTimingMiddleware)
+# Metrics and tracing go outermost, so their timings include every other middleware
+app.add_middleware(metrics.PrometheusMiddleware)
+if tracing_enabled:
+    app.add_middleware(tracing.TracingMiddleware)
+
+@app.exception_handler(PoolTimeoutError)
+async def database_pool_exhausted(request: Request, exc: PoolTimeoutError):
+    # No connection came free within DB_POOL_TIMEOUT_SECONDS; shed the request instead of queueing longer
+    logger.error(f"Database pool exhausted on {request.method} {request.url.path}: {exc}")
+    return JSONResponse(
+        status_code=503, content={"detail": "The service is busy, please retry shortly"}, headers={"Retry-After": "1"}
+    )
+
+@app.exception_handler(OperationalError)
+async def database_statement_timeout(request: Request, exc: OperationalError):
+    if not is_statement_timeout(exc):
+        raise exc
+    logger.warning(f"Statement timeout on {request.method} {request.url.path}")
+    return JSONResponse(
+        status_code=503, content={"detail": "The request took too long, please narrow it or retry later"},
+        headers={"Retry-After": "5"}
+    )
+
 # Create uploads directory if it doesn't exist
 if not os.path.exists(settings.UPLOAD_DIR):
     os.makedirs(settings.UPLOAD_DIR)
@@ -39,6 +120,7 @@ app.include_router(listings.router)
 app.include_router(bookings.router)
 app.include_router(reviews.router)
 app.include_router(payments.router)
+app.include_router(admin.router)
 
 @app.get("/")
 def read_root():
@@ -46,4 +128,8 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy"} 
\ No newline at end of file
+    return {"status": "healthy"}
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return Response(metrics.render_metrics(), media_type=CONTENT_TYPE_LATEST)
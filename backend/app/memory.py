@@ -0,0 +1,234 @@
+"""Memory diagnostics for worker processes.
+
+Everything here is per worker: tracemalloc state, snapshots and request
+samples live in the process that served the admin call, and responses
+carry its pid. RSS and GC statistics are also exported as Prometheus
+gauges, refreshed by ``MemoryMonitor`` in every worker.
+
+Allocation tracing is off until started (MEMORY_TRACE_ON_STARTUP or
+``POST /admin/memory/tracing``); tracemalloc slows allocation-heavy code
+noticeably while it runs.
+"""
+import asyncio
+import gc
+import logging
+import os
+import random
+import resource
+import sys
+import threading
+import tracemalloc
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Tuple
+
+from prometheus_client import Gauge, Histogram
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Per-worker series; dead workers drop out when they mark themselves dead
+PROCESS_RSS = Gauge("worker_resident_memory_bytes", "Resident set size of the worker", multiprocess_mode="liveall")
+GC_COLLECTIONS = Gauge("worker_gc_collections", "Garbage collections run", ["generation"], multiprocess_mode="liveall")
+GC_UNCOLLECTABLE = Gauge("worker_gc_uncollectable", "Uncollectable objects found", ["generation"], multiprocess_mode="liveall")
+REQUEST_PEAK_ALLOCATION = Histogram(
+    "http_request_peak_allocation_bytes", "Peak traced allocation while handling sampled requests",
+    ["route"],
+    buckets=(64e3, 256e3, 1e6, 4e6, 16e6, 64e6, 256e6)
+)
+
+# Allocations made by the diagnostics themselves are left out of snapshots
+_SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+def rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def memory_stats() -> dict:
+    traced, traced_peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (None, None)
+    return {
+        "pid": os.getpid(),
+        "rss_bytes": rss_bytes(),
+        "peak_rss_bytes": peak_rss_bytes(),
+        "gc_counts": list(gc.get_count()),
+        "gc_generations": gc.get_stats(),
+        "gc_garbage": len(gc.garbage),
+        "tracing": tracemalloc.is_tracing(),
+        "traced_frames": tracemalloc.get_traceback_limit() if tracemalloc.is_tracing() else None,
+        "traced_bytes": traced,
+        "traced_peak_bytes": traced_peak
+    }
+
+def export_memory_gauges():
+    rss = rss_bytes()
+    if rss is not None:
+        PROCESS_RSS.set(rss)
+    for generation, stats in enumerate(gc.get_stats()):
+        GC_COLLECTIONS.labels(str(generation)).set(stats["collections"])
+        GC_UNCOLLECTABLE.labels(str(generation)).set(stats["uncollectable"])
+
+class AllocationTracker:
+    """tracemalloc snapshots of this worker, each compared with the one before"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._previous: Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int):
+        if tracemalloc.is_tracing() and tracemalloc.get_traceback_limit() != frames:
+            tracemalloc.stop()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            logger.info(f"Allocation tracing started in worker {os.getpid()} with {frames} frames")
+
+    def stop(self):
+        with self._lock:
+            self._previous = None
+        tracemalloc.stop()
+
+    def snapshot(self, limit: int, group_by: str) -> dict:
+        """Top allocation sites now, and the biggest changes since the last snapshot"""
+        snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        with self._lock:
+            previous, self._previous = self._previous, snapshot
+        top = [self._site(stat) for stat in snapshot.statistics(group_by)[:limit]]
+        diff = None
+        if previous is not None:
+            diff = [self._site(stat, diff=True) for stat in snapshot.compare_to(previous, group_by)[:limit]]
+        return {
+            "pid": os.getpid(),
+            "taken_at": datetime.utcnow(),
+            "traced_bytes": sum(trace.size for trace in snapshot.traces),
+            "top": top,
+            "diff": diff
+        }
+
+    @staticmethod
+    def _site(stat, diff: bool = False) -> dict:
+        site = {
+            "location": " <- ".join(f"{frame.filename}:{frame.lineno}" for frame in stat.traceback),
+            "size_bytes": stat.size,
+            "count": stat.count
+        }
+        if diff:
+            site["size_diff_bytes"] = stat.size_diff
+            site["count_diff"] = stat.count_diff
+        return site
+
+class RequestAllocationSampler:
+    """Peak and retained allocation of sampled requests, kept for the last N samples.
+
+    One request is measured at a time, from a reset tracemalloc peak, so
+    anything running concurrently in the worker is counted too; treat the
+    numbers as upper bounds and compare routes over many samples.
+    """
+
+    def __init__(self, max_samples: int = 500):
+        self.samples: Deque[Tuple[str, int, int]] = deque(maxlen=max_samples)
+        self._busy = threading.Lock()
+
+    def should_sample(self) -> bool:
+        return (
+            settings.MEMORY_REQUEST_SAMPLE_RATE > 0
+            and tracemalloc.is_tracing()
+            and random.random() < settings.MEMORY_REQUEST_SAMPLE_RATE
+        )
+
+    def begin(self) -> Optional[int]:
+        if not self._busy.acquire(blocking=False):
+            return None
+        tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+
+    def end(self, route: str, started_at: int):
+        try:
+            if not tracemalloc.is_tracing():
+                return
+            current, peak = tracemalloc.get_traced_memory()
+            peak_bytes = max(peak - started_at, 0)
+            self.samples.append((route, peak_bytes, current - started_at))
+            REQUEST_PEAK_ALLOCATION.labels(route).observe(peak_bytes)
+        finally:
+            self._busy.release()
+
+    def by_route(self) -> List[dict]:
+        routes: Dict[str, List[Tuple[int, int]]] = {}
+        for route, peak, retained in list(self.samples):
+            routes.setdefault(route, []).append((peak, retained))
+        summary = [
+            {
+                "route": route,
+                "samples": len(values),
+                "max_peak_bytes": max(peak for peak, _ in values),
+                "avg_peak_bytes": sum(peak for peak, _ in values) / len(values),
+                "avg_retained_bytes": sum(retained for _, retained in values) / len(values)
+            }
+            for route, values in routes.items()
+        ]
+        return sorted(summary, key=lambda item: item["max_peak_bytes"], reverse=True)
+
+class MemorySamplingMiddleware:
+    """Measure allocation for a sample of requests while tracing is on"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not request_sampler.should_sample():
+            await self.app(scope, receive, send)
+            return
+        started_at = request_sampler.begin()
+        if started_at is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "<unmatched>"
+            request_sampler.end(route, started_at)
+
+class MemoryMonitor:
+    """Refreshes this worker's RSS and GC gauges on an interval"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, interval_seconds: float):
+        self._task = asyncio.create_task(self._loop(interval_seconds))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self, interval_seconds: float):
+        while True:
+            try:
+                export_memory_gauges()
+            except Exception as e:
+                logger.error(f"Memory gauge update failed: {str(e)}")
+            await asyncio.sleep(interval_seconds)
+
+allocation_tracker = AllocationTracker()
+request_sampler = RequestAllocationSampler()
+memory_monitor = MemoryMonitor()
@@ -0,0 +1,186 @@
+"""Prometheus metrics for the API, the database pool and external dependencies.
+
+With ``PROMETHEUS_MULTIPROC_DIR`` set (start.sh does this) every worker
+writes its samples to files in that directory and ``/metrics`` merges
+them, so a scrape hitting any one of the uvicorn workers sees the totals
+for all of them. The variable must be set before this module is imported.
+"""
+import logging
+import os
+import time
+from typing import Optional
+
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+# Requests
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route template and status",
+    ["method", "route", "status"]
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Time from receiving a request to the end of its response body",
+    ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "Requests currently being handled",
+    ["method"], multiprocess_mode="livesum"
+)
+
+# Database pool; gauges are per process and summed over live workers
+DB_POOL_SIZE = Gauge("db_pool_size", "Configured pool size", multiprocess_mode="livesum")
+DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Connections checked out of the pool", multiprocess_mode="livesum")
+DB_POOL_OVERFLOW = Gauge("db_pool_overflow", "Connections open beyond the pool size", multiprocess_mode="livesum")
+DB_POOL_WAIT = Histogram(
+    "db_pool_wait_seconds", "Time spent waiting to check a connection out of the pool",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+)
+DB_POOL_TIMEOUTS = Counter("db_pool_timeouts_total", "Checkouts that gave up after the pool timeout")
+
+# Read replicas (see app/replicas.py)
+DB_REPLICA_LAG = Gauge(
+    "db_replica_lag_seconds", "Replay lag at the last check, per replica", ["replica"], multiprocess_mode="livemax"
+)
+DB_READ_SESSIONS = Counter(
+    "db_read_sessions_total", "Read-only sessions by where they were routed", ["target"]
+)
+
+# External dependencies, recorded by the circuit breakers wrapping every call
+DEPENDENCY_DURATION = Histogram(
+    "dependency_request_duration_seconds", "Latency of calls to external dependencies",
+    ["dependency", "outcome"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+DEPENDENCY_REJECTED = Counter(
+    "dependency_circuit_rejections_total", "Calls failed fast because the circuit was open",
+    ["dependency"]
+)
+
+# Image uploads
+IMAGE_PROCESSING_SECONDS = Counter("image_processing_seconds_total", "Time spent decoding, resizing and re-encoding images")
+IMAGE_PROCESSING_BYTES = Counter("image_processing_bytes_total", "Image bytes processed", ["direction"])
+IMAGES_PROCESSED = Counter("images_processed_total", "Images processed, by outcome", ["outcome"])
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+class PrometheusMiddleware:
+    """Count and time requests, labelled by route template rather than raw path.
+
+    FastAPI stores the matched route in the scope while routing, so it is
+    read after the app returns; ``/listings/{listing_id}`` stays one series
+    however many listings are requested. Requests that match no route
+    (404s, static files) share one label.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_PROGRESS.labels(method).inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_REQUESTS_IN_PROGRESS.labels(method).dec()
+            route = scope.get("route")
+            template = getattr(route, "path", None) or UNMATCHED_ROUTE
+            HTTP_REQUESTS.labels(method, template, str(status_code)).inc()
+            HTTP_REQUEST_DURATION.labels(method, template).observe(elapsed)
+
+def _on_checkout(pool):
+    DB_POOL_CHECKED_OUT.set(pool.checkedout())
+    DB_POOL_OVERFLOW.set(max(pool.overflow(), 0))
+
+def _on_checkin(pool):
+    # Fired before the connection is handed back, so count it as returned;
+    # it is closed rather than queued when the pool is already full
+    overflow = pool.overflow() - (1 if pool.checkedin() >= pool.size() else 0)
+    DB_POOL_CHECKED_OUT.set(max(pool.checkedout() - 1, 0))
+    DB_POOL_OVERFLOW.set(max(overflow, 0))
+
+def _time_pool_connect(pool, slow_seconds: Optional[float]):
+    connect = pool.connect
+
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return connect()
+        except PoolTimeoutError:
+            DB_POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            DB_POOL_WAIT.observe(elapsed)
+            if slow_seconds and elapsed >= slow_seconds:
+                logger.warning(f"Waited {elapsed * 1000:.0f}ms for a database connection ({pool.status()})")
+
+    pool.connect = timed_connect
+
+def instrument_engine(engine: Engine, slow_checkout_seconds: Optional[float] = None):
+    """Export checkout wait time and pool occupancy for ``engine``.
+
+    Only queue pools report occupancy; for others (SQLite's static pool in
+    tests, the null pool behind PgBouncer) just the wait time is recorded.
+    Checkouts slower than ``slow_checkout_seconds`` are also logged.
+    """
+    def instrument_pool(pool):
+        _time_pool_connect(pool, slow_checkout_seconds)
+        if hasattr(pool, "checkedout"):
+            DB_POOL_SIZE.set(pool.size())
+            event.listen(pool, "checkout", lambda *args: _on_checkout(pool))
+            event.listen(pool, "checkin", lambda *args: _on_checkin(pool))
+
+    instrument_pool(engine.pool)
+    # dispose() swaps in a fresh pool, which needs its own hooks
+    event.listen(engine, "engine_disposed", lambda engine: instrument_pool(engine.pool))
+
+def observe_image_processing(elapsed: float, bytes_in: int, bytes_out: Optional[int]):
+    IMAGE_PROCESSING_SECONDS.inc(elapsed)
+    IMAGE_PROCESSING_BYTES.labels("in").inc(bytes_in)
+    if bytes_out is None:
+        IMAGES_PROCESSED.labels("failed").inc()
+    else:
+        IMAGE_PROCESSING_BYTES.labels("out").inc(bytes_out)
+        IMAGES_PROCESSED.labels("ok").inc()
+
+def render_metrics() -> bytes:
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+def mark_process_dead():
+    """Drop this worker's live gauges from the shared directory on shutdown"""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Boolean, Text, ForeignKey, JSON, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -14,6 +14,8 @@ class User(Base):
     last_name = Column(String, nullable=False)
     phone = Column(String)
     is_host = Column(Boolean, default=False)
+    is_admin = Column(Boolean, default=False)
+    notification_digest = Column(String, nullable=False, default="immediate", server_default="immediate")  # immediate, hourly, daily
     profile_image = Column(String)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -23,6 +25,7 @@ class User(Base):
     bookings = relationship("Booking", back_populates="customer")
     reviews_given = relationship("Review", foreign_keys="Review.reviewer_id", back_populates="reviewer")
     reviews_received = relationship("Review", foreign_keys="Review.host_id", back_populates="host")
+    refresh_tokens = relationship("RefreshToken", back_populates="user", cascade="all, delete-orphan")
 
 class Listing(Base):
     __tablename__ = "listings"
@@ -31,7 +34,7 @@ class Listing(Base):
     title = Column(String, nullable=False)
     description = Column(Text)
     price_per_night = Column(Float, nullable=False)
-    location = Column(String, nullable=False)
+    location = Column(String, nullable=False)  # PostgreSQL also has a trigram index (migration 007)
     address = Column(String)
     latitude = Column(Float)
     longitude = Column(Float)
@@ -40,8 +43,9 @@ class Listing(Base):
     bathrooms = Column(Integer, default=1)
     amenities = Column(JSON)  # List of amenities
     images = Column(JSON)  # List of image URLs
-    is_active = Column(Boolean, default=True)
-    host_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    is_active = Column(Boolean, default=True, index=True)
+    pricing_version = Column(Integer, nullable=False, default=1)  # bumped whenever rates change
+    host_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -49,23 +53,49 @@ class Listing(Base):
     host = relationship("User", back_populates="listings")
     bookings = relationship("Booking", back_populates="listing")
     reviews = relationship("Review", back_populates="listing")
+    rate_rules = relationship("ListingRateRule", back_populates="listing", cascade="all, delete-orphan")
+
+class ListingRateRule(Base):
+    __tablename__ = "listing_rate_rules"
+
+    id = Column(Integer, primary_key=True, index=True)
+    listing_id = Column(Integer, ForeignKey("listings.id", ondelete="CASCADE"), nullable=False, index=True)
+    rule_type = Column(String, nullable=False)  # weekday, date_range, length_of_stay
+    weekdays = Column(JSON)  # 0=Monday ... 6=Sunday, for weekday rules
+    start_date = Column(Date)  # date_range rules, inclusive
+    end_date = Column(Date)  # date_range rules, inclusive
+    price = Column(Float)  # nightly price for weekday and date_range rules
+    min_nights = Column(Integer)  # length_of_stay rules
+    discount_percent = Column(Float)  # length_of_stay rules
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Relationships
+    listing = relationship("Listing", back_populates="rate_rules")
 
 class Booking(Base):
     __tablename__ = "bookings"
+    __table_args__ = (
+        # Guest and host booking lists, keyset-paginated on check_in_date
+        Index("ix_bookings_customer_id_check_in_date", "customer_id", "check_in_date"),
+        Index("ix_bookings_listing_id_status_check_in_date", "listing_id", "status", "check_in_date"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     listing_id = Column(Integer, ForeignKey("listings.id"), nullable=False)
     customer_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     check_in_date = Column(DateTime, nullable=False)
     check_out_date = Column(DateTime, nullable=False)
+    # PostgreSQL also has a generated stay_range tsrange column with the
+    # bookings_no_overlap exclusion constraint (migration 004); it is not
+    # mapped here so the model still works on SQLite
     total_price = Column(Float, nullable=False)
     guest_count = Column(Integer, default=1)
-    status = Column(String, default="pending")  # pending, confirmed, cancelled, completed, paid
+    status = Column(String, default="pending", index=True)  # pending, confirmed, cancelled, completed, paid, expired
     special_requests = Column(Text)
     
     # Payment related fields
     stripe_payment_intent_id = Column(String, unique=True)
-    payment_status = Column(String, default="unpaid")  # unpaid, processing, paid, failed, refunded
+    payment_status = Column(String, default="unpaid")  # unpaid, processing, paid, failed, refund_pending, refunded
     payment_method = Column(String)  # card, etc.
     refund_amount = Column(Float, default=0.0)
     
@@ -80,9 +110,9 @@ class Review(Base):
     __tablename__ = "reviews"
 
     id = Column(Integer, primary_key=True, index=True)
-    listing_id = Column(Integer, ForeignKey("listings.id"), nullable=False)
-    reviewer_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    host_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    listing_id = Column(Integer, ForeignKey("listings.id"), nullable=False, index=True)
+    reviewer_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    host_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     rating = Column(Integer, nullable=False)  # 1-5 stars
     comment = Column(Text)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -90,4 +120,121 @@ class Review(Base):
     # Relationships
     listing = relationship("Listing", back_populates="reviews")
     reviewer = relationship("User", foreign_keys=[reviewer_id], back_populates="reviews_given")
-    host = relationship("User", foreign_keys=[host_id], back_populates="reviews_received") 
\ No newline at end of file
+    host = relationship("User", foreign_keys=[host_id], back_populates="reviews_received") 
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    token_hash = Column(String(64), unique=True, index=True, nullable=False)  # sha256 of the opaque token
+    family_id = Column(String(32), index=True, nullable=False)  # shared by every rotation of one login
+    expires_at = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime)
+    replaced_by_id = Column(Integer, ForeignKey("refresh_tokens.id"))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Relationships
+    user = relationship("User", back_populates="refresh_tokens")
+
+class JobRun(Base):
+    __tablename__ = "job_runs"
+    __table_args__ = (
+        Index("ix_job_runs_job_name_started_at", "job_name", "started_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_name = Column(String, nullable=False)
+    status = Column(String, nullable=False)  # running, succeeded, failed
+    worker = Column(String)  # hostname:pid that ran the job
+    started_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime)
+    duration_ms = Column(Float)
+    result = Column(JSON)
+    error = Column(Text)
+
+class WebhookEvent(Base):
+    __tablename__ = "webhook_events"
+    __table_args__ = (
+        # Workers claim the oldest due pending event per payment intent
+        Index("ix_webhook_events_status_available_at", "status", "available_at"),
+        Index("ix_webhook_events_payment_intent_id_created", "payment_intent_id", "stripe_created"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    event_id = Column(String, unique=True, nullable=False)  # Stripe event id, dedupes retried deliveries
+    event_type = Column(String, nullable=False)
+    payment_intent_id = Column(String)
+    stripe_created = Column(Integer, nullable=False)  # event creation time (unix seconds) from Stripe
+    payload = Column(JSON, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending, processed, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text)
+    available_at = Column(DateTime, nullable=False)  # not retried before this time
+    received_at = Column(DateTime, nullable=False)
+    processed_at = Column(DateTime)
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        UniqueConstraint("user_id", "scope", "key", name="uq_idempotency_keys_user_id_scope_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    scope = Column(String, nullable=False)  # endpoint the key was used for, e.g. create_booking
+    key = Column(String(255), nullable=False)  # client-supplied Idempotency-Key header
+    request_hash = Column(String(64), nullable=False)  # sha256 of the canonical request body
+    status = Column(String, nullable=False)  # in_progress, completed
+    response_status = Column(Integer)
+    response_body = Column(JSON)
+    created_at = Column(DateTime, nullable=False, index=True)
+    completed_at = Column(DateTime)
+
+class BookingCancellation(Base):
+    __tablename__ = "booking_cancellations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    batch_id = Column(String(32), nullable=False, index=True)  # shared by every booking in one bulk request
+    booking_id = Column(Integer, ForeignKey("bookings.id", ondelete="CASCADE"), nullable=False, index=True)
+    cancelled_by_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    reason = Column(Text)
+    outcome = Column(String, nullable=False)  # cancelled, refunded, refund_failed, payment_in_progress
+    refund_id = Column(String)
+    refund_amount = Column(Float)
+    error = Column(Text)
+    created_at = Column(DateTime, nullable=False)
+
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        # The sender claims due messages; per-recipient throttling counts recent sends
+        Index("ix_email_outbox_status_available_at", "status", "available_at"),
+        Index("ix_email_outbox_to_email_sent_at", "to_email", "sent_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    to_email = Column(String, nullable=False)
+    template = Column(String, nullable=False)  # file in app/email_templates, rendered at send time
+    subject = Column(String, nullable=False)
+    context = Column(JSON, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending, sending, sent, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text)
+    available_at = Column(DateTime, nullable=False)  # not sent before this time; lease expiry while sending
+    created_at = Column(DateTime, nullable=False)
+    sent_at = Column(DateTime)
+
+class HostNotification(Base):
+    __tablename__ = "host_notifications"
+    __table_args__ = (
+        # Digest runs read every undigested event, grouped by host
+        Index("ix_host_notifications_digested_at_host_id", "digested_at", "host_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    host_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    kind = Column(String, nullable=False)  # booking, review
+    payload = Column(JSON, nullable=False)  # the booking or review context the immediate email would use
+    created_at = Column(DateTime, nullable=False)
+    digested_at = Column(DateTime)
@@ -0,0 +1,219 @@
+"""On-demand request profiling.
+
+With PROFILING_ENABLED the ``ProfilingMiddleware`` profiles requests that
+carry a valid ``X-Profile-Token`` (issued by ``POST /admin/profiles/token``)
+or fall in the PROFILE_SAMPLE_RATE sample. With it off the middleware is
+not installed at all.
+
+cProfile and similar tracers only see the thread that enables them, but
+sync endpoints run in the threadpool. ``StackSampler`` instead samples
+every thread's stack from a background thread and keeps the samples
+taken inside the matched endpoint, wherever it runs. Concurrent calls to
+the same endpoint are sampled too, so profile a quiet worker when the
+numbers need to be exact.
+
+Captures are written as JSON to PROFILE_DIR, shared by the workers, and
+only the newest PROFILE_MAX_CAPTURES are kept. ``folded_stacks`` turns one
+into the input format of flamegraph.pl and speedscope.
+"""
+import inspect
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from jose import JWTError, jwt
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_TOKEN_HEADER = "X-Profile-Token"
+PROFILE_ID_HEADER = "X-Profile-Id"
+TOKEN_SCOPE = "profile"
+CAPTURE_ID = re.compile(r"^\d+_\d+$")
+# Distinct stacks kept per capture; the rest are folded into one bucket
+MAX_STACKS = 5000
+
+def create_profile_token(admin_id: int) -> Tuple[str, datetime]:
+    """Short-lived token that gets a request profiled; no ``sub``, so it cannot authenticate"""
+    expires_at = datetime.utcnow() + timedelta(minutes=settings.PROFILE_TOKEN_MINUTES)
+    token = jwt.encode(
+        {"scope": TOKEN_SCOPE, "admin_id": admin_id, "exp": expires_at},
+        settings.SECRET_KEY, algorithm=settings.ALGORITHM
+    )
+    return token, expires_at
+
+def verify_profile_token(token: str) -> bool:
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return False
+    return payload.get("scope") == TOKEN_SCOPE
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class StackSampler:
+    """Background thread sampling the stacks that run a request's endpoint"""
+
+    def __init__(self, scope: Scope, interval_seconds: float):
+        self.scope = scope
+        self.interval_seconds = interval_seconds
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _endpoint_code(self):
+        # The router puts the endpoint in the scope once it matches
+        endpoint = self.scope.get("endpoint")
+        return getattr(inspect.unwrap(endpoint), "__code__", None) if endpoint else None
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            code = self._endpoint_code()
+            if code is not None:
+                self._sample(code)
+
+    def _sample(self, code):
+        own_id = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame.f_code))
+                if frame.f_code is code:
+                    break
+                frame = frame.f_back
+            if frame is None:
+                continue
+            stack = ";".join(reversed(labels))
+            if stack not in self.stacks and len(self.stacks) >= MAX_STACKS:
+                stack = "(truncated)"
+            self.stacks[stack] += 1
+            self.samples += 1
+
+def _capture_path(capture_id: str) -> str:
+    return os.path.join(settings.PROFILE_DIR, f"{capture_id}.json")
+
+def save_capture(capture: dict):
+    """Write a capture and drop the oldest beyond PROFILE_MAX_CAPTURES"""
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    path = _capture_path(capture["id"])
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(capture, f)
+    os.replace(f"{path}.tmp", path)
+
+    capture_ids = _capture_ids()
+    for stale in capture_ids[settings.PROFILE_MAX_CAPTURES:]:
+        try:
+            os.remove(_capture_path(stale))
+        except FileNotFoundError:
+            pass  # pruned by another worker
+
+def _capture_ids() -> List[str]:
+    """Newest first; ids start with the capture time in nanoseconds"""
+    if not os.path.isdir(settings.PROFILE_DIR):
+        return []
+    ids = [name[:-5] for name in os.listdir(settings.PROFILE_DIR) if name.endswith(".json")]
+    return sorted((i for i in ids if CAPTURE_ID.match(i)), key=lambda i: int(i.split("_")[0]), reverse=True)
+
+def load_capture(capture_id: str) -> Optional[dict]:
+    if not CAPTURE_ID.match(capture_id):
+        return None
+    try:
+        with open(_capture_path(capture_id)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def list_captures() -> List[dict]:
+    captures = []
+    for capture_id in _capture_ids():
+        capture = load_capture(capture_id)
+        if capture is not None:
+            capture.pop("stacks")
+            captures.append(capture)
+    return captures
+
+def folded_stacks(capture: dict) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in capture["stacks"].items())
+
+class ProfilingMiddleware:
+    """Sample requests chosen by token or sampling rate, one at a time per worker"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._busy = threading.Lock()
+
+    def _trigger(self, scope: Scope) -> Optional[str]:
+        token = Headers(scope=scope).get(PROFILE_TOKEN_HEADER)
+        if token is not None:
+            return "token" if verify_profile_token(token) else None
+        if settings.PROFILE_SAMPLE_RATE > 0 and random.random() < settings.PROFILE_SAMPLE_RATE:
+            return "sampled"
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        trigger = self._trigger(scope) if scope["type"] == "http" else None
+        if trigger is None or not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        capture_id = f"{time.time_ns()}_{os.getpid()}"
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                MutableHeaders(scope=message).append(PROFILE_ID_HEADER, capture_id)
+            await send(message)
+
+        sampler = StackSampler(scope, settings.PROFILE_INTERVAL_MS / 1000).start()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            stacks = sampler.stop()
+            self._busy.release()
+            route = getattr(scope.get("route"), "path", None)
+            capture = {
+                "id": capture_id,
+                "created_at": datetime.utcnow().isoformat(),
+                "trigger": trigger,
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": route,
+                "status": status_code,
+                "duration_ms": round(elapsed * 1000, 2),
+                "interval_ms": settings.PROFILE_INTERVAL_MS,
+                "samples": sampler.samples,
+                "stacks": dict(stacks)
+            }
+            try:
+                await run_in_threadpool(save_capture, capture)
+            except OSError as e:
+                logger.error(f"Could not save profile {capture_id}: {str(e)}")
@@ -0,0 +1,133 @@
+"""Per-request SQL timing: slow-query log, query budget and Server-Timing.
+
+``instrument_engine`` times every statement with cursor execute events.
+``QueryTimingMiddleware`` gives each request a ``RequestQueries`` in a
+contextvar; sync endpoints run in the threadpool with a copy of the
+context, so their statements land on the same object. The totals go out
+in a ``Server-Timing`` header and requests over the query budget are
+logged with their route.
+"""
+import logging
+import re
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = r"(?:\?|%\(\w+\)s|%s|:\w+)"
+# Expanding IN lists render one placeholder per value
+_PLACEHOLDER_LIST = re.compile(rf"\(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+MAX_LOGGED_SQL = 2000
+
+class RequestQueries:
+    """Statements run while handling one request"""
+
+    def __init__(self, scope: Optional[Scope] = None):
+        self.scope = scope
+        self.count = 0
+        self.seconds = 0.0
+
+    @property
+    def route(self) -> str:
+        if self.scope is None:
+            return "<background>"
+        # Set by the router once it matches, which is before any query runs
+        route = self.scope.get("route")
+        return getattr(route, "path", None) or self.scope.get("path", "<unmatched>")
+
+    def record(self, elapsed: float):
+        self.count += 1
+        self.seconds += elapsed
+
+_current_queries: ContextVar[Optional[RequestQueries]] = ContextVar("current_queries", default=None)
+
+def current_queries() -> Optional[RequestQueries]:
+    return _current_queries.get()
+
+def normalize_sql(statement: str) -> str:
+    """Strip literals and collapse IN lists so one query shape logs as one line"""
+    sql = _STRING_LITERAL.sub("?", statement)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _PLACEHOLDER_LIST.sub("(...)", sql)
+    sql = _WHITESPACE.sub(" ", sql).strip()
+    if len(sql) > MAX_LOGGED_SQL:
+        sql = sql[:MAX_LOGGED_SQL] + "..."
+    return sql
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    elapsed = time.perf_counter() - started
+    queries = _current_queries.get()
+    if queries is not None:
+        queries.record(elapsed)
+    threshold = settings.SLOW_QUERY_THRESHOLD_MS
+    if threshold > 0 and elapsed * 1000 >= threshold:
+        route = queries.route if queries is not None else "<background>"
+        logger.warning(f"Slow query ({elapsed * 1000:.1f} ms) from {route}: {normalize_sql(statement)}")
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+def instrument_engine(engine: Engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+class QueryTimingMiddleware:
+    """Track SQL per request and report it in ``Server-Timing``.
+
+    The header carries ``db`` (time in SQL, with the statement count) and
+    ``app`` (time until the response started). Statements issued after
+    the response started, e.g. while streaming, are not in the header
+    but still count against the budget.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        queries = RequestQueries(scope)
+        started = time.perf_counter()
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start" and settings.SERVER_TIMING_ENABLED:
+                headers = MutableHeaders(scope=message)
+                app_ms = (time.perf_counter() - started) * 1000
+                headers.append(
+                    "Server-Timing",
+                    f'db;dur={queries.seconds * 1000:.1f};desc="{queries.count} queries", app;dur={app_ms:.1f}'
+                )
+            await send(message)
+
+        token = _current_queries.set(queries)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_queries.reset(token)
+            budget = settings.SQL_QUERY_BUDGET
+            if budget > 0 and queries.count > budget:
+                logger.warning(
+                    f"{scope['method']} {queries.route} ran {queries.count} queries "
+                    f"({queries.seconds * 1000:.1f} ms), over the budget of {budget}"
+                )
@@ -0,0 +1,175 @@
+"""Read-replica routing for read-only endpoints.
+
+``get_read_db`` gives read endpoints a session on a streaming replica
+instead of the primary. Replicas report their replay lag; one lagging
+by more than ``DB_REPLICA_MAX_LAG_SECONDS``, or failing the check, is
+skipped until a later check finds it caught up. With no usable replica
+reads go to the primary.
+
+A client that just wrote reads from the primary for
+``DB_READ_YOUR_WRITES_SECONDS``: ``ReadYourWritesMiddleware`` marks every
+successful write's response with a short-lived cookie and an
+``X-Read-Primary-Until`` header, and a request carrying either (clients
+without cookies echo the header) is routed to the primary.
+"""
+import logging
+import random
+import threading
+import time
+from typing import List, Optional
+
+from fastapi import Request
+from sqlalchemy import text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import Session, sessionmaker
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import settings
+from .database import SessionLocal, make_engine
+from .metrics import DB_READ_SESSIONS, DB_REPLICA_LAG
+
+logger = logging.getLogger(__name__)
+
+READ_PRIMARY_COOKIE = "stayhub_read_primary_until"
+READ_PRIMARY_HEADER = "X-Read-Primary-Until"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+# Fail the lag check of an unreachable replica quickly instead of hanging a request
+REPLICA_CONNECT_TIMEOUT_SECONDS = 2
+
+# Seconds since the last replayed transaction; 0 when the replica has replayed all it received.
+# NULL when the WAL receiver is not streaming: a disconnected replica has replayed all it
+# received too, however far behind the primary it is. The status column is only visible to
+# roles with pg_read_all_stats, so the replica user needs that role.
+REPLICA_LAG_SQL = text("""
+    SELECT CASE WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN NULL
+                WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0) END
+""")
+
+class Replica:
+    """One replica's engine, sessions and last measured lag"""
+
+    def __init__(self, name: str, engine: Engine):
+        self.name = name
+        self.engine = engine
+        self.session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        self.lag: Optional[float] = None  # None until checked, or after a failed check
+        self.checked_at = float("-inf")
+        self._checking = threading.Lock()
+
+    def measure_lag(self) -> float:
+        if self.engine.dialect.name != "postgresql":
+            return 0.0
+        with self.engine.connect() as conn:
+            lag = conn.execute(REPLICA_LAG_SQL).scalar()
+        if lag is None:
+            raise RuntimeError("WAL receiver is not streaming")
+        return float(lag)
+
+class ReplicaRouter:
+    """Picks a replica within the lag limit for each read session, else the primary.
+
+    Lag is re-measured lazily, at most every ``check_interval`` seconds per
+    replica and worker; while one request measures, others use the last
+    value rather than wait.
+    """
+
+    def __init__(self, replicas: List[Replica], max_lag: float, check_interval: float):
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+
+    def _refresh(self, replica: Replica):
+        if time.monotonic() - replica.checked_at < self.check_interval:
+            return
+        if not replica._checking.acquire(blocking=False):
+            return
+        try:
+            was_usable = self._usable(replica)
+            try:
+                replica.lag = replica.measure_lag()
+                DB_REPLICA_LAG.labels(replica.name).set(replica.lag)
+            except Exception as e:
+                replica.lag = None
+                logger.warning(f"Replica {replica.name} lag check failed: {str(e)}")
+            first_check = replica.checked_at == float("-inf")
+            replica.checked_at = time.monotonic()
+            if replica.lag is not None and was_usable != self._usable(replica) and not first_check:
+                state = "back in rotation" if self._usable(replica) else "out of rotation"
+                logger.warning(f"Replica {replica.name} {state}, lag {replica.lag:.1f}s")
+        finally:
+            replica._checking.release()
+
+    def _usable(self, replica: Replica) -> bool:
+        return replica.lag is not None and replica.lag <= self.max_lag
+
+    def choose(self) -> Optional[Replica]:
+        """A replica to read from, or None for the primary"""
+        for replica in self.replicas:
+            self._refresh(replica)
+        usable = [replica for replica in self.replicas if self._usable(replica)]
+        return random.choice(usable) if usable else None
+
+def _replica_name(url: str, index: int) -> str:
+    parsed = make_url(url)
+    return f"{parsed.host}:{parsed.port or 5432}" if parsed.host else f"replica{index}"
+
+def create_replica(url: str, index: int) -> Replica:
+    connect_args = {"connect_timeout": REPLICA_CONNECT_TIMEOUT_SECONDS} if url.startswith("postgresql") else None
+    return Replica(_replica_name(url, index), make_engine(url, connect_args))
+
+replica_router = ReplicaRouter(
+    [create_replica(url.strip(), i) for i, url in enumerate(settings.DATABASE_REPLICA_URLS.split(",")) if url.strip()],
+    max_lag=settings.DB_REPLICA_MAX_LAG_SECONDS,
+    check_interval=settings.DB_REPLICA_LAG_CHECK_SECONDS
+)
+
+def read_primary_until(request: Request) -> Optional[float]:
+    """The client's read-your-writes deadline, if it carries a current one"""
+    value = request.headers.get(READ_PRIMARY_HEADER) or request.cookies.get(READ_PRIMARY_COOKIE)
+    try:
+        until = float(value)
+    except (TypeError, ValueError):
+        return None
+    now = time.time()
+    # Ignore deadlines further out than one window, so a client cannot pin itself to the primary
+    return until if now < until <= now + settings.DB_READ_YOUR_WRITES_SECONDS else None
+
+def get_read_db(request: Request):
+    """Session for read-only endpoints: a replica unless the client just wrote or none is usable"""
+    replica = None
+    if read_primary_until(request) is not None:
+        DB_READ_SESSIONS.labels("primary_sticky").inc()
+    else:
+        replica = replica_router.choose()
+        DB_READ_SESSIONS.labels("replica" if replica else "primary").inc()
+    db: Session = replica.session_factory() if replica else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+class ReadYourWritesMiddleware:
+    """Send the client's reads to the primary for a while after each successful write"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                window = settings.DB_READ_YOUR_WRITES_SECONDS
+                until = f"{time.time() + window:.3f}"
+                headers = MutableHeaders(scope=message)
+                headers.append(READ_PRIMARY_HEADER, until)
+                headers.append(
+                    "Set-Cookie", f"{READ_PRIMARY_COOKIE}={until}; Max-Age={window}; Path=/; HttpOnly; SameSite=Lax"
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
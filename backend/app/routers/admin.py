@@ -0,0 +1,126 @@
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from .. import models, schemas, auth, memory, profiling
+from ..config import settings
+from ..database import get_db
+from ..scheduler import scheduler
+from ..services.resilience import get_breakers
+
+router = APIRouter(prefix="/admin", tags=["Admin"])
+
+def get_job(name: str):
+    job = scheduler.jobs.get(name)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/jobs", response_model=List[schemas.JobStatus])
+def list_jobs(
+    current_user: models.User = Depends(auth.get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """List scheduled jobs with their most recent run"""
+    jobs = []
+    for job in scheduler.jobs.values():
+        last_run = db.query(models.JobRun).filter(
+            models.JobRun.job_name == job.name
+        ).order_by(models.JobRun.started_at.desc()).first()
+        jobs.append(schemas.JobStatus(
+            name=job.name,
+            interval_seconds=job.interval_seconds,
+            enabled=job.enabled,
+            last_run=last_run
+        ))
+    return jobs
+
+@router.get("/jobs/{name}/runs", response_model=List[schemas.JobRun])
+def get_job_runs(
+    name: str,
+    limit: int = 20,
+    current_user: models.User = Depends(auth.get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """Run history and durations for a job, most recent first"""
+    get_job(name)
+    return db.query(models.JobRun).filter(
+        models.JobRun.job_name == name
+    ).order_by(models.JobRun.started_at.desc()).limit(limit).all()
+
+@router.post("/jobs/{name}/run", response_model=schemas.JobRun)
+async def run_job_now(
+    name: str,
+    current_user: models.User = Depends(auth.get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """Run a job immediately, unless another worker is running it"""
+    get_job(name)
+    run_id = await scheduler.run_job(name, force=True)
+    if run_id is None:
+        raise HTTPException(status_code=409, detail="Job is already running")
+    
+    # Keep the blocking query off the event loop, like the job itself
+    return await run_in_threadpool(db.query(models.JobRun).filter(models.JobRun.id == run_id).first)
+
+@router.get("/dependencies", response_model=List[schemas.DependencyStatus])
+def list_dependencies(current_user: models.User = Depends(auth.get_current_admin)):
+    """Circuit breaker state of each outbound dependency in this worker"""
+    return [breaker.snapshot() for breaker in get_breakers()]
+
+@router.post("/profiles/token", response_model=schemas.ProfileToken)
+def create_profile_token(current_user: models.User = Depends(auth.get_current_admin)):
+    """Short-lived token; requests sending it in X-Profile-Token are profiled"""
+    if not settings.PROFILING_ENABLED:
+        raise HTTPException(status_code=400, detail="Profiling is disabled")
+    token, expires_at = profiling.create_profile_token(current_user.id)
+    return schemas.ProfileToken(token=token, header=profiling.PROFILE_TOKEN_HEADER, expires_at=expires_at)
+
+@router.get("/profiles", response_model=List[schemas.ProfileCapture])
+def list_profiles(current_user: models.User = Depends(auth.get_current_admin)):
+    """Stored request profiles from all workers, most recent first"""
+    return profiling.list_captures()
+
+@router.get("/profiles/{capture_id}", response_class=PlainTextResponse)
+def get_profile(capture_id: str, current_user: models.User = Depends(auth.get_current_admin)):
+    """Folded stacks of one capture, for flamegraph.pl or speedscope"""
+    capture = profiling.load_capture(capture_id)
+    if capture is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profiling.folded_stacks(capture)
+
+@router.get("/memory", response_model=schemas.MemoryStats)
+def get_memory_stats(current_user: models.User = Depends(auth.get_current_admin)):
+    """RSS, GC and allocation tracing state of the worker serving this request"""
+    return memory.memory_stats()
+
+@router.post("/memory/tracing", response_model=schemas.MemoryStats)
+def start_memory_tracing(
+    frames: int = Query(settings.MEMORY_TRACE_FRAMES, ge=1, le=100),
+    current_user: models.User = Depends(auth.get_current_admin)
+):
+    """Start tracemalloc in this worker"""
+    memory.allocation_tracker.start(frames)
+    return memory.memory_stats()
+
+@router.delete("/memory/tracing", response_model=schemas.MemoryStats)
+def stop_memory_tracing(current_user: models.User = Depends(auth.get_current_admin)):
+    memory.allocation_tracker.stop()
+    return memory.memory_stats()
+
+@router.post("/memory/snapshots", response_model=schemas.MemorySnapshot)
+def take_memory_snapshot(
+    limit: int = Query(25, ge=1, le=500),
+    group_by: str = Query("lineno", pattern="^(lineno|filename|traceback)$"),
+    current_user: models.User = Depends(auth.get_current_admin)
+):
+    """Top allocation sites, and the change since this worker's previous snapshot"""
+    if not memory.allocation_tracker.tracing:
+        raise HTTPException(status_code=409, detail="Allocation tracing is not running in this worker")
+    return memory.allocation_tracker.snapshot(limit, group_by)
+
+@router.get("/memory/requests", response_model=List[schemas.RouteAllocation])
+def list_request_allocations(current_user: models.User = Depends(auth.get_current_admin)):
+    """Per-route allocation of the requests this worker sampled, largest peak first"""
+    return memory.request_sampler.by_route()
@@ -1,14 +1,14 @@
 from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from .. import models, schemas, auth
 from ..database import get_db
 from ..services.s3_service import s3_service
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
-@router.post("/register", response_model=schemas.User)
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
+def _check_user_available(db: Session, user: schemas.UserCreate):
     # Check if user already exists
     db_user = auth.get_user_by_email(db, email=user.email)
     if db_user:
@@ -23,9 +23,8 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
             status_code=400,
             detail="Username already taken"
         )
-    
-    # Create new user
-    hashed_password = auth.get_password_hash(user.password)
+
+def _create_user(db: Session, user: schemas.UserCreate, hashed_password: str) -> models.User:
     db_user = models.User(
         email=user.email,
         username=user.username,
@@ -40,20 +39,49 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     db.refresh(db_user)
     return db_user
 
+def _issue_tokens(db: Session, user: models.User) -> dict:
+    refresh_token, _ = auth.create_refresh_token(db, user)
+    db.commit()
+    access_token_expires = timedelta(minutes=auth.settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = auth.create_access_token(
+        data={"sub": user.email}, expires_delta=access_token_expires
+    )
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+# Register and login are async so bcrypt waits in the hashing pool rather than
+# holding a threadpool slot; database work still runs in the threadpool.
+@router.post("/register", response_model=schemas.User)
+async def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
+    await run_in_threadpool(_check_user_available, db, user)
+    
+    # Create new user
+    hashed_password = await auth.get_password_hash_async(user.password)
+    return await run_in_threadpool(_create_user, db, user, hashed_password)
+
 @router.post("/login", response_model=schemas.Token)
-def login(user_credentials: schemas.UserLogin, db: Session = Depends(get_db)):
-    user = auth.authenticate_user(db, user_credentials.email, user_credentials.password)
+async def login(user_credentials: schemas.UserLogin, db: Session = Depends(get_db)):
+    user = await auth.authenticate_user(db, user_credentials.email, user_credentials.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=auth.settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = auth.create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    return await run_in_threadpool(_issue_tokens, db, user)
+
+@router.post("/refresh", response_model=schemas.Token)
+def refresh_access_token(token_request: schemas.RefreshTokenRequest, db: Session = Depends(get_db)):
+    """Rotate a refresh token and issue a new access token without a password check"""
+    user, refresh_token = auth.rotate_refresh_token(db, token_request.refresh_token)
+    access_token = auth.create_access_token(data={"sub": user.email})
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+@router.post("/logout")
+def logout(token_request: schemas.RefreshTokenRequest, db: Session = Depends(get_db)):
+    """Revoke the refresh token family of the current session"""
+    auth.revoke_refresh_token(db, token_request.refresh_token)
+    db.commit()
+    return {"detail": "Logged out successfully"}
 
 @router.get("/me", response_model=schemas.User)
 def read_users_me(current_user: models.User = Depends(auth.get_current_active_user)):
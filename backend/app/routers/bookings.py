@@ -1,49 +1,81 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+import base64
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import tuple_
 from datetime import datetime, timedelta
 from .. import models, schemas, auth
 from ..database import get_db
+from ..services.availability import overlapping_bookings_clause, is_booking_conflict
+from ..services import pricing
+from ..services.idempotency import IDEMPOTENCY_HEADER, run_idempotent
+from ..services.booking_lifecycle import run_booking_lifecycle
+from ..services.email_outbox import prune_sent_emails, queue_booking_status_update, queue_new_booking_notification
+from ..services.host_digest import run_daily_digests, run_hourly_digests
+from ..scheduler import scheduler
+from ..config import settings
 
 router = APIRouter(prefix="/bookings", tags=["Bookings"])
 
+BOOKING_STATUSES = ("pending", "confirmed", "cancelled", "completed", "paid", "expired")
+BOOKING_WINDOWS = ("upcoming", "past")
+
+@scheduler.job("booking_lifecycle", interval_seconds=settings.BOOKING_LIFECYCLE_INTERVAL_SECONDS)
+def booking_lifecycle_job(db: Session):
+    """Expire stale pending holds and complete finished stays"""
+    return run_booking_lifecycle(db)
+
+@scheduler.job("email_outbox_prune", interval_seconds=24 * 3600)
+def email_outbox_prune_job(db: Session):
+    return {"deleted": prune_sent_emails(db, timedelta(days=settings.EMAIL_OUTBOX_RETENTION_DAYS))}
+
+@scheduler.job("host_digest_hourly", interval_seconds=3600)
+def host_digest_hourly_job(db: Session):
+    """Booking and review emails for hosts on hourly digests"""
+    return run_hourly_digests(db)
+
+@scheduler.job("host_digest_daily", interval_seconds=24 * 3600)
+def host_digest_daily_job(db: Session):
+    return run_daily_digests(db)
+
 def calculate_total_price(listing: models.Listing, check_in_date: datetime, check_out_date: datetime) -> float:
-    """Calculate total price for a booking"""
-    nights = (check_out_date - check_in_date).days
-    return nights * listing.price_per_night
+    """Calculate total price for a booking from the listing's rate calendar"""
+    return pricing.quote_stay(listing, check_in_date, check_out_date)
 
 def check_availability(db: Session, listing_id: int, check_in_date: datetime, check_out_date: datetime) -> bool:
     """Check if listing is available for given dates"""
-    conflicting_bookings = db.query(models.Booking).filter(
-        and_(
-            models.Booking.listing_id == listing_id,
-            models.Booking.status.in_(["pending", "confirmed"]),
-            or_(
-                and_(
-                    models.Booking.check_in_date <= check_in_date,
-                    models.Booking.check_out_date > check_in_date
-                ),
-                and_(
-                    models.Booking.check_in_date < check_out_date,
-                    models.Booking.check_out_date >= check_out_date
-                ),
-                and_(
-                    models.Booking.check_in_date >= check_in_date,
-                    models.Booking.check_out_date <= check_out_date
-                )
-            )
-        )
+    conflicting_booking = db.query(models.Booking.id).filter(
+        models.Booking.listing_id == listing_id,
+        overlapping_bookings_clause(db, check_in_date, check_out_date)
     ).first()
     
-    return conflicting_bookings is None
+    return conflicting_booking is None
+
+def commit_booking_change(db: Session):
+    """Commit, turning an overlap rejected by the database into the usual 400"""
+    try:
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        if is_booking_conflict(e):
+            raise HTTPException(status_code=400, detail="Listing is not available for selected dates")
+        raise
 
 @router.post("/", response_model=schemas.Booking)
 def create_booking(
     booking: schemas.BookingCreate,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
     current_user: models.User = Depends(auth.get_current_active_user),
     db: Session = Depends(get_db)
 ):
+    """Create a booking; retries carrying the same Idempotency-Key get the original booking back"""
+    return run_idempotent(
+        db, current_user.id, "create_booking", idempotency_key, booking,
+        lambda: schemas.Booking.model_validate(_create_booking(booking, current_user, db))
+    )
+
+def _create_booking(booking: schemas.BookingCreate, current_user: models.User, db: Session) -> models.Booking:
     # Get listing
     listing = db.query(models.Listing).filter(models.Listing.id == booking.listing_id).first()
     if not listing:
@@ -63,6 +95,10 @@ def create_booking(
     if booking.check_in_date < datetime.now():
         raise HTTPException(status_code=400, detail="Check-in date cannot be in the past")
     
+    window_error = pricing.stay_window_error(booking.check_in_date, booking.check_out_date)
+    if window_error:
+        raise HTTPException(status_code=400, detail=window_error)
+    
     # Check guest count
     if booking.guest_count > listing.max_guests:
         raise HTTPException(
@@ -70,7 +106,8 @@ def create_booking(
             detail=f"Guest count exceeds maximum capacity of {listing.max_guests}"
         )
     
-    # Check availability
+    # Fast path for a friendly error; the exclusion constraint is the real guard
+    # against concurrent requests for the same dates
     if not check_availability(db, booking.listing_id, booking.check_in_date, booking.check_out_date):
         raise HTTPException(status_code=400, detail="Listing is not available for selected dates")
     
@@ -80,30 +117,107 @@ def create_booking(
     # Create booking
     db_booking = models.Booking(
         **booking.dict(),
-        customer_id=current_user.id,
+        listing=listing,
+        customer=current_user,
         total_price=total_price
     )
     
     db.add(db_booking)
-    db.commit()
+    # The host is told in the same transaction that creates the booking
+    queue_new_booking_notification(db, db_booking)
+    commit_booking_change(db)
     db.refresh(db_booking)
     return db_booking
 
+def encode_cursor(booking: models.Booking) -> str:
+    raw = f"{booking.check_in_date.isoformat()}|{booking.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        check_in, booking_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(check_in), int(booking_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def paginate_bookings(
+    query,
+    response: Response,
+    status_filter: Optional[str],
+    window: Optional[str],
+    cursor: Optional[str],
+    limit: int
+) -> List[models.Booking]:
+    """Apply list filters and keyset pagination on (check_in_date, id).
+
+    Upcoming stays are returned soonest first, everything else most recent
+    first. When more rows exist, the cursor for the next page is returned
+    in the X-Next-Cursor header.
+    """
+    if status_filter:
+        if status_filter not in BOOKING_STATUSES:
+            raise HTTPException(status_code=400, detail=f"Invalid status. Allowed: {', '.join(BOOKING_STATUSES)}")
+        query = query.filter(models.Booking.status == status_filter)
+    
+    if window and window not in BOOKING_WINDOWS:
+        raise HTTPException(status_code=400, detail=f"Invalid window. Allowed: {', '.join(BOOKING_WINDOWS)}")
+    
+    now = datetime.now()
+    if window == "upcoming":
+        query = query.filter(models.Booking.check_in_date >= now)
+    elif window == "past":
+        query = query.filter(models.Booking.check_in_date < now)
+    
+    sort_key = tuple_(models.Booking.check_in_date, models.Booking.id)
+    ascending = window == "upcoming"
+    if cursor:
+        position = decode_cursor(cursor)
+        query = query.filter(sort_key > position if ascending else sort_key < position)
+    
+    if ascending:
+        query = query.order_by(models.Booking.check_in_date.asc(), models.Booking.id.asc())
+    else:
+        query = query.order_by(models.Booking.check_in_date.desc(), models.Booking.id.desc())
+    
+    # Load the nested listing, host and customer in the same query
+    bookings = query.options(
+        joinedload(models.Booking.listing).joinedload(models.Listing.host),
+        joinedload(models.Booking.customer)
+    ).limit(limit + 1).all()
+    
+    if len(bookings) > limit:
+        bookings = bookings[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(bookings[-1])
+    
+    return bookings
+
 @router.get("/my-bookings", response_model=List[schemas.Booking])
 def get_my_bookings(
+    response: Response,
+    status_filter: Optional[str] = Query(None, alias="status"),
+    window: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=100),
     current_user: models.User = Depends(auth.get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    return db.query(models.Booking).filter(models.Booking.customer_id == current_user.id).all()
+    query = db.query(models.Booking).filter(models.Booking.customer_id == current_user.id)
+    return paginate_bookings(query, response, status_filter, window, cursor, limit)
 
 @router.get("/host/incoming", response_model=List[schemas.Booking])
 def get_incoming_bookings(
+    response: Response,
+    status_filter: Optional[str] = Query(None, alias="status"),
+    window: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=100),
     current_user: models.User = Depends(auth.get_current_host),
     db: Session = Depends(get_db)
 ):
-    return db.query(models.Booking).join(models.Listing).filter(
+    query = db.query(models.Booking).join(models.Listing).filter(
         models.Listing.host_id == current_user.id
-    ).all()
+    )
+    return paginate_bookings(query, response, status_filter, window, cursor, limit)
 
 @router.get("/{booking_id}", response_model=schemas.Booking)
 def get_booking(
@@ -150,10 +264,13 @@ def update_booking_status(
         raise HTTPException(status_code=403, detail="Not authorized to update this booking")
     
     # Update booking
+    previous_status = booking.status
     for field, value in booking_update.dict(exclude_unset=True).items():
         setattr(booking, field, value)
+    if booking.status != previous_status:
+        queue_booking_status_update(db, booking, booking.status)
     
-    db.commit()
+    commit_booking_change(db)
     db.refresh(booking)
     return booking
 
@@ -176,6 +293,7 @@ def cancel_booking(
         raise HTTPException(status_code=400, detail="Cannot cancel past bookings")
     
     booking.status = "cancelled"
+    queue_booking_status_update(db, booking, "cancelled")
     db.commit()
     
     return {"detail": "Booking cancelled successfully"} 
\ No newline at end of file
@@ -1,14 +1,17 @@
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
 from datetime import datetime
 import os
 import uuid
 from .. import models, schemas, auth
-from ..database import get_db
+from ..database import get_db, set_statement_timeout
+from ..replicas import get_read_db
 from ..config import settings
 from ..services.s3_service import s3_service
+from ..services.availability import overlapping_bookings_clause
+from ..services import pricing
+from ..services.host_cancellation import cancel_listing_bookings
 
 def parse_date(date_str: str) -> datetime:
     """Parse date string in YYYY-MM-DD format to datetime"""
@@ -19,6 +22,43 @@ def parse_date(date_str: str) -> datetime:
 
 router = APIRouter(prefix="/listings", tags=["Listings"])
 
+MAX_BATCH_QUOTES = 100
+
+def validate_rate_rule(rule: schemas.RateRuleCreate):
+    """Check that a rate rule has the fields its type needs"""
+    if rule.rule_type not in pricing.RULE_TYPES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid rule type. Allowed types: {', '.join(pricing.RULE_TYPES)}"
+        )
+    
+    if rule.rule_type == pricing.WEEKDAY:
+        if not rule.weekdays or rule.price is None:
+            raise HTTPException(status_code=400, detail="Weekday rules require weekdays and price")
+        if any(day < 0 or day > 6 for day in rule.weekdays):
+            raise HTTPException(status_code=400, detail="Weekdays must be between 0 (Monday) and 6 (Sunday)")
+    elif rule.rule_type == pricing.DATE_RANGE:
+        if not rule.start_date or not rule.end_date or rule.price is None:
+            raise HTTPException(status_code=400, detail="Date range rules require start_date, end_date and price")
+        if rule.end_date < rule.start_date:
+            raise HTTPException(status_code=400, detail="End date must not be before start date")
+    elif rule.min_nights is None or rule.discount_percent is None:
+        raise HTTPException(status_code=400, detail="Length of stay rules require min_nights and discount_percent")
+
+def validate_stay_dates(check_in_date, check_out_date):
+    if check_in_date >= check_out_date:
+        raise HTTPException(status_code=400, detail="Check-out date must be after check-in date")
+    window_error = pricing.stay_window_error(check_in_date, check_out_date)
+    if window_error:
+        raise HTTPException(status_code=400, detail=window_error)
+
+def bump_pricing_version(db: Session, listing_id: int):
+    """Invalidate cached rate calendars; incremented in SQL so concurrent edits each count"""
+    db.query(models.Listing).filter(models.Listing.id == listing_id).update(
+        {models.Listing.pricing_version: models.Listing.pricing_version + 1},
+        synchronize_session=False
+    )
+
 def save_base64_image(base64_data: str, filename: str) -> str:
     """Save base64 encoded image and return the file path"""
     if not os.path.exists(settings.UPLOAD_DIR):
@@ -49,8 +89,10 @@ def get_listings(
     guests: Optional[int] = None,
     min_price: Optional[float] = None,
     max_price: Optional[float] = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
+    # Broad ilike/availability searches are cut off rather than holding a connection
+    set_statement_timeout(db, settings.DB_SEARCH_STATEMENT_TIMEOUT_MS)
     query = db.query(models.Listing).filter(models.Listing.is_active == True)
     
     # Apply filters
@@ -73,23 +115,7 @@ def get_listings(
         check_out_datetime = parse_date(check_out_date)
         
         unavailable_listings = db.query(models.Booking.listing_id).filter(
-            and_(
-                models.Booking.status.in_(["pending", "confirmed"]),
-                or_(
-                    and_(
-                        models.Booking.check_in_date <= check_in_datetime,
-                        models.Booking.check_out_date > check_in_datetime
-                    ),
-                    and_(
-                        models.Booking.check_in_date < check_out_datetime,
-                        models.Booking.check_out_date >= check_out_datetime
-                    ),
-                    and_(
-                        models.Booking.check_in_date >= check_in_datetime,
-                        models.Booking.check_out_date <= check_out_datetime
-                    )
-                )
-            )
+            overlapping_bookings_clause(db, check_in_datetime, check_out_datetime)
         ).subquery()
         
         query = query.filter(~models.Listing.id.in_(unavailable_listings))
@@ -97,7 +123,7 @@ def get_listings(
     return query.offset(skip).limit(limit).all()
 
 @router.get("/{listing_id}", response_model=schemas.ListingWithReviews)
-def get_listing(listing_id: int, db: Session = Depends(get_db)):
+def get_listing(listing_id: int, db: Session = Depends(get_read_db)):
     listing = db.query(models.Listing).filter(models.Listing.id == listing_id).first()
     if not listing:
         raise HTTPException(status_code=404, detail="Listing not found")
@@ -139,7 +165,11 @@ def update_listing(
     if not db_listing:
         raise HTTPException(status_code=404, detail="Listing not found")
     
-    for field, value in listing_update.dict(exclude_unset=True).items():
+    update_data = listing_update.dict(exclude_unset=True)
+    if "price_per_night" in update_data and update_data["price_per_night"] != db_listing.price_per_night:
+        bump_pricing_version(db, listing_id)
+    
+    for field, value in update_data.items():
         setattr(db_listing, field, value)
     
     db.commit()
@@ -164,6 +194,31 @@ def delete_listing(
     db.commit()
     return {"detail": "Listing deleted successfully"}
 
+@router.post("/{listing_id}/cancel-bookings", response_model=schemas.HostCancellationResult)
+def cancel_listing_bookings_endpoint(
+    listing_id: int,
+    cancellation: schemas.HostCancellationRequest,
+    current_user: models.User = Depends(auth.get_current_host),
+    db: Session = Depends(get_db)
+):
+    """Cancel and refund all future bookings of a listing, optionally within a date range (host only)"""
+    db_listing = db.query(models.Listing).filter(
+        models.Listing.id == listing_id,
+        models.Listing.host_id == current_user.id
+    ).first()
+    
+    if not db_listing:
+        raise HTTPException(status_code=404, detail="Listing not found")
+    if cancellation.start_date and cancellation.end_date and cancellation.end_date < cancellation.start_date:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+    
+    return cancel_listing_bookings(
+        db, db_listing, current_user,
+        start_date=cancellation.start_date,
+        end_date=cancellation.end_date,
+        reason=cancellation.reason
+    )
+
 @router.post("/{listing_id}/images")
 async def upload_listing_images(
     listing_id: int,
@@ -307,7 +362,123 @@ async def reorder_listing_images(
 
 @router.get("/host/my-listings", response_model=List[schemas.Listing])
 def get_my_listings(
+    current_user: models.User = Depends(auth.get_current_host),
+    db: Session = Depends(get_read_db)
+):
+    return db.query(models.Listing).filter(models.Listing.host_id == current_user.id).all()
+
+@router.get("/{listing_id}/rates", response_model=List[schemas.RateRule])
+def get_rate_rules(listing_id: int, db: Session = Depends(get_read_db)):
+    listing = db.query(models.Listing).filter(models.Listing.id == listing_id).first()
+    if not listing:
+        raise HTTPException(status_code=404, detail="Listing not found")
+    
+    return listing.rate_rules
+
+@router.post("/{listing_id}/rates", response_model=schemas.RateRule)
+def create_rate_rule(
+    listing_id: int,
+    rule: schemas.RateRuleCreate,
     current_user: models.User = Depends(auth.get_current_host),
     db: Session = Depends(get_db)
 ):
-    return db.query(models.Listing).filter(models.Listing.host_id == current_user.id).all() 
\ No newline at end of file
+    """Add a weekday, date range or length-of-stay rate rule"""
+    db_listing = db.query(models.Listing).filter(
+        models.Listing.id == listing_id,
+        models.Listing.host_id == current_user.id
+    ).first()
+    
+    if not db_listing:
+        raise HTTPException(status_code=404, detail="Listing not found")
+    
+    validate_rate_rule(rule)
+    
+    db_rule = models.ListingRateRule(**rule.dict(), listing_id=listing_id)
+    db.add(db_rule)
+    bump_pricing_version(db, listing_id)
+    db.commit()
+    db.refresh(db_rule)
+    return db_rule
+
+@router.delete("/{listing_id}/rates/{rule_id}")
+def delete_rate_rule(
+    listing_id: int,
+    rule_id: int,
+    current_user: models.User = Depends(auth.get_current_host),
+    db: Session = Depends(get_db)
+):
+    db_listing = db.query(models.Listing).filter(
+        models.Listing.id == listing_id,
+        models.Listing.host_id == current_user.id
+    ).first()
+    
+    if not db_listing:
+        raise HTTPException(status_code=404, detail="Listing not found")
+    
+    db_rule = db.query(models.ListingRateRule).filter(
+        models.ListingRateRule.id == rule_id,
+        models.ListingRateRule.listing_id == listing_id
+    ).first()
+    
+    if not db_rule:
+        raise HTTPException(status_code=404, detail="Rate rule not found")
+    
+    db.delete(db_rule)
+    bump_pricing_version(db, listing_id)
+    db.commit()
+    return {"detail": "Rate rule deleted successfully"}
+
+@router.get("/{listing_id}/quote", response_model=schemas.StayQuote)
+def get_stay_quote(
+    listing_id: int,
+    check_in_date: str,
+    check_out_date: str,
+    db: Session = Depends(get_read_db)
+):
+    """Price a stay from the listing's rate calendar"""
+    listing = db.query(models.Listing).filter(models.Listing.id == listing_id).first()
+    if not listing:
+        raise HTTPException(status_code=404, detail="Listing not found")
+    
+    check_in = parse_date(check_in_date).date()
+    check_out = parse_date(check_out_date).date()
+    validate_stay_dates(check_in, check_out)
+    
+    return schemas.StayQuote(
+        check_in_date=check_in,
+        check_out_date=check_out,
+        nights=(check_out - check_in).days,
+        total_price=pricing.quote_stay(listing, check_in, check_out)
+    )
+
+@router.post("/{listing_id}/quotes", response_model=List[schemas.StayQuote])
+def get_stay_quotes(
+    listing_id: int,
+    quote_request: schemas.StayQuoteRequest,
+    db: Session = Depends(get_db)
+):
+    """Price several candidate stays in one vectorized pass"""
+    listing = db.query(models.Listing).filter(models.Listing.id == listing_id).first()
+    if not listing:
+        raise HTTPException(status_code=404, detail="Listing not found")
+    
+    if len(quote_request.stays) > MAX_BATCH_QUOTES:
+        raise HTTPException(status_code=400, detail=f"Too many stays. Maximum {MAX_BATCH_QUOTES} allowed.")
+    
+    for stay in quote_request.stays:
+        validate_stay_dates(stay.check_in_date, stay.check_out_date)
+    
+    totals = pricing.quote_stays(
+        listing,
+        [(stay.check_in_date, stay.check_out_date) for stay in quote_request.stays]
+    )
+    
+    return [
+        schemas.StayQuote(
+            check_in_date=stay.check_in_date,
+            check_out_date=stay.check_out_date,
+            nights=(stay.check_out_date - stay.check_in_date).days,
+            total_price=total
+        )
+        for stay, total in zip(quote_request.stays, totals)
+    ]
@@ -1,9 +1,18 @@
-from typing import Dict
+from datetime import timedelta
+from typing import Dict, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Header
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from .. import models, schemas, auth
+from ..config import settings
 from ..database import get_db
+from ..scheduler import scheduler
+from ..services import webhook_inbox
+from ..services.email_outbox import queue_booking_confirmation
 from ..services.stripe_service import StripeService
+from ..services.payment_reconciliation import run_payment_reconciliation
+from ..services.resilience import CircuitOpenError, service_unavailable
+from ..services.idempotency import IDEMPOTENCY_HEADER, prune_idempotency_keys, run_idempotent, stripe_idempotency_key
 import logging
 
 router = APIRouter(prefix="/payments", tags=["Payments"])
@@ -12,10 +21,23 @@ logger = logging.getLogger(__name__)
 @router.post("/create-payment-intent", response_model=schemas.PaymentIntentResponse)
 def create_payment_intent(
     payment_request: schemas.PaymentIntentCreate,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
     current_user: models.User = Depends(auth.get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Create a Stripe Payment Intent for a booking"""
+    stripe_key = stripe_idempotency_key(current_user.id, "payment_intent", idempotency_key)
+    return run_idempotent(
+        db, current_user.id, "create_payment_intent", idempotency_key, payment_request,
+        lambda: _create_payment_intent(payment_request, current_user, db, stripe_key)
+    )
+
+def _create_payment_intent(
+    payment_request: schemas.PaymentIntentCreate,
+    current_user: models.User,
+    db: Session,
+    stripe_key: Optional[str]
+) -> schemas.PaymentIntentResponse:
     # Get booking
     booking = db.query(models.Booking).filter(
         models.Booking.id == payment_request.booking_id
@@ -41,7 +63,8 @@ def create_payment_intent(
         payment_intent = StripeService.create_payment_intent(
             booking=booking,
             customer_email=current_user.email,
-            customer_name=f"{current_user.first_name} {current_user.last_name}"
+            customer_name=f"{current_user.first_name} {current_user.last_name}",
+            idempotency_key=stripe_key
         )
         
         # Update booking with payment intent ID
@@ -51,6 +74,8 @@ def create_payment_intent(
         
         return schemas.PaymentIntentResponse(**payment_intent)
         
+    except CircuitOpenError as e:
+        raise service_unavailable(e)
     except Exception as e:
         logger.error(f"Failed to create payment intent: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to create payment: {str(e)}")
@@ -79,6 +104,11 @@ def confirm_payment(
         payment_details = StripeService.confirm_payment(confirmation.payment_intent_id)
         
         if payment_details['status'] == 'succeeded':
+            # The webhook may have confirmed it first; only one of them emails the guest.
+            # Re-read under the row lock the webhook handler takes, so they cannot both see it unpaid
+            db.refresh(booking, with_for_update=True)
+            if booking.payment_status != "paid":
+                queue_booking_confirmation(db, booking)
             # Update booking status
             booking.payment_status = "paid"
             booking.status = "confirmed"
@@ -91,6 +121,9 @@ def confirm_payment(
             db.commit()
             raise HTTPException(status_code=400, detail=f"Payment failed: {payment_details['status']}")
             
+    except CircuitOpenError as e:
+        # Stripe was not asked, so the payment state is unknown rather than failed
+        raise service_unavailable(e)
     except Exception as e:
         logger.error(f"Failed to confirm payment: {str(e)}")
         booking.payment_status = "failed"
@@ -100,10 +133,23 @@ def confirm_payment(
 @router.post("/refund", response_model=schemas.RefundResponse)
 def create_refund(
     refund_request: schemas.RefundRequest,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
     current_user: models.User = Depends(auth.get_current_host),
     db: Session = Depends(get_db)
 ):
     """Create a refund for a booking (host only)"""
+    stripe_key = stripe_idempotency_key(current_user.id, "refund", idempotency_key)
+    return run_idempotent(
+        db, current_user.id, "create_refund", idempotency_key, refund_request,
+        lambda: _create_refund(refund_request, current_user, db, stripe_key)
+    )
+
+def _create_refund(
+    refund_request: schemas.RefundRequest,
+    current_user: models.User,
+    db: Session,
+    stripe_key: Optional[str]
+) -> schemas.RefundResponse:
     # Get booking
     booking = db.query(models.Booking).filter(
         models.Booking.id == refund_request.booking_id
@@ -132,7 +178,8 @@ def create_refund(
         # Create refund
         refund_details = StripeService.create_refund(
             payment_intent_id=booking.stripe_payment_intent_id,
-            amount=refund_request.amount
+            amount=refund_request.amount,
+            idempotency_key=stripe_key
         )
         
         # Update booking
@@ -148,6 +195,8 @@ def create_refund(
         
         return schemas.RefundResponse(**refund_details)
         
+    except CircuitOpenError as e:
+        raise service_unavailable(e)
     except Exception as e:
         logger.error(f"Failed to create refund: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to create refund: {str(e)}")
@@ -155,9 +204,15 @@ def create_refund(
 @router.post("/webhook")
 async def stripe_webhook(
     request: Request,
-    stripe_signature: str = Header(None, alias="stripe-signature")
+    stripe_signature: str = Header(None, alias="stripe-signature"),
+    db: Session = Depends(get_db)
 ):
-    """Handle Stripe webhooks"""
+    """Handle Stripe webhooks
+    
+    Verified events are stored in the webhook inbox and acknowledged
+    immediately; the inbox workers apply them. Redelivered events are
+    acknowledged without being stored again.
+    """
     if not stripe_signature:
         raise HTTPException(status_code=400, detail="Missing Stripe signature")
     
@@ -169,60 +224,25 @@ async def stripe_webhook(
         logger.error(f"Webhook signature verification failed: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
     
-    # Handle the event
-    if event['type'] == 'payment_intent.succeeded':
-        payment_intent = event['data']['object']
-        await handle_payment_succeeded(payment_intent)
-    elif event['type'] == 'payment_intent.payment_failed':
-        payment_intent = event['data']['object']
-        await handle_payment_failed(payment_intent)
-    elif event['type'] == 'charge.dispute.created':
-        dispute = event['data']['object']
-        await handle_dispute_created(dispute)
-    else:
-        logger.info(f"Unhandled event type: {event['type']}")
+    if not await run_in_threadpool(webhook_inbox.record_event, db, event):
+        logger.info(f"Duplicate webhook event {event['id']} ignored")
+        return {"status": "duplicate"}
     
+    webhook_inbox.webhook_worker.notify()
     return {"status": "success"}
 
-async def handle_payment_succeeded(payment_intent):
-    """Handle successful payment webhook"""
-    from ..database import SessionLocal
-    
-    db = SessionLocal()
-    try:
-        booking = db.query(models.Booking).filter(
-            models.Booking.stripe_payment_intent_id == payment_intent['id']
-        ).first()
-        
-        if booking and booking.payment_status != "paid":
-            booking.payment_status = "paid"
-            booking.status = "confirmed"
-            db.commit()
-            logger.info(f"Payment confirmed via webhook for booking {booking.id}")
-    finally:
-        db.close()
+@scheduler.job("webhook_inbox_prune", interval_seconds=24 * 3600)
+def webhook_inbox_prune_job(db: Session):
+    return {"deleted": webhook_inbox.prune_processed_events(db, timedelta(days=settings.WEBHOOK_RETENTION_DAYS))}
 
-async def handle_payment_failed(payment_intent):
-    """Handle failed payment webhook"""
-    from ..database import SessionLocal
-    
-    db = SessionLocal()
-    try:
-        booking = db.query(models.Booking).filter(
-            models.Booking.stripe_payment_intent_id == payment_intent['id']
-        ).first()
-        
-        if booking:
-            booking.payment_status = "failed"
-            db.commit()
-            logger.info(f"Payment failed via webhook for booking {booking.id}")
-    finally:
-        db.close()
+@scheduler.job("payment_reconciliation", interval_seconds=settings.PAYMENT_RECONCILIATION_INTERVAL_SECONDS)
+def payment_reconciliation_job(db: Session):
+    """Settle bookings stuck in processing when the client and webhook both missed"""
+    return run_payment_reconciliation(db)
 
-async def handle_dispute_created(dispute):
-    """Handle dispute created webhook"""
-    logger.warning(f"Dispute created for charge: {dispute['charge']}")
-    # You can implement additional logic here like notifying admins
+@scheduler.job("idempotency_key_prune", interval_seconds=3600)
+def idempotency_key_prune_job(db: Session):
+    return {"deleted": prune_idempotency_keys(db, timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS))}
 
 @router.get("/booking/{booking_id}/payment-status")
 def get_payment_status(
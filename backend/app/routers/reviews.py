@@ -3,6 +3,8 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from .. import models, schemas, auth
 from ..database import get_db
+from ..replicas import get_read_db
+from ..services.email_outbox import queue_review_notification
 
 router = APIRouter(prefix="/reviews", tags=["Reviews"])
 
@@ -46,11 +48,13 @@ def create_review(
     # Create review
     db_review = models.Review(
         **review.dict(),
-        reviewer_id=current_user.id,
-        host_id=listing.host_id
+        listing=listing,
+        reviewer=current_user,
+        host=listing.host
     )
     
     db.add(db_review)
+    queue_review_notification(db, db_review)
     db.commit()
     db.refresh(db_review)
     return db_review
@@ -60,7 +64,7 @@ def get_listing_reviews(
     listing_id: int,
     skip: int = 0,
     limit: int = 10,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     # Check if listing exists
     listing = db.query(models.Listing).filter(models.Listing.id == listing_id).first()
@@ -76,7 +80,7 @@ def get_host_reviews(
     host_id: int,
     skip: int = 0,
     limit: int = 10,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     # Check if host exists
     host = db.query(models.User).filter(
@@ -93,7 +97,7 @@ def get_host_reviews(
 @router.get("/my-reviews", response_model=List[schemas.Review])
 def get_my_reviews(
     current_user: models.User = Depends(auth.get_current_active_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     return db.query(models.Review).filter(
         models.Review.reviewer_id == current_user.id
@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
+
+from . import models
+from .config import settings
+from .database import SessionLocal, engine
+
+logger = logging.getLogger(__name__)
+
+# A run started within this fraction of the interval counts as "this interval's" run,
+# which absorbs start-up jitter between workers
+RECENT_RUN_TOLERANCE = 0.9
+
+@dataclass
+class Job:
+    name: str
+    interval_seconds: int
+    func: Callable
+    lock_key: int
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval_seconds > 0
+
+class Scheduler:
+    """Interval jobs that run once per interval across all workers and replicas.
+
+    Every worker runs the same loop; before a run the worker takes a
+    PostgreSQL advisory lock for the job and checks job_runs for a run in
+    the current interval, so only one of them actually executes it. On
+    other databases (SQLite in tests) the lock is a no-op.
+
+    Jobs receive a Session; async jobs are awaited on the event loop.
+    """
+
+    def __init__(self, engine: Engine, session_factory: sessionmaker):
+        self.jobs: Dict[str, Job] = {}
+        self._tasks: List[asyncio.Task] = []
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.configure(engine, session_factory)
+
+    def configure(self, engine: Engine, session_factory: sessionmaker):
+        self.engine = engine
+        self.session_factory = session_factory
+
+    def job(self, name: str, interval_seconds: int):
+        """Register a job; an interval of 0 keeps it registered but never scheduled"""
+        def decorator(fn: Callable):
+            self.jobs[name] = Job(
+                name=name,
+                interval_seconds=interval_seconds,
+                func=fn,
+                lock_key=zlib.crc32(f"stayhub-job:{name}".encode())
+            )
+            return fn
+        return decorator
+
+    async def start(self):
+        for job in self.jobs.values():
+            if job.enabled:
+                self._tasks.append(asyncio.create_task(self._loop(job)))
+        logger.info(f"Scheduler started with {len(self._tasks)} jobs")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def _loop(self, job: Job):
+        # Spread workers out so they do not all contend for the lock at once
+        await asyncio.sleep(random.uniform(0, min(job.interval_seconds, 10)))
+        while True:
+            try:
+                await self.run_job(job.name)
+            except Exception as e:
+                logger.error(f"Scheduler loop for {job.name} failed: {str(e)}")
+            await asyncio.sleep(job.interval_seconds)
+
+    @property
+    def uses_advisory_locks(self) -> bool:
+        return self.engine.dialect.name == "postgresql"
+
+    def _try_lock(self, job: Job) -> Tuple[bool, Optional[Connection]]:
+        """Take the job's advisory lock on a dedicated connection held for the whole run"""
+        if not self.uses_advisory_locks:
+            return True, None
+        conn = self.engine.connect()
+        if settings.DB_PGBOUNCER_TRANSACTION_MODE:
+            # PgBouncer may hand the next transaction a different server connection, so a
+            # session lock could neither be relied on nor released; hold a transaction lock
+            # instead, keeping this transaction (and its server connection) open for the run
+            acquired = conn.execute(select(func.pg_try_advisory_xact_lock(job.lock_key))).scalar()
+            if not acquired:
+                conn.close()
+                return False, None
+            return True, conn
+        acquired = conn.execute(select(func.pg_try_advisory_lock(job.lock_key))).scalar()
+        # End the transaction so the connection is not idle in transaction while the job runs;
+        # the session-level lock survives the commit
+        conn.commit()
+        if not acquired:
+            conn.close()
+            return False, None
+        return True, conn
+
+    def _unlock(self, job: Job, conn: Optional[Connection]):
+        if conn is None:
+            return
+        try:
+            if not settings.DB_PGBOUNCER_TRANSACTION_MODE:
+                conn.execute(select(func.pg_advisory_unlock(job.lock_key)))
+            # Ends the transaction, which releases a transaction lock
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _start_run(self, job: Job, force: bool) -> Optional[int]:
+        db = self.session_factory()
+        try:
+            now = datetime.utcnow()
+            if not force:
+                last_started = db.query(func.max(models.JobRun.started_at)).filter(
+                    models.JobRun.job_name == job.name
+                ).scalar()
+                if last_started and now - last_started < timedelta(seconds=job.interval_seconds * RECENT_RUN_TOLERANCE):
+                    return None
+
+            run = models.JobRun(job_name=job.name, status="running", started_at=now, worker=self.worker_id)
+            db.add(run)
+            db.commit()
+            return run.id
+        finally:
+            db.close()
+
+    def _finish_run(self, run_id: int, duration_ms: float, result=None, error: Optional[str] = None):
+        db = self.session_factory()
+        try:
+            run = db.query(models.JobRun).filter(models.JobRun.id == run_id).first()
+            run.status = "failed" if error else "succeeded"
+            run.finished_at = datetime.utcnow()
+            run.duration_ms = duration_ms
+            run.result = result
+            run.error = error
+            db.commit()
+        finally:
+            db.close()
+
+    def _call_sync(self, job: Job):
+        db = self.session_factory()
+        try:
+            return job.func(db)
+        finally:
+            db.close()
+
+    async def _call(self, job: Job):
+        if asyncio.iscoroutinefunction(job.func):
+            db = self.session_factory()
+            try:
+                return await job.func(db)
+            finally:
+                db.close()
+        return await run_in_threadpool(self._call_sync, job)
+
+    async def run_job(self, name: str, force: bool = False) -> Optional[int]:
+        """Run a job if this worker wins the lock; returns the job_runs id or None if skipped"""
+        job = self.jobs[name]
+        acquired, conn = await run_in_threadpool(self._try_lock, job)
+        if not acquired:
+            return None
+
+        try:
+            run_id = await run_in_threadpool(self._start_run, job, force)
+            if run_id is None:
+                return None
+
+            started = time.perf_counter()
+            result, error = None, None
+            try:
+                result = await self._call(job)
+            except Exception as e:
+                logger.error(f"Job {name} failed: {str(e)}")
+                error = str(e)
+            duration_ms = (time.perf_counter() - started) * 1000
+            await run_in_threadpool(self._finish_run, run_id, duration_ms, result, error)
+            return run_id
+        finally:
+            await run_in_threadpool(self._unlock, job, conn)
+
+scheduler = Scheduler(engine, SessionLocal)
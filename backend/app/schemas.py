@@ -1,6 +1,6 @@
-from datetime import datetime
+from datetime import date, datetime
 from typing import List, Optional
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, field_validator
 
 # User schemas
 class UserBase(BaseModel):
@@ -19,10 +19,22 @@ class UserUpdate(BaseModel):
     last_name: Optional[str] = None
     phone: Optional[str] = None
     is_host: Optional[bool] = None
+    notification_digest: Optional[str] = Field(
+        None, pattern="^(immediate|hourly|daily)$", description="How booking and review emails reach a host"
+    )
+
+    @field_validator("notification_digest")
+    @classmethod
+    def digest_not_null(cls, value: Optional[str]) -> str:
+        # Omit the field to keep the current setting; the column is NOT NULL
+        if value is None:
+            raise ValueError("notification_digest cannot be null")
+        return value
 
 class User(UserBase):
     id: int
     profile_image: Optional[str] = None
+    notification_digest: str = "immediate"
     created_at: datetime
     updated_at: Optional[datetime] = None
 
@@ -37,6 +49,10 @@ class UserLogin(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
 
 class TokenData(BaseModel):
     email: Optional[str] = None
@@ -84,6 +100,38 @@ class Listing(ListingBase):
     class Config:
         from_attributes = True
 
+# Rate calendar schemas
+class RateRuleBase(BaseModel):
+    rule_type: str  # weekday, date_range, length_of_stay
+    weekdays: Optional[List[int]] = None  # 0=Monday ... 6=Sunday
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None  # inclusive
+    price: Optional[float] = Field(None, gt=0, description="Nightly price must be positive")
+    min_nights: Optional[int] = Field(None, ge=1, description="Minimum stay must be at least 1 night")
+    discount_percent: Optional[float] = Field(None, gt=0, lt=100, description="Discount must be between 0 and 100")
+
+class RateRuleCreate(RateRuleBase):
+    pass
+
+class RateRule(RateRuleBase):
+    id: int
+    listing_id: int
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class StayDates(BaseModel):
+    check_in_date: date
+    check_out_date: date
+
+class StayQuoteRequest(BaseModel):
+    stays: List[StayDates]
+
+class StayQuote(StayDates):
+    nights: int
+    total_price: float
+
 # Booking schemas
 class BookingBase(BaseModel):
     listing_id: int
@@ -179,4 +227,103 @@ class RefundRequest(BaseModel):
 class RefundResponse(BaseModel):
     refund_id: str
     status: str
-    amount: float 
\ No newline at end of file
+    amount: float
+
+# Host bulk cancellation schemas
+class HostCancellationRequest(BaseModel):
+    start_date: Optional[date] = None  # inclusive; defaults to every future booking
+    end_date: Optional[date] = None  # inclusive
+    reason: Optional[str] = None
+
+class BookingCancellationOutcome(BaseModel):
+    booking_id: int
+    outcome: str  # cancelled, refunded, refund_failed, payment_in_progress
+    refund_id: Optional[str] = None
+    refund_amount: Optional[float] = None
+    error: Optional[str] = None
+
+class HostCancellationResult(BaseModel):
+    batch_id: str
+    cancelled: int
+    refunded: int
+    failed: int
+    skipped: int
+    outcomes: List[BookingCancellationOutcome]
+
+# Scheduler schemas
+class JobRun(BaseModel):
+    id: int
+    job_name: str
+    status: str
+    worker: Optional[str] = None
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    duration_ms: Optional[float] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class JobStatus(BaseModel):
+    name: str
+    interval_seconds: int
+    enabled: bool
+    last_run: Optional[JobRun] = None
+
+class DependencyStatus(BaseModel):
+    name: str
+    state: str  # closed, open, half_open
+    consecutive_failures: int
+    failure_threshold: int
+    retry_after: Optional[float] = None
+
+class ProfileToken(BaseModel):
+    token: str
+    header: str
+    expires_at: datetime
+
+class ProfileCapture(BaseModel):
+    id: str
+    created_at: datetime
+    trigger: str  # token, sampled
+    method: str
+    path: str
+    route: Optional[str] = None
+    status: int
+    duration_ms: float
+    interval_ms: float
+    samples: int
+
+class MemoryStats(BaseModel):
+    pid: int
+    rss_bytes: Optional[int] = None
+    peak_rss_bytes: int
+    gc_counts: List[int]
+    gc_generations: List[dict]  # collections, collected, uncollectable per generation
+    gc_garbage: int
+    tracing: bool
+    traced_frames: Optional[int] = None
+    traced_bytes: Optional[int] = None
+    traced_peak_bytes: Optional[int] = None
+
+class AllocationSite(BaseModel):
+    location: str  # innermost frame first
+    size_bytes: int
+    count: int
+    size_diff_bytes: Optional[int] = None
+    count_diff: Optional[int] = None
+
+class MemorySnapshot(BaseModel):
+    pid: int
+    taken_at: datetime
+    traced_bytes: int
+    top: List[AllocationSite]
+    diff: Optional[List[AllocationSite]] = None  # against this worker's previous snapshot
+
+class RouteAllocation(BaseModel):
+    route: str
+    samples: int
+    max_peak_bytes: int
+    avg_peak_bytes: float
+    avg_retained_bytes: float
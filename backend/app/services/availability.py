@@ -0,0 +1,34 @@
+from datetime import datetime
+from sqlalchemy import and_, func, literal_column
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from .. import models
+
+# Bookings in these statuses hold their dates; mirrors the WHERE clause of the
+# bookings_no_overlap exclusion constraint (migration 004)
+ACTIVE_BOOKING_STATUSES = ("pending", "confirmed")
+
+# SQLSTATE raised by PostgreSQL when an exclusion constraint is violated
+EXCLUSION_VIOLATION = "23P01"
+
+def overlapping_bookings_clause(db: Session, check_in_date: datetime, check_out_date: datetime):
+    """Filter for active bookings overlapping the half-open stay [check_in, check_out).
+
+    On PostgreSQL this compares the generated ``stay_range`` column so the
+    GiST index behind the exclusion constraint is used. Other databases
+    (SQLite in tests) get the equivalent pair of date comparisons.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        overlap = literal_column("bookings.stay_range").op("&&")(
+            func.tsrange(check_in_date, check_out_date, "[)")
+        )
+    else:
+        overlap = and_(
+            models.Booking.check_in_date < check_out_date,
+            models.Booking.check_out_date > check_in_date
+        )
+    return and_(models.Booking.status.in_(ACTIVE_BOOKING_STATUSES), overlap)
+
+def is_booking_conflict(error: IntegrityError) -> bool:
+    """Whether an IntegrityError came from the bookings_no_overlap constraint"""
+    return getattr(error.orig, "pgcode", None) == EXCLUSION_VIOLATION
@@ -0,0 +1,69 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from .. import models
+
+logger = logging.getLogger(__name__)
+
+def _update_in_batches(db: Session, where, values: dict, batch_size: int) -> int:
+    """Apply ``values`` to bookings matching ``where``, one bounded batch per transaction.
+
+    Each batch is a single UPDATE ... WHERE id IN (SELECT ... LIMIT n); no
+    ORM rows are loaded. On PostgreSQL rows locked by a concurrent request
+    are skipped and picked up on the next run.
+    """
+    total = 0
+    while True:
+        batch = select(models.Booking.id).where(*where).order_by(models.Booking.id).limit(batch_size)
+        batch = batch.with_for_update(skip_locked=True)
+        result = db.execute(
+            update(models.Booking)
+            .where(models.Booking.id.in_(batch.scalar_subquery()))
+            .values(**values, updated_at=func.now())
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        total += result.rowcount
+        if result.rowcount < batch_size:
+            return total
+
+def expire_stale_pending_bookings(db: Session, hold: timedelta, batch_size: int) -> int:
+    """Release dates held by unpaid pending bookings older than the hold window"""
+    cutoff = datetime.now(timezone.utc) - hold
+    return _update_in_batches(
+        db,
+        where=(
+            models.Booking.status == "pending",
+            models.Booking.payment_status.in_(("unpaid", "failed")),
+            models.Booking.created_at < cutoff
+        ),
+        values={"status": "expired"},
+        batch_size=batch_size
+    )
+
+def complete_past_stays(db: Session, batch_size: int) -> int:
+    """Mark confirmed or paid stays whose check-out has passed as completed"""
+    return _update_in_batches(
+        db,
+        where=(
+            models.Booking.status.in_(("confirmed", "paid")),
+            models.Booking.check_out_date < datetime.now()
+        ),
+        values={"status": "completed"},
+        batch_size=batch_size
+    )
+
+def run_booking_lifecycle(db: Session) -> Dict[str, int]:
+    batch_size = settings.BOOKING_LIFECYCLE_BATCH_SIZE
+    expired = expire_stale_pending_bookings(
+        db, timedelta(minutes=settings.BOOKING_PENDING_HOLD_MINUTES), batch_size
+    )
+    completed = complete_past_stays(db, batch_size)
+    if expired or completed:
+        logger.info(f"Booking lifecycle: expired {expired} pending, completed {completed} stays")
+    return {"expired": expired, "completed": completed}
@@ -0,0 +1,263 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import aiosmtplib
+from jinja2 import TemplateError
+from sqlalchemy import func
+from sqlalchemy.orm import Session, sessionmaker
+from starlette.concurrency import run_in_threadpool
+
+from ..config import settings
+from ..database import SessionLocal
+from ..email import EmailService, email_service, is_transient_smtp_error
+from .. import models
+from .resilience import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+# Retry delay doubles per failed attempt, capped
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+
+def enqueue_email(db: Session, to_email: str, template: str, subject: str, context: dict) -> models.EmailOutbox:
+    """Add a message to the outbox; it is sent once the caller's transaction commits"""
+    now = datetime.utcnow()
+    message = models.EmailOutbox(
+        to_email=to_email,
+        template=template,
+        subject=subject,
+        context=context,
+        status="pending",
+        attempts=0,
+        available_at=now,
+        created_at=now
+    )
+    db.add(message)
+    return message
+
+def _booking_context(booking: models.Booking, **extra) -> dict:
+    return {
+        "booking_id": booking.id,
+        "listing_title": booking.listing.title,
+        "check_in_date": booking.check_in_date.strftime("%Y-%m-%d"),
+        "check_out_date": booking.check_out_date.strftime("%Y-%m-%d"),
+        "guest_count": booking.guest_count,
+        "total_price": booking.total_price,
+        **extra
+    }
+
+def queue_booking_confirmation(db: Session, booking: models.Booking):
+    return enqueue_email(
+        db, booking.customer.email, "booking_confirmation.html",
+        f"Booking Confirmation - {booking.listing.title}",
+        {"customer_name": booking.customer.first_name, "booking": _booking_context(booking)}
+    )
+
+def queue_booking_status_update(db: Session, booking: models.Booking, status: str, **extra):
+    return enqueue_email(
+        db, booking.customer.email, "booking_status_update.html",
+        f"Booking {status.title()} - {booking.listing.title}",
+        {"customer_name": booking.customer.first_name, "status": status, "booking": _booking_context(booking, **extra)}
+    )
+
+def _notify_host(db: Session, host: models.User, kind: str, payload: dict, template: str, subject: str):
+    """Email the host now, or hold the event for their digest (see host_digest.py).
+
+    ``kind`` doubles as the name the template expects the payload under.
+    """
+    if host.notification_digest != "immediate":
+        db.add(models.HostNotification(host_id=host.id, kind=kind, payload=payload, created_at=datetime.utcnow()))
+        return None
+    return enqueue_email(db, host.email, template, subject, {"host_name": host.first_name, kind: payload})
+
+def queue_new_booking_notification(db: Session, booking: models.Booking):
+    booking_data = _booking_context(
+        booking,
+        guest_name=f"{booking.customer.first_name} {booking.customer.last_name}",
+        special_requests=booking.special_requests
+    )
+    return _notify_host(
+        db, booking.listing.host, "booking", booking_data,
+        "new_booking_notification.html", f"New Booking Request - {booking.listing.title}"
+    )
+
+def queue_review_notification(db: Session, review: models.Review):
+    review_data = {
+        "listing_title": review.listing.title,
+        "reviewer_name": review.reviewer.first_name,
+        "rating": review.rating,
+        "comment": review.comment
+    }
+    return _notify_host(
+        db, review.host, "review", review_data,
+        "review_notification.html", f"New Review - {review.listing.title}"
+    )
+
+@dataclass
+class OutboxMessage:
+    """Claimed outbox row, detached from the session so it can cross to the event loop"""
+    id: int
+    to_email: str
+    template: str
+    subject: str
+    context: dict
+
+@dataclass
+class SendResult:
+    id: int
+    error: Optional[str] = None
+    retry_in: Optional[float] = None  # set when the message should go back without using an attempt
+    permanent: bool = False
+
+def claim_batch(db: Session, limit: int) -> List[OutboxMessage]:
+    """Lease up to ``limit`` due messages, deferring recipients over their send limit.
+
+    Claimed rows move to ``sending`` with ``available_at`` set to the lease
+    expiry, so a sender that dies mid-batch has them retried rather than
+    lost. On PostgreSQL rows leased by another sender are skipped.
+    """
+    now = datetime.utcnow()
+    rows = db.query(models.EmailOutbox).filter(
+        models.EmailOutbox.status.in_(("pending", "sending")),
+        models.EmailOutbox.available_at <= now
+    ).order_by(models.EmailOutbox.id).limit(limit).with_for_update(skip_locked=True).all()
+    if not rows:
+        db.rollback()
+        return []
+
+    allowance: Optional[Dict[str, int]] = None
+    if settings.EMAIL_RECIPIENT_LIMIT > 0:
+        recipients = {row.to_email for row in rows}
+        window_start = now - timedelta(seconds=settings.EMAIL_RECIPIENT_WINDOW_SECONDS)
+        recent = dict(db.query(models.EmailOutbox.to_email, func.count()).filter(
+            models.EmailOutbox.to_email.in_(recipients),
+            models.EmailOutbox.sent_at >= window_start
+        ).group_by(models.EmailOutbox.to_email).all())
+        allowance = {email: settings.EMAIL_RECIPIENT_LIMIT - recent.get(email, 0) for email in recipients}
+
+    claimed = []
+    lease_until = now + timedelta(seconds=settings.EMAIL_OUTBOX_LEASE_SECONDS)
+    for row in rows:
+        if allowance is not None:
+            if allowance[row.to_email] <= 0:
+                # Spread the backlog over the window instead of retrying every poll
+                row.status = "pending"
+                row.available_at = now + timedelta(seconds=settings.EMAIL_RECIPIENT_WINDOW_SECONDS / settings.EMAIL_RECIPIENT_LIMIT)
+                continue
+            allowance[row.to_email] -= 1
+        row.status = "sending"
+        row.attempts += 1
+        row.available_at = lease_until
+        claimed.append(OutboxMessage(row.id, row.to_email, row.template, row.subject, row.context))
+    db.commit()
+    return claimed
+
+def record_results(db: Session, results: List[SendResult]):
+    """Mark sent messages and schedule retries for failed ones"""
+    now = datetime.utcnow()
+    rows = {row.id: row for row in db.query(models.EmailOutbox).filter(
+        models.EmailOutbox.id.in_([result.id for result in results])
+    ).all()}
+    for result in results:
+        row = rows.get(result.id)
+        if row is None:
+            continue
+        if result.error is None:
+            row.status = "sent"
+            row.sent_at = now
+            row.last_error = None
+            continue
+        row.last_error = result.error
+        if result.retry_in is not None:
+            row.status = "pending"
+            row.attempts -= 1
+            row.available_at = now + timedelta(seconds=result.retry_in)
+        elif result.permanent or row.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+            row.status = "failed"
+            logger.error(f"Giving up on email {row.id} to {row.to_email} after {row.attempts} attempts: {result.error}")
+        else:
+            row.status = "pending"
+            delay = min(RETRY_BASE_SECONDS * 2 ** (row.attempts - 1), RETRY_MAX_SECONDS)
+            row.available_at = now + timedelta(seconds=delay)
+    db.commit()
+
+async def send_one(service: EmailService, message: OutboxMessage) -> SendResult:
+    try:
+        html_content = service.render(message.template, **message.context)
+        await service.send_message(service.build_message(message.to_email, message.subject, html_content))
+        return SendResult(message.id)
+    except CircuitOpenError as e:
+        return SendResult(message.id, error=str(e), retry_in=e.retry_after)
+    except TemplateError as e:
+        return SendResult(message.id, error=f"Template error: {e}", permanent=True)
+    except Exception as e:
+        # 5xx replies and refused recipients will not succeed on retry
+        rejected = isinstance(e, (aiosmtplib.SMTPResponseException, aiosmtplib.SMTPRecipientsRefused))
+        return SendResult(message.id, error=str(e) or type(e).__name__, permanent=rejected and not is_transient_smtp_error(e))
+
+async def send_batch(service: EmailService, messages: List[OutboxMessage]) -> List[SendResult]:
+    """Send concurrently; the SMTP pool bounds how many connections are in use"""
+    return list(await asyncio.gather(*(send_one(service, message) for message in messages)))
+
+def prune_sent_emails(db: Session, retention: timedelta) -> int:
+    deleted = db.query(models.EmailOutbox).filter(
+        models.EmailOutbox.status == "sent",
+        models.EmailOutbox.sent_at < datetime.utcnow() - retention
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+class EmailOutboxWorker:
+    """Event-loop tasks draining the outbox in batches over the pooled SMTP connections.
+
+    Database work runs in the threadpool; sending stays on the event loop
+    so one batch shares the pool's persistent connections.
+    """
+
+    def __init__(self, session_factory: sessionmaker, service: EmailService):
+        self.session_factory = session_factory
+        self.service = service
+        self._tasks: List[asyncio.Task] = []
+
+    def configure(self, session_factory: sessionmaker):
+        self.session_factory = session_factory
+
+    async def start(self, concurrency: int, poll_seconds: float, batch_size: int):
+        for _ in range(concurrency):
+            self._tasks.append(asyncio.create_task(self._loop(poll_seconds, batch_size)))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def _with_session(self, fn, *args):
+        db = self.session_factory()
+        try:
+            return fn(db, *args)
+        finally:
+            db.close()
+
+    async def drain_once(self, batch_size: int) -> int:
+        """Claim, send and record one batch; returns how many messages were attempted"""
+        messages = await run_in_threadpool(self._with_session, claim_batch, batch_size)
+        if messages:
+            results = await send_batch(self.service, messages)
+            await run_in_threadpool(self._with_session, record_results, results)
+        return len(messages)
+
+    async def _loop(self, poll_seconds: float, batch_size: int):
+        while True:
+            try:
+                if await self.drain_once(batch_size):
+                    continue
+            except Exception as e:
+                logger.error(f"Email outbox worker failed: {str(e)}")
+            # Messages are committed by request handlers on other threads, so poll for them
+            await asyncio.sleep(poll_seconds)
+
+email_outbox_worker = EmailOutboxWorker(SessionLocal, email_service)
@@ -0,0 +1,138 @@
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session, joinedload
+
+from ..config import settings
+from .. import models, schemas
+from .availability import ACTIVE_BOOKING_STATUSES
+from .email_outbox import queue_booking_status_update
+from .idempotency import stripe_idempotency_key
+from .stripe_service import StripeService
+
+logger = logging.getLogger(__name__)
+
+def _refund(job: Tuple[int, str, float, str]) -> Tuple[int, Optional[Dict], Optional[str]]:
+    """Refund one booking; runs on a pool thread, so it never touches the session"""
+    booking_id, payment_intent_id, amount, idempotency_key = job
+    try:
+        return booking_id, StripeService.create_refund(payment_intent_id, amount, idempotency_key=idempotency_key), None
+    except Exception as e:
+        logger.error(f"Refund for booking {booking_id} failed: {e}")
+        return booking_id, None, str(e)
+
+def refund_in_parallel(jobs: List[Tuple[int, str, float, str]]) -> Dict[int, Tuple[Optional[Dict], Optional[str]]]:
+    """Issue refunds over a bounded pool, returning (refund, error) per booking id"""
+    if not jobs:
+        return {}
+    workers = max(1, min(settings.HOST_CANCELLATION_REFUND_CONCURRENCY, len(jobs)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="refund") as pool:
+        return {booking_id: (refund, error) for booking_id, refund, error in pool.map(_refund, jobs)}
+
+def _refund_job(booking: models.Booking, host: models.User) -> Tuple[int, str, float, str]:
+    return (
+        booking.id,
+        booking.stripe_payment_intent_id,
+        round(booking.total_price - (booking.refund_amount or 0.0), 2),
+        stripe_idempotency_key(host.id, "host_cancellation", str(booking.id))
+    )
+
+def cancel_listing_bookings(
+    db: Session,
+    listing: models.Listing,
+    host: models.User,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    reason: Optional[str] = None
+) -> schemas.HostCancellationResult:
+    """Cancel a listing's future bookings and refund the paid ones.
+
+    The bookings are locked, cancelled and committed first; paid ones are
+    left ``refund_pending``, so no row lock is held while Stripe is called.
+    Refund outcomes are then recorded in a second short transaction. Paid
+    bookings are refunded in full (less earlier refunds) with an
+    idempotency key per booking, so re-running after a crash or a failed
+    refund retries the ``refund_pending`` ones without refunding twice.
+    Bookings with a payment still in flight are skipped. Guests are emailed
+    through the outbox once their booking is cancelled and refunded.
+    """
+    now = datetime.now()
+    query = db.query(models.Booking).options(joinedload(models.Booking.customer)).filter(
+        models.Booking.listing_id == listing.id,
+        or_(models.Booking.status.in_(ACTIVE_BOOKING_STATUSES), models.Booking.payment_status == "refund_pending"),
+        models.Booking.check_in_date >= now
+    )
+    if start_date or end_date:
+        range_start = datetime.combine(start_date, time.min) if start_date else now
+        range_end = datetime.combine(end_date + timedelta(days=1), time.min) if end_date else datetime.max
+        # Plain comparisons rather than overlapping_bookings_clause, which only matches
+        # active bookings and would drop the cancelled refund_pending ones being retried
+        query = query.filter(models.Booking.check_in_date < range_end, models.Booking.check_out_date > range_start)
+    # Lock the rows so a concurrent payment confirmation or webhook waits for the cancellation
+    bookings = query.order_by(models.Booking.check_in_date).with_for_update(of=models.Booking).all()
+    booking_ids = [booking.id for booking in bookings]
+
+    batch_id = uuid.uuid4().hex
+    outcomes: Dict[int, schemas.BookingCancellationOutcome] = {}
+    refund_jobs = []
+    for booking in bookings:
+        if booking.payment_status == "processing":
+            outcomes[booking.id] = schemas.BookingCancellationOutcome(booking_id=booking.id, outcome="payment_in_progress")
+            continue
+        booking.status = "cancelled"
+        if booking.payment_status in ("paid", "refund_pending") and booking.stripe_payment_intent_id \
+                and booking.total_price - (booking.refund_amount or 0.0) > 0:
+            booking.payment_status = "refund_pending"
+            refund_jobs.append(_refund_job(booking, host))
+        else:
+            outcomes[booking.id] = schemas.BookingCancellationOutcome(booking_id=booking.id, outcome="cancelled")
+            queue_booking_status_update(db, booking, "cancelled", refund_amount=None, reason=reason)
+    db.commit()
+
+    refunds = refund_in_parallel(refund_jobs)
+
+    if refunds:
+        # Re-read under the lock; only refund outcomes are written, the cancellation already stands
+        for booking in db.query(models.Booking).options(joinedload(models.Booking.customer)).filter(
+            models.Booking.id.in_(list(refunds)), models.Booking.payment_status == "refund_pending"
+        ).with_for_update(of=models.Booking).all():
+            refund, error = refunds[booking.id]
+            if error is not None:
+                outcomes[booking.id] = schemas.BookingCancellationOutcome(
+                    booking_id=booking.id, outcome="refund_failed", error=error
+                )
+                continue
+            booking.refund_amount = (booking.refund_amount or 0.0) + refund['amount']
+            booking.payment_status = "refunded"
+            outcomes[booking.id] = schemas.BookingCancellationOutcome(
+                booking_id=booking.id,
+                outcome="refunded",
+                refund_id=refund['refund_id'],
+                refund_amount=refund['amount']
+            )
+            queue_booking_status_update(db, booking, "cancelled", refund_amount=refund['amount'], reason=reason)
+
+    ordered = [outcomes[booking_id] for booking_id in booking_ids if booking_id in outcomes]
+    for outcome in ordered:
+        db.add(models.BookingCancellation(
+            batch_id=batch_id,
+            booking_id=outcome.booking_id,
+            cancelled_by_id=host.id,
+            reason=reason,
+            created_at=datetime.utcnow(),
+            **outcome.dict(exclude={"booking_id"})
+        ))
+    db.commit()
+
+    counts = {key: sum(1 for o in ordered if o.outcome in values) for key, values in (
+        ("cancelled", ("cancelled", "refunded")),
+        ("refunded", ("refunded",)),
+        ("failed", ("refund_failed",)),
+        ("skipped", ("payment_in_progress",))
+    )}
+    logger.info(f"Host {host.id} cancelled bookings on listing {listing.id} (batch {batch_id}): {counts}")
+    return schemas.HostCancellationResult(batch_id=batch_id, outcomes=ordered, **counts)
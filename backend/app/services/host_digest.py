@@ -0,0 +1,89 @@
+import logging
+from datetime import datetime
+from itertools import groupby
+from typing import Dict, Sequence
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from .. import models
+from .email_outbox import enqueue_email
+
+logger = logging.getLogger(__name__)
+
+# Items listed per section; the counts in the email still cover everything
+DIGEST_MAX_ITEMS = 25
+# Keeps the UPDATE marking events digested under parameter limits
+MARK_CHUNK_SIZE = 1000
+
+def _count(number: int, noun: str) -> str:
+    return f"{number} {noun}{'' if number == 1 else 's'}"
+
+def build_host_digests(db: Session, frequencies: Sequence[str]) -> Dict[str, int]:
+    """Queue one digest email per host with undigested events, for hosts on ``frequencies``.
+
+    All events for the window are read in a single query ordered by host
+    and grouped in memory; each host gets one outbox message, rendered
+    once by the sender, and the events are marked in the same
+    transaction so a rerun never sends them twice.
+    """
+    now = datetime.utcnow()
+    rows = db.query(
+        models.HostNotification.id,
+        models.HostNotification.host_id,
+        models.HostNotification.kind,
+        models.HostNotification.payload,
+        models.User.email,
+        models.User.first_name,
+        models.User.notification_digest
+    ).join(
+        models.User, models.User.id == models.HostNotification.host_id
+    ).filter(
+        models.HostNotification.digested_at.is_(None),
+        models.HostNotification.created_at <= now,
+        models.User.notification_digest.in_(frequencies)
+    ).order_by(
+        models.HostNotification.host_id, models.HostNotification.id
+    ).with_for_update(of=models.HostNotification, skip_locked=True).all()
+
+    hosts = 0
+    for _, events in groupby(rows, key=lambda row: row.host_id):
+        events = list(events)
+        first = events[0]
+        bookings = [event.payload for event in events if event.kind == "booking"]
+        reviews = [event.payload for event in events if event.kind == "review"]
+        # Hosts who went back to immediate get their leftovers in an hourly digest
+        period = "daily" if first.notification_digest == "daily" else "hourly"
+        enqueue_email(
+            db, first.email, "host_digest.html",
+            f"Your {period} StayHub summary: {_count(len(bookings), 'new booking')}, {_count(len(reviews), 'new review')}",
+            {
+                "host_name": first.first_name,
+                "period": period,
+                "booking_count": len(bookings),
+                "review_count": len(reviews),
+                "bookings": bookings[:DIGEST_MAX_ITEMS],
+                "reviews": reviews[:DIGEST_MAX_ITEMS]
+            }
+        )
+        hosts += 1
+
+    ids = [row.id for row in rows]
+    for start in range(0, len(ids), MARK_CHUNK_SIZE):
+        db.execute(
+            update(models.HostNotification)
+            .where(models.HostNotification.id.in_(ids[start:start + MARK_CHUNK_SIZE]))
+            .values(digested_at=now)
+            .execution_options(synchronize_session=False)
+        )
+    db.commit()
+
+    if hosts:
+        logger.info(f"Queued {hosts} host digests covering {len(ids)} notifications")
+    return {"hosts": hosts, "notifications": len(ids)}
+
+def run_hourly_digests(db: Session) -> Dict[str, int]:
+    return build_host_digests(db, ("hourly", "immediate"))
+
+def run_daily_digests(db: Session) -> Dict[str, int]:
+    return build_host_digests(db, ("daily",))
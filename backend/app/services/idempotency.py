@@ -0,0 +1,145 @@
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from .. import models
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+def fingerprint(request_data: Any) -> str:
+    """Stable hash of a request body, so a key reused for a different request is caught"""
+    canonical = json.dumps(jsonable_encoder(request_data), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+def stripe_idempotency_key(user_id: int, scope: str, key: Optional[str]) -> Optional[str]:
+    """Key passed on to Stripe, namespaced so two users' keys can never collide"""
+    if not key:
+        return None
+    digest = hashlib.sha256(f"{user_id}:{scope}:{key}".encode()).hexdigest()
+    return f"stayhub-{scope}-{digest}"
+
+# Inserts tried before giving up on a key whose holder keeps releasing it
+CLAIM_ATTEMPTS = 3
+
+def _claim(db: Session, user_id: int, scope: str, key: str, request_hash: str) -> Optional[models.IdempotencyKey]:
+    """Insert the key as in progress, or None when it already exists"""
+    record = models.IdempotencyKey(
+        user_id=user_id,
+        scope=scope,
+        key=key,
+        request_hash=request_hash,
+        status="in_progress",
+        created_at=datetime.utcnow()
+    )
+    db.add(record)
+    try:
+        db.commit()
+        return record
+    except IntegrityError:
+        db.rollback()
+        return None
+
+def _take_over(db: Session, existing: models.IdempotencyKey) -> bool:
+    """Restart an abandoned claim, unless another request restarted or finished it first"""
+    taken = db.query(models.IdempotencyKey).filter(
+        models.IdempotencyKey.id == existing.id,
+        models.IdempotencyKey.status == "in_progress",
+        models.IdempotencyKey.created_at == existing.created_at
+    ).update({"created_at": datetime.utcnow()}, synchronize_session=False)
+    db.commit()
+    return taken == 1
+
+def _begin(db: Session, user_id: int, scope: str, key: str, request_hash: str) -> models.IdempotencyKey:
+    """Claim the key, or return the stored record when it was already used"""
+    if len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters")
+
+    for _ in range(CLAIM_ATTEMPTS):
+        record = _claim(db, user_id, scope, key, request_hash)
+        if record is not None:
+            return record
+
+        existing = db.query(models.IdempotencyKey).filter(
+            models.IdempotencyKey.user_id == user_id,
+            models.IdempotencyKey.scope == scope,
+            models.IdempotencyKey.key == key
+        ).first()
+        if existing is None:
+            # The request holding the key failed and released it in between; claim it again
+            continue
+        if existing.request_hash != request_hash:
+            raise HTTPException(status_code=422, detail=f"{IDEMPOTENCY_HEADER} was already used for a different request")
+        if existing.status == "in_progress":
+            abandoned_before = datetime.utcnow() - timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)
+            if existing.created_at >= abandoned_before:
+                break
+            # The original request died without finishing; only one retry may take over
+            if not _take_over(db, existing):
+                # Another retry restarted or finished it first; look again
+                continue
+        return existing
+
+    raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+
+def run_idempotent(
+    db: Session,
+    user_id: int,
+    scope: str,
+    key: Optional[str],
+    request_data: Any,
+    handler: Callable[[], Any]
+):
+    """Run ``handler`` once per (user, scope, key) and replay its response for repeats.
+
+    Without a key the handler simply runs. Successful responses are stored
+    and replayed with the Idempotent-Replayed header; when the handler
+    fails the key is released, so the client's retry runs it again.
+    """
+    if not key:
+        return handler()
+
+    record = _begin(db, user_id, scope, key, fingerprint(request_data))
+    if record.status == "completed":
+        return JSONResponse(
+            content=record.response_body,
+            status_code=record.response_status,
+            headers={REPLAYED_HEADER: "true"}
+        )
+
+    record_id = record.id
+    try:
+        result = handler()
+    except Exception:
+        db.rollback()
+        db.query(models.IdempotencyKey).filter(models.IdempotencyKey.id == record_id).delete()
+        db.commit()
+        raise
+
+    db.query(models.IdempotencyKey).filter(models.IdempotencyKey.id == record_id).update({
+        "status": "completed",
+        "response_status": 200,
+        "response_body": jsonable_encoder(result),
+        "completed_at": datetime.utcnow()
+    })
+    db.commit()
+    return result
+
+def prune_idempotency_keys(db: Session, ttl: timedelta) -> int:
+    deleted = db.query(models.IdempotencyKey).filter(
+        models.IdempotencyKey.created_at < datetime.utcnow() - ttl
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
@@ -0,0 +1,180 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session, joinedload
+
+from ..config import settings
+from .. import models
+from .email_outbox import queue_booking_confirmation
+from .stripe_service import StripeService
+
+logger = logging.getLogger(__name__)
+
+# Intents are created after their booking; allow for clock skew between us and Stripe
+INTENT_CREATED_SLACK = timedelta(hours=1)
+
+def _candidates(db: Session, since: datetime, until: datetime):
+    """Processing and paid bookings with an intent, created in the window"""
+    return db.query(
+        models.Booking.id,
+        models.Booking.stripe_payment_intent_id,
+        models.Booking.payment_status,
+        models.Booking.total_price
+    ).filter(
+        models.Booking.payment_status.in_(("processing", "paid")),
+        models.Booking.stripe_payment_intent_id.isnot(None),
+        models.Booking.created_at >= since,
+        models.Booking.created_at < until
+    )
+
+def _chunks(items: Iterable[Dict], size: int) -> Iterator[List[Dict]]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _apply(db: Session, booking_ids: List[int], expected_status: str, values: dict) -> int:
+    """Bulk update bookings still in ``expected_status``, so a concurrent webhook wins"""
+    if not booking_ids:
+        return 0
+    result = db.execute(
+        update(models.Booking)
+        .where(models.Booking.id.in_(booking_ids), models.Booking.payment_status == expected_status)
+        .values(**values, updated_at=func.now())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+def _mark_paid(db: Session, booking_ids: List[int]) -> int:
+    """Same transition as the payment_intent.succeeded webhook, for bookings still processing"""
+    if not booking_ids:
+        return 0
+    bookings = db.query(models.Booking).options(
+        joinedload(models.Booking.customer), joinedload(models.Booking.listing)
+    ).filter(
+        models.Booking.id.in_(booking_ids), models.Booking.payment_status == "processing"
+    ).with_for_update(of=models.Booking).all()
+    for booking in bookings:
+        booking.payment_status = "paid"
+        if booking.status == "pending":
+            booking.status = "confirmed"
+        if booking.status == "confirmed":
+            queue_booking_confirmation(db, booking)
+        else:
+            logger.warning(f"Payment succeeded for booking {booking.id} in status {booking.status}")
+    return len(bookings)
+
+def _stale_processing(db: Session, since: datetime, after_id: int, limit: int):
+    """The next page, in id order, of processing bookings created before the window"""
+    return db.query(
+        models.Booking.id,
+        models.Booking.stripe_payment_intent_id
+    ).filter(
+        models.Booking.payment_status == "processing",
+        models.Booking.stripe_payment_intent_id.isnot(None),
+        models.Booking.created_at < since,
+        models.Booking.id > after_id
+    ).order_by(models.Booking.id).limit(limit).all()
+
+def _correct_processing(db: Session, matches: List[Tuple[int, Dict]], summary: Dict[str, int]):
+    """Apply Stripe's outcome to processing bookings, then commit"""
+    succeeded, failed, canceled = [], [], []
+    for booking_id, intent in matches:
+        if intent['status'] == "succeeded":
+            succeeded.append(booking_id)
+        elif intent['status'] == "canceled":
+            canceled.append(booking_id)
+        elif intent['status'] == "requires_payment_method" and intent['has_payment_error']:
+            failed.append(booking_id)
+
+    summary["marked_paid"] += _mark_paid(db, succeeded)
+    summary["marked_failed"] += _apply(db, failed, "processing", {"payment_status": "failed"})
+    summary["marked_canceled"] += _apply(db, canceled, "processing", {"payment_status": "canceled"})
+    db.commit()
+
+def reconcile_payments(
+    db: Session,
+    lookback: timedelta,
+    batch_size: int,
+    list_intents: Callable[[int], Iterable[Dict]] = StripeService.iter_payment_intents,
+    retrieve_intent: Callable[[str], Optional[Dict]] = StripeService.retrieve_payment_intent
+) -> Dict[str, int]:
+    """Correct booking payment states from Stripe's view of their PaymentIntents.
+
+    Intents created in the lookback window are streamed with list
+    pagination, ``batch_size`` at a time; each batch is matched to its
+    bookings with one query and its corrections applied in one transaction,
+    so memory stays bounded by the batch however many intents the window
+    holds. Processing bookings whose intent succeeded become paid (and
+    pending ones confirmed, their confirmation email queued alongside);
+    those whose intent was canceled or failed are marked accordingly. Paid
+    bookings Stripe disagrees with are only reported, since fixing them
+    means moving money.
+
+    A booking stuck in processing longer than the lookback would never show
+    up in that listing, so processing bookings created before the window are
+    then paged in id order, whatever their age, and their intents retrieved
+    one by one. These should be few; listing every intent back to the oldest
+    of them would cost far more. Older paid bookings are not rechecked.
+
+    Bookings whose intent was not found are counted as missing.
+    """
+    until = datetime.now(timezone.utc)
+    since = until - lookback
+    created_gte = int((since - INTENT_CREATED_SLACK).timestamp())
+
+    # Counted up front, before corrections move bookings out of the candidate statuses
+    candidates = _candidates(db, since, until).with_entities(func.count(models.Booking.id)).scalar()
+    summary = {"checked": 0, "marked_paid": 0, "marked_failed": 0, "marked_canceled": 0, "missing": 0, "inconsistent": 0}
+    for batch in _chunks(list_intents(created_gte), batch_size):
+        intents = {intent['id']: intent for intent in batch}
+        rows = _candidates(db, since, until).filter(models.Booking.stripe_payment_intent_id.in_(list(intents))).all()
+        processing = []
+        for booking_id, intent_id, payment_status, total_price in rows:
+            summary["checked"] += 1
+            intent = intents[intent_id]
+            if payment_status == "processing":
+                processing.append((booking_id, intent))
+            elif intent['status'] != "succeeded" or abs(intent['amount_received'] - total_price) >= 0.01:
+                summary["inconsistent"] += 1
+                logger.warning(
+                    f"Booking {booking_id} is paid but intent {intent_id} is {intent['status']} "
+                    f"with {intent['amount_received']} received"
+                )
+        _correct_processing(db, processing, summary)
+
+    summary["missing"] = max(0, candidates - summary["checked"])
+    summary["checked"] += summary["missing"]
+
+    after_id = 0
+    while True:
+        rows = _stale_processing(db, since, after_id, batch_size)
+        if not rows:
+            break
+        after_id = rows[-1][0]
+        processing = []
+        for booking_id, intent_id in rows:
+            summary["checked"] += 1
+            intent = retrieve_intent(intent_id)
+            if intent is None:
+                summary["missing"] += 1
+            else:
+                processing.append((booking_id, intent))
+        _correct_processing(db, processing, summary)
+
+    if any(summary[k] for k in ("marked_paid", "marked_failed", "marked_canceled", "inconsistent")):
+        logger.info(f"Payment reconciliation: {summary}")
+    return summary
+
+def run_payment_reconciliation(db: Session) -> Dict[str, int]:
+    return reconcile_payments(
+        db,
+        lookback=timedelta(days=settings.PAYMENT_RECONCILIATION_LOOKBACK_DAYS),
+        batch_size=settings.PAYMENT_RECONCILIATION_BATCH_SIZE
+    )
@@ -0,0 +1,181 @@
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from ..config import settings
+from .. import models
+
+# Rate rule types
+WEEKDAY = "weekday"                # nightly price on the given weekdays
+DATE_RANGE = "date_range"          # nightly price between start_date and end_date (inclusive)
+LENGTH_OF_STAY = "length_of_stay"  # percentage off stays of at least min_nights
+RULE_TYPES = (WEEKDAY, DATE_RANGE, LENGTH_OF_STAY)
+
+DateLike = Union[date, datetime]
+
+def _as_date(value: DateLike) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+class CompiledRateCalendar:
+    """Dense per-night prices for one version of a listing's rate rules.
+
+    ``cumulative[i]`` holds the price of the first ``i`` nights from
+    ``origin``, so the subtotal of any stay is a single subtraction no matter
+    how long it is, and many stays are priced with one vectorized lookup.
+    """
+
+    def __init__(self, origin: date, nightly: np.ndarray, los_min_nights: np.ndarray, los_discounts: np.ndarray):
+        self.origin = origin
+        self.nightly = nightly
+        self.cumulative = np.concatenate(([0.0], np.cumsum(nightly)))
+        self.los_min_nights = los_min_nights
+        self.los_discounts = los_discounts
+
+    @property
+    def end(self) -> date:
+        return self.origin + timedelta(days=len(self.nightly))
+
+    def covers(self, start: date, end: date) -> bool:
+        return start >= self.origin and end <= self.end
+
+    def _discounts(self, nights: np.ndarray) -> np.ndarray:
+        if not len(self.los_min_nights):
+            return np.zeros(len(nights))
+        # Longest length-of-stay threshold the stay qualifies for
+        idx = np.searchsorted(self.los_min_nights, nights, side="right") - 1
+        return np.where(idx >= 0, self.los_discounts[np.clip(idx, 0, None)], 0.0)
+
+    def quote_offsets(self, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        """Totals for stays given as day offsets from ``origin``"""
+        subtotals = self.cumulative[ends] - self.cumulative[starts]
+        return np.round(subtotals * (1.0 - self._discounts(ends - starts)), 2)
+
+    def quote(self, stays: Sequence[Tuple[date, date]]) -> np.ndarray:
+        offsets = np.array(
+            [((start - self.origin).days, (end - self.origin).days) for start, end in stays],
+            dtype=np.int64
+        ).reshape(-1, 2)
+        return self.quote_offsets(offsets[:, 0], offsets[:, 1])
+
+    def nightly_prices(self, start: date, end: date) -> np.ndarray:
+        return self.nightly[(start - self.origin).days:(end - self.origin).days]
+
+def compile_rate_calendar(
+    base_price: float,
+    rules: Iterable[models.ListingRateRule],
+    start: date,
+    end: date
+) -> CompiledRateCalendar:
+    """Compile rate rules into a price array covering [start, end).
+
+    Weekday rules are applied first and date ranges override them, each in
+    creation order, so a seasonal price wins over a weekend price.
+    """
+    days = (end - start).days
+    nightly = np.full(days, base_price, dtype=np.float64)
+    rules = sorted(rules, key=lambda rule: rule.id or 0)
+
+    weekdays = (start.weekday() + np.arange(days)) % 7
+    for rule in rules:
+        if rule.rule_type == WEEKDAY:
+            nightly[np.isin(weekdays, rule.weekdays or [])] = rule.price
+
+    for rule in rules:
+        if rule.rule_type == DATE_RANGE:
+            lo = max(0, (rule.start_date - start).days)
+            hi = min(days, (rule.end_date - start).days + 1)
+            if lo < hi:
+                nightly[lo:hi] = rule.price
+
+    # Keep the best discount per threshold, thresholds ascending for searchsorted
+    los = {}
+    for rule in rules:
+        if rule.rule_type == LENGTH_OF_STAY:
+            los[rule.min_nights] = max(los.get(rule.min_nights, 0.0), rule.discount_percent / 100.0)
+    thresholds = sorted(los)
+
+    return CompiledRateCalendar(
+        origin=start,
+        nightly=nightly,
+        los_min_nights=np.array(thresholds, dtype=np.int64),
+        los_discounts=np.array([los[t] for t in thresholds], dtype=np.float64)
+    )
+
+class RateCalendarCache:
+    """LRU of compiled calendars keyed by (listing id, pricing version).
+
+    Editing rules or the base price bumps ``Listing.pricing_version``, so
+    stale entries are never hit again and simply age out.
+    """
+
+    def __init__(self, max_size: int, horizon_days: int):
+        self.max_size = max_size
+        self.horizon_days = horizon_days
+        self._entries: "OrderedDict[tuple, CompiledRateCalendar]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, listing: models.Listing, start: date, end: date) -> CompiledRateCalendar:
+        key = (listing.id, listing.pricing_version)
+        with self._lock:
+            calendar = self._entries.get(key)
+            if calendar is not None and calendar.covers(start, end):
+                self._entries.move_to_end(key)
+                return calendar
+
+        # Calendars never reach further than the horizon either side of today,
+        # so no request can make one compile an arbitrarily long array
+        today = date.today()
+        earliest = today - timedelta(days=self.horizon_days)
+        latest = today + timedelta(days=self.horizon_days)
+        if start < earliest or end > latest:
+            raise ValueError(f"Cannot price nights more than {self.horizon_days} days from today")
+
+        origin = min(start, today)
+        if calendar is not None:
+            # Keep past nights already compiled rather than replacing them, within the bound
+            origin = max(min(origin, calendar.origin), earliest)
+
+        calendar = compile_rate_calendar(listing.price_per_night, listing.rate_rules, origin, latest)
+        with self._lock:
+            self._entries[key] = calendar
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return calendar
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+rate_calendar_cache = RateCalendarCache(
+    max_size=settings.PRICING_CACHE_SIZE,
+    horizon_days=settings.PRICING_HORIZON_DAYS
+)
+
+def stay_window_error(check_in_date: DateLike, check_out_date: DateLike) -> Optional[str]:
+    """Why a stay cannot be quoted or booked, or None if it lies within the pricing horizon"""
+    check_in, check_out = _as_date(check_in_date), _as_date(check_out_date)
+    today = date.today()
+    if check_in < today:
+        return "Check-in date cannot be in the past"
+    if check_out > today + timedelta(days=settings.PRICING_HORIZON_DAYS):
+        return f"Check-out date cannot be more than {settings.PRICING_HORIZON_DAYS} days ahead"
+    if (check_out - check_in).days > settings.MAX_STAY_NIGHTS:
+        return f"Stays cannot be longer than {settings.MAX_STAY_NIGHTS} nights"
+    return None
+
+def quote_stays(listing: models.Listing, stays: Sequence[Tuple[DateLike, DateLike]]) -> List[float]:
+    """Price several stays of one listing with a single vectorized lookup"""
+    if not stays:
+        return []
+    stays = [(_as_date(check_in), _as_date(check_out)) for check_in, check_out in stays]
+    start = min(check_in for check_in, _ in stays)
+    end = max(check_out for _, check_out in stays)
+    calendar = rate_calendar_cache.get(listing, start, end)
+    return calendar.quote(stays).tolist()
+
+def quote_stay(listing: models.Listing, check_in_date: DateLike, check_out_date: DateLike) -> float:
+    return quote_stays(listing, [(check_in_date, check_out_date)])[0]
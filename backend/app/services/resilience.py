@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+from fastapi import HTTPException
+
+from ..metrics import DEPENDENCY_DURATION, DEPENDENCY_REJECTED
+
+logger = logging.getLogger(__name__)
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit is open"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable (circuit open)")
+        self.name = name
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """Fail fast while a dependency keeps failing.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    calls raise CircuitOpenError without touching the dependency. Once
+    ``reset_timeout`` has passed one trial call is let through (half-open):
+    success closes the circuit, failure opens it again. Only exceptions for
+    which ``is_failure`` returns True count; a declined card or a missing S3
+    key says nothing about the dependency's health.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        is_failure: Callable[[BaseException], bool] = lambda e: True
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.is_failure = is_failure
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self._state
+
+    def before_call(self):
+        with self._lock:
+            state = self._current_state()
+            if state == self.OPEN or (state == self.HALF_OPEN and self._trial_in_flight):
+                retry_after = max(self.reset_timeout - (time.monotonic() - self._opened_at), 1.0)
+                raise CircuitOpenError(self.name, retry_after)
+            if state == self.HALF_OPEN:
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info(f"Circuit {self.name} closed")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == self.OPEN or self._failures >= self.failure_threshold:
+                if self._current_state() != self.OPEN:
+                    logger.warning(f"Circuit {self.name} opened after {self._failures} failures")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def _record(self, error: Optional[BaseException]):
+        if error is None or not self.is_failure(error):
+            self.record_success()
+        else:
+            self.record_failure()
+
+    def _admit(self) -> float:
+        try:
+            self.before_call()
+        except CircuitOpenError:
+            DEPENDENCY_REJECTED.labels(self.name).inc()
+            raise
+        return time.perf_counter()
+
+    def _finish(self, started: float, error: Optional[BaseException]):
+        outcome = "success" if error is None else ("failure" if self.is_failure(error) else "client_error")
+        DEPENDENCY_DURATION.labels(self.name, outcome).observe(time.perf_counter() - started)
+        self._record(error)
+
+    def call(self, fn: Callable, *args, **kwargs):
+        started = self._admit()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self._finish(started, e)
+            raise
+        self._finish(started, None)
+        return result
+
+    async def call_async(self, fn: Callable, *args, **kwargs):
+        started = self._admit()
+        try:
+            result = await fn(*args, **kwargs)
+        except BaseException as e:
+            self._finish(started, e)
+            raise
+        self._finish(started, None)
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            state = self._current_state()
+            retry_after = None
+            if state == self.OPEN:
+                retry_after = round(self.reset_timeout - (time.monotonic() - self._opened_at), 3)
+            return {
+                "name": self.name,
+                "state": state,
+                "consecutive_failures": self._failures,
+                "failure_threshold": self.failure_threshold,
+                "retry_after": retry_after
+            }
+
+def service_unavailable(error: CircuitOpenError) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=f"{error.name} is temporarily unavailable, please retry later",
+        headers={"Retry-After": str(int(error.retry_after + 0.5))}
+    )
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+def register_breaker(name: str, **kwargs) -> CircuitBreaker:
+    breaker = CircuitBreaker(name, **kwargs)
+    _breakers[name] = breaker
+    return breaker
+
+def get_breakers() -> List[CircuitBreaker]:
+    return list(_breakers.values())
+
+def backoff_delays(attempts: int, base_delay: float, max_delay: float) -> Iterator[float]:
+    """Exponential backoff with full jitter for the retries after the first attempt"""
+    for attempt in range(attempts - 1):
+        yield random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+async def retry_async(
+    fn: Callable,
+    *args,
+    attempts: int,
+    base_delay: float,
+    max_delay: float,
+    retry_if: Callable[[BaseException], bool],
+    **kwargs
+):
+    """Await ``fn`` up to ``attempts`` times, sleeping a jittered backoff between tries.
+
+    Only errors for which ``retry_if`` returns True are retried; an open
+    circuit never is.
+    """
+    delays = backoff_delays(attempts, base_delay, max_delay)
+    while True:
+        try:
+            return await fn(*args, **kwargs)
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            delay = next(delays, None) if retry_if(e) else None
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
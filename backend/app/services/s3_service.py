@@ -3,18 +3,54 @@ import uuid
 import io
 import logging
 import json
+import time
 from typing import List, Optional, Tuple
 from datetime import datetime, timedelta
 import boto3
-from botocore.exceptions import ClientError, NoCredentialsError
+from botocore.config import Config
+from botocore.exceptions import ClientError, NoCredentialsError, BotoCoreError
 from PIL import Image, ExifTags
 import magic
 from fastapi import UploadFile, HTTPException
+from starlette.concurrency import run_in_threadpool
+from opentelemetry import trace
+from opentelemetry.trace import SpanKind
 
 from ..config import settings
+from ..metrics import observe_image_processing
+from ..tracing import traced, tracer
+from .resilience import CircuitOpenError, register_breaker, service_unavailable
 
 logger = logging.getLogger(__name__)
 
+# libmagic identifies image types from the first couple of kilobytes
+MAGIC_HEADER_BYTES = 2048
+
+def _is_s3_outage(error: BaseException) -> bool:
+    # Connection errors and timeouts are BotoCoreErrors; of the API errors only 5xx/throttling count
+    if isinstance(error, BotoCoreError):
+        return True
+    if isinstance(error, ClientError):
+        status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+        return status >= 500 or error.response['Error'].get('Code') in ('SlowDown', 'Throttling')
+    return False
+
+s3_breaker = register_breaker(
+    "s3",
+    failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=settings.CIRCUIT_RESET_SECONDS,
+    is_failure=_is_s3_outage
+)
+
+# Bounded timeouts, a connection pool shared by all request threads and
+# botocore's "standard" retry mode (exponential backoff with jitter)
+s3_client_config = Config(
+    connect_timeout=settings.S3_CONNECT_TIMEOUT_SECONDS,
+    read_timeout=settings.S3_READ_TIMEOUT_SECONDS,
+    max_pool_connections=settings.OUTBOUND_POOL_SIZE,
+    retries={'max_attempts': settings.S3_MAX_ATTEMPTS, 'mode': 'standard'}
+)
+
 class S3Service:
     def __init__(self):
         self.bucket_name = settings.S3_BUCKET_NAME
@@ -29,7 +65,8 @@ class S3Service:
                     endpoint_url=settings.S3_ENDPOINT_URL,
                     aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
                     aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                    region_name=self.region
+                    region_name=self.region,
+                    config=s3_client_config
                 )
             else:
                 # For AWS S3
@@ -37,7 +74,8 @@ class S3Service:
                     's3',
                     aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
                     aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                    region_name=self.region
+                    region_name=self.region,
+                    config=s3_client_config
                 )
         except NoCredentialsError:
             logger.error("AWS credentials not found")
@@ -107,12 +145,12 @@ class S3Service:
         if file_size == 0:
             raise HTTPException(status_code=400, detail="Empty file")
 
-        # Read file content for validation
-        content = file.file.read()
+        # The type is sniffed from the header, so the upload is not read into memory twice
+        header = file.file.read(MAGIC_HEADER_BYTES)
         file.file.seek(0)  # Reset file pointer
         
         # Validate MIME type
-        mime_type = magic.from_buffer(content, mime=True)
+        mime_type = magic.from_buffer(header, mime=True)
         allowed_types = ['image/jpeg', 'image/png', 'image/webp', 'image/gif']
         
         if mime_type not in allowed_types:
@@ -123,13 +161,17 @@ class S3Service:
         
         # Validate that it's actually an image by trying to open it
         try:
-            img = Image.open(io.BytesIO(content))
+            img = Image.open(file.file)
             img.verify()
         except Exception:
             raise HTTPException(status_code=400, detail="Invalid or corrupted image file")
+        finally:
+            file.file.seek(0)
 
+    @traced("image.process")
     def _process_image(self, file_content: bytes, max_width: int = 1920, max_height: int = 1080, quality: int = 85) -> Tuple[bytes, str]:
         """Process and optimize image"""
+        started = time.perf_counter()
         try:
             # Open image
             img = Image.open(io.BytesIO(file_content))
@@ -172,9 +214,17 @@ class S3Service:
             img.save(output, format='JPEG', quality=quality, optimize=True)
             optimized_content = output.getvalue()
             
+            observe_image_processing(time.perf_counter() - started, len(file_content), len(optimized_content))
+            trace.get_current_span().set_attributes({
+                "image.bytes_in": len(file_content),
+                "image.bytes_out": len(optimized_content),
+                "image.width": img.width,
+                "image.height": img.height
+            })
             return optimized_content, 'image/jpeg'
             
         except Exception as e:
+            observe_image_processing(time.perf_counter() - started, len(file_content), None)
             logger.error(f"Image processing error: {str(e)}")
             raise HTTPException(status_code=400, detail="Failed to process image")
 
@@ -206,9 +256,10 @@ class S3Service:
             # Read file content
             content = await file.read()
             
-            # Process image if optimization is enabled
+            # Process image if optimization is enabled; decoding and the upload
+            # block, so both run off the event loop
             if optimize:
-                processed_content, content_type = self._process_image(content)
+                processed_content, content_type = await run_in_threadpool(self._process_image, content)
             else:
                 processed_content = content
                 content_type = file.content_type or 'image/jpeg'
@@ -217,19 +268,24 @@ class S3Service:
             file_key = self._generate_file_key(user_id, listing_id, file.filename or "")
             
             # Upload to S3
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Key=file_key,
-                Body=processed_content,
-                ContentType=content_type,
-                CacheControl='max-age=31536000',  # 1 year cache
-                Metadata={
-                    'user_id': str(user_id),
-                    'listing_id': str(listing_id) if listing_id else '',
-                    'original_filename': file.filename or '',
-                    'upload_date': datetime.utcnow().isoformat()
-                }
-            )
+            with tracer.start_as_current_span("s3.put_object", kind=SpanKind.CLIENT, attributes={
+                "s3.bucket": self.bucket_name, "s3.key": file_key, "s3.bytes": len(processed_content)
+            }):
+                await run_in_threadpool(
+                    s3_breaker.call,
+                    self.s3_client.put_object,
+                    Bucket=self.bucket_name,
+                    Key=file_key,
+                    Body=processed_content,
+                    ContentType=content_type,
+                    CacheControl='max-age=31536000',  # 1 year cache
+                    Metadata={
+                        'user_id': str(user_id),
+                        'listing_id': str(listing_id) if listing_id else '',
+                        'original_filename': file.filename or '',
+                        'upload_date': datetime.utcnow().isoformat()
+                    }
+                )
             
             # Generate public URL
             url = self._get_public_url(file_key)
@@ -244,6 +300,8 @@ class S3Service:
             
         except HTTPException:
             raise
+        except CircuitOpenError as e:
+            raise service_unavailable(e)
         except ClientError as e:
             logger.error(f"S3 upload error: {str(e)}")
             raise HTTPException(status_code=500, detail="Failed to upload image")
@@ -270,6 +328,9 @@ class S3Service:
                 result = await self.upload_image(file, user_id, listing_id)
                 results.append(result)
             except HTTPException as e:
+                if e.status_code == 503:
+                    # Storage is down, the remaining files would fail the same way
+                    raise
                 errors.append(f"File {i+1} ({file.filename}): {e.detail}")
             except Exception as e:
                 errors.append(f"File {i+1} ({file.filename}): Upload failed")
@@ -279,15 +340,17 @@ class S3Service:
         
         return results
 
+    @traced("s3.delete_object", SpanKind.CLIENT)
     def delete_image(self, file_key: str) -> bool:
         """Delete image from S3"""
         try:
-            self.s3_client.delete_object(Bucket=self.bucket_name, Key=file_key)
+            s3_breaker.call(self.s3_client.delete_object, Bucket=self.bucket_name, Key=file_key)
             return True
-        except ClientError as e:
+        except (ClientError, BotoCoreError, CircuitOpenError) as e:
             logger.error(f"S3 delete error: {str(e)}")
             return False
 
+    @traced("s3.delete_objects", SpanKind.CLIENT)
     def delete_multiple_images(self, file_keys: List[str]) -> dict:
         """Delete multiple images from S3"""
         if not file_keys:
@@ -297,7 +360,8 @@ class S3Service:
             # Prepare objects for batch delete
             objects = [{'Key': key} for key in file_keys]
             
-            response = self.s3_client.delete_objects(
+            response = s3_breaker.call(
+                self.s3_client.delete_objects,
                 Bucket=self.bucket_name,
                 Delete={'Objects': objects}
             )
@@ -311,7 +375,7 @@ class S3Service:
                 'errors': errors
             }
             
-        except ClientError as e:
+        except (ClientError, BotoCoreError, CircuitOpenError) as e:
             logger.error(f"S3 batch delete error: {str(e)}")
             return {'deleted': 0, 'failed': len(file_keys)}
 
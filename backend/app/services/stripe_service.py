@@ -1,26 +1,78 @@
 import stripe
-from typing import Dict, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from typing import Dict, Iterator, Optional
 from decimal import Decimal
 from ..config import settings
 from .. import models
+from opentelemetry.trace import SpanKind
+
+from ..tracing import traced
+from .resilience import register_breaker
 
 # Initialize Stripe
 stripe.api_key = settings.STRIPE_SECRET_KEY
+if settings.STRIPE_API_BASE:
+    stripe.api_base = settings.STRIPE_API_BASE
+
+# stripe-python retries connection errors, 409s and 5xx itself, with jittered
+# exponential backoff and an automatic idempotency key on POSTs
+stripe.max_network_retries = settings.STRIPE_MAX_NETWORK_RETRIES
+
+def _pooled_session(pool_size: int) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+# One keep-alive pool shared by every request thread instead of a session per thread
+stripe.default_http_client = stripe.http_client.RequestsClient(
+    timeout=(settings.STRIPE_CONNECT_TIMEOUT_SECONDS, settings.STRIPE_READ_TIMEOUT_SECONDS),
+    session=_pooled_session(settings.OUTBOUND_POOL_SIZE)
+)
+
+def _is_stripe_outage(error: BaseException) -> bool:
+    # Card declines and invalid requests are answers, not outages
+    return isinstance(error, (stripe.error.APIConnectionError, stripe.error.RateLimitError, stripe.error.APIError))
+
+stripe_breaker = register_breaker(
+    "stripe",
+    failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=settings.CIRCUIT_RESET_SECONDS,
+    is_failure=_is_stripe_outage
+)
+
+def _intent_summary(intent) -> Dict:
+    """The fields payment reconciliation reads from a PaymentIntent"""
+    return {
+        'id': intent.id,
+        'status': intent.status,
+        'amount_received': intent.amount_received / 100,  # Convert back from cents
+        'has_payment_error': bool(intent.get('last_payment_error'))
+    }
 
 class StripeService:
     
     @staticmethod
+    @traced("stripe.create_payment_intent", SpanKind.CLIENT)
     def create_payment_intent(
         booking: models.Booking,
         customer_email: str,
-        customer_name: str
+        customer_name: str,
+        idempotency_key: Optional[str] = None
     ) -> Dict:
-        """Create a Stripe Payment Intent for a booking"""
+        """Create a Stripe Payment Intent for a booking
+        
+        With an idempotency key, Stripe returns the original intent for a
+        retried request instead of creating a second one.
+        """
         try:
             # Convert price to cents (Stripe uses smallest currency unit)
             amount_cents = int(booking.total_price * 100)
             
-            intent = stripe.PaymentIntent.create(
+            intent = stripe_breaker.call(
+                stripe.PaymentIntent.create,
                 amount=amount_cents,
                 currency='usd',
                 payment_method_types=['card'],
@@ -31,7 +83,8 @@ class StripeService:
                 },
                 description=f'Payment for booking #{booking.id}',
                 receipt_email=customer_email,
-                statement_descriptor='STAYHUB BOOKING'
+                statement_descriptor='STAYHUB BOOKING',
+                idempotency_key=idempotency_key
             )
             
             return {
@@ -45,10 +98,11 @@ class StripeService:
             raise Exception(f"Stripe error: {str(e)}")
     
     @staticmethod
+    @traced("stripe.confirm_payment", SpanKind.CLIENT)
     def confirm_payment(payment_intent_id: str) -> Dict:
         """Confirm a payment intent"""
         try:
-            intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+            intent = stripe_breaker.call(stripe.PaymentIntent.retrieve, payment_intent_id)
             return {
                 'status': intent.status,
                 'payment_method': intent.charges.data[0].payment_method_details.type if intent.charges.data else None,
@@ -58,14 +112,21 @@ class StripeService:
             raise Exception(f"Stripe error: {str(e)}")
     
     @staticmethod
-    def create_refund(payment_intent_id: str, amount: Optional[float] = None) -> Dict:
+    @traced("stripe.create_refund", SpanKind.CLIENT)
+    def create_refund(
+        payment_intent_id: str,
+        amount: Optional[float] = None,
+        idempotency_key: Optional[str] = None
+    ) -> Dict:
         """Create a refund for a payment"""
         try:
             refund_data = {'payment_intent': payment_intent_id}
             if amount:
                 refund_data['amount'] = int(amount * 100)  # Convert to cents
+            if idempotency_key:
+                refund_data['idempotency_key'] = idempotency_key
             
-            refund = stripe.Refund.create(**refund_data)
+            refund = stripe_breaker.call(stripe.Refund.create, **refund_data)
             
             return {
                 'refund_id': refund.id,
@@ -89,10 +150,48 @@ class StripeService:
             raise Exception("Invalid signature")
     
     @staticmethod
+    def iter_payment_intents(created_gte: int, page_size: int = 100) -> Iterator[Dict]:
+        """Stream every PaymentIntent created since ``created_gte`` (unix seconds)
+        
+        Uses list auto-pagination, so N intents cost N / page_size requests
+        instead of one retrieve each.
+        """
+        try:
+            page = stripe_breaker.call(
+                stripe.PaymentIntent.list,
+                created={'gte': created_gte},
+                limit=page_size
+            )
+            while True:
+                for intent in page.data:
+                    yield _intent_summary(intent)
+                if not page.has_more:
+                    return
+                page = stripe_breaker.call(page.next_page)
+        except stripe.error.StripeError as e:
+            raise Exception(f"Stripe error: {str(e)}")
+    
+    @staticmethod
+    @traced("stripe.retrieve_payment_intent", SpanKind.CLIENT)
+    def retrieve_payment_intent(payment_intent_id: str) -> Optional[Dict]:
+        """Fetch one PaymentIntent in the same shape as ``iter_payment_intents``, or None if Stripe has no such intent"""
+        try:
+            intent = stripe_breaker.call(stripe.PaymentIntent.retrieve, payment_intent_id)
+            return _intent_summary(intent)
+        except stripe.error.InvalidRequestError as e:
+            if e.http_status == 404:
+                return None
+            raise Exception(f"Stripe error: {str(e)}")
+        except stripe.error.StripeError as e:
+            raise Exception(f"Stripe error: {str(e)}")
+    
+    @staticmethod
+    @traced("stripe.get_payment_methods", SpanKind.CLIENT)
     def get_payment_methods(customer_id: str) -> Dict:
         """Get customer's payment methods"""
         try:
-            payment_methods = stripe.PaymentMethod.list(
+            payment_methods = stripe_breaker.call(
+                stripe.PaymentMethod.list,
                 customer=customer_id,
                 type="card"
             )
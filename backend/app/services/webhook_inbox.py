@@ -0,0 +1,215 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased, sessionmaker
+from starlette.concurrency import run_in_threadpool
+
+from ..config import settings
+from ..database import SessionLocal
+from .. import models
+from .email_outbox import queue_booking_confirmation
+
+logger = logging.getLogger(__name__)
+
+# Retry delay doubles per failed attempt, capped
+RETRY_BASE_SECONDS = 5
+RETRY_MAX_SECONDS = 3600
+# Payments a late success or failure event must not override
+SETTLED_PAYMENT_STATUSES = ("paid", "refund_pending", "refunded")
+
+def _payment_intent_id(event) -> Optional[str]:
+    obj = event["data"]["object"]
+    if obj.get("object") == "payment_intent":
+        return obj.get("id")
+    return obj.get("payment_intent")
+
+def record_event(db: Session, event) -> bool:
+    """Store a verified event in the inbox; returns False for a duplicate delivery"""
+    now = datetime.utcnow()
+    db.add(models.WebhookEvent(
+        event_id=event["id"],
+        event_type=event["type"],
+        payment_intent_id=_payment_intent_id(event),
+        stripe_created=event["created"],
+        payload=event["data"]["object"],
+        status="pending",
+        attempts=0,
+        available_at=now,
+        received_at=now
+    ))
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return False
+    return True
+
+def _lock_booking(db: Session, payment_intent_id: str) -> Optional[models.Booking]:
+    return db.query(models.Booking).filter(
+        models.Booking.stripe_payment_intent_id == payment_intent_id
+    ).with_for_update().first()
+
+def handle_payment_succeeded(db: Session, payment_intent: dict):
+    booking = _lock_booking(db, payment_intent["id"])
+    if not booking or booking.payment_status in SETTLED_PAYMENT_STATUSES:
+        return
+    booking.payment_status = "paid"
+    if booking.status == "pending":
+        booking.status = "confirmed"
+    if booking.status == "confirmed":
+        queue_booking_confirmation(db, booking)
+    else:
+        logger.warning(f"Payment succeeded for booking {booking.id} in status {booking.status}")
+    logger.info(f"Payment confirmed via webhook for booking {booking.id}")
+
+def handle_payment_failed(db: Session, payment_intent: dict):
+    booking = _lock_booking(db, payment_intent["id"])
+    # A failed attempt never overrides a later successful one
+    if not booking or booking.payment_status in SETTLED_PAYMENT_STATUSES:
+        return
+    booking.payment_status = "failed"
+    logger.info(f"Payment failed via webhook for booking {booking.id}")
+
+def handle_dispute_created(db: Session, dispute: dict):
+    logger.warning(f"Dispute created for charge: {dispute['charge']}")
+    # You can implement additional logic here like notifying admins
+
+EVENT_HANDLERS: Dict[str, Callable[[Session, dict], None]] = {
+    "payment_intent.succeeded": handle_payment_succeeded,
+    "payment_intent.payment_failed": handle_payment_failed,
+    "charge.dispute.created": handle_dispute_created,
+}
+
+def _claim_next_event(db: Session) -> Optional[models.WebhookEvent]:
+    """Lock the oldest due event whose payment intent has no earlier event still pending.
+
+    Events of one payment intent are therefore applied in Stripe creation
+    order, while different payment intents are processed in parallel. The
+    row lock is held until the event's changes commit, so a concurrent
+    worker neither takes this event nor a later one for the same intent.
+    """
+    earlier = aliased(models.WebhookEvent)
+    blocked = db.query(earlier.id).filter(
+        earlier.payment_intent_id == models.WebhookEvent.payment_intent_id,
+        earlier.status == "pending",
+        or_(
+            earlier.stripe_created < models.WebhookEvent.stripe_created,
+            and_(earlier.stripe_created == models.WebhookEvent.stripe_created, earlier.id < models.WebhookEvent.id)
+        )
+    ).exists()
+    return db.query(models.WebhookEvent).filter(
+        models.WebhookEvent.status == "pending",
+        models.WebhookEvent.available_at <= datetime.utcnow(),
+        ~blocked
+    ).order_by(
+        models.WebhookEvent.stripe_created, models.WebhookEvent.id
+    ).with_for_update(skip_locked=True).first()
+
+def _record_failure(db: Session, event_id: int, error: str):
+    event = db.query(models.WebhookEvent).filter(models.WebhookEvent.id == event_id).with_for_update().first()
+    event.attempts += 1
+    event.last_error = error
+    if event.attempts >= settings.WEBHOOK_MAX_ATTEMPTS:
+        event.status = "failed"
+        logger.error(f"Giving up on webhook event {event.event_id} after {event.attempts} attempts: {error}")
+    else:
+        delay = min(RETRY_BASE_SECONDS * 2 ** (event.attempts - 1), RETRY_MAX_SECONDS)
+        event.available_at = datetime.utcnow() + timedelta(seconds=delay)
+    db.commit()
+
+def process_next_event(db: Session) -> bool:
+    """Apply one inbox event; returns False when nothing is due"""
+    event = _claim_next_event(db)
+    if event is None:
+        db.rollback()
+        return False
+
+    event_id = event.id
+    try:
+        handler = EVENT_HANDLERS.get(event.event_type)
+        if handler is None:
+            logger.info(f"Unhandled event type: {event.event_type}")
+        else:
+            handler(db, event.payload)
+        event.status = "processed"
+        event.processed_at = datetime.utcnow()
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Failed to process webhook event {event_id}: {str(e)}")
+        _record_failure(db, event_id, str(e))
+    return True
+
+def process_pending_events(db: Session, limit: int = 1000) -> int:
+    """Drain due inbox events; returns how many were attempted"""
+    count = 0
+    while count < limit and process_next_event(db):
+        count += 1
+    return count
+
+def prune_processed_events(db: Session, retention: timedelta) -> int:
+    """Delete processed events once Stripe can no longer redeliver them"""
+    deleted = db.query(models.WebhookEvent).filter(
+        models.WebhookEvent.status == "processed",
+        models.WebhookEvent.received_at < datetime.utcnow() - retention
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+class WebhookInboxWorker:
+    """Pool of event-loop tasks draining the inbox, each applying events in the threadpool.
+
+    The webhook endpoint calls ``notify`` after storing an event so it is
+    usually applied right away; polling picks up retries and events stored
+    by other replicas.
+    """
+
+    def __init__(self, session_factory: sessionmaker):
+        self.session_factory = session_factory
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def configure(self, session_factory: sessionmaker):
+        self.session_factory = session_factory
+
+    async def start(self, concurrency: int, poll_seconds: float):
+        self._wakeup = asyncio.Event()
+        for _ in range(concurrency):
+            self._tasks.append(asyncio.create_task(self._loop(poll_seconds)))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        self._wakeup = None
+
+    def notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _process_one(self) -> bool:
+        db = self.session_factory()
+        try:
+            return process_next_event(db)
+        finally:
+            db.close()
+
+    async def _loop(self, poll_seconds: float):
+        while True:
+            try:
+                if await run_in_threadpool(self._process_one):
+                    continue
+            except Exception as e:
+                logger.error(f"Webhook inbox worker failed: {str(e)}")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+webhook_worker = WebhookInboxWorker(SessionLocal)
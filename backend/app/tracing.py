@@ -0,0 +1,188 @@
+"""OpenTelemetry tracing.
+
+Code creates spans through the OpenTelemetry API (``tracer``, ``traced``),
+which does nothing until ``configure_tracing`` installs an SDK provider;
+with TRACING_EXPORTER=none the SDK is never imported and main.py skips
+the request middleware and SQL hooks.
+
+Sampling is decided once per trace: requests arriving with a W3C
+``traceparent`` follow the caller's decision, new traces are kept at
+TRACING_SAMPLE_RATE. Behind nginx every request arrives with one: nginx
+replaces whatever the client sent with a traceparent of its own (trace id
+from its request id, sampled at the rate set there), so outside callers
+cannot force sampling and access logs line up with traces. Spans of
+unsampled traces are non-recording, so the SQL hooks bail out before doing
+any work.
+
+Exporters:
+
+- ``console``: spans printed to stdout
+- ``file``: one JSON span per line in TRACING_FILE_PATH, for offline use
+- ``otlp``: OTLP/HTTP to a collector at TRACING_OTLP_ENDPOINT (needs
+  opentelemetry-exporter-otlp-proto-http)
+"""
+import functools
+import inspect
+import logging
+import os
+from typing import Optional
+
+from opentelemetry import propagate, trace
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import settings
+from .query_log import normalize_sql
+
+logger = logging.getLogger(__name__)
+
+TRACE_ID_HEADER = "X-Trace-Id"
+
+tracer = trace.get_tracer("stayhub")
+_provider = None
+
+def configure_tracing(span_processor=None) -> bool:
+    """Install the SDK provider for TRACING_EXPORTER; returns whether tracing is on.
+
+    ``span_processor`` replaces the configured exporter (tests use an
+    in-memory one).
+    """
+    global _provider
+    if span_processor is None and settings.TRACING_EXPORTER == "none":
+        return False
+
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+    if span_processor is None:
+        if settings.TRACING_EXPORTER == "console":
+            exporter = ConsoleSpanExporter()
+        elif settings.TRACING_EXPORTER == "file":
+            exporter = ConsoleSpanExporter(
+                out=open(settings.TRACING_FILE_PATH, "a"),
+                formatter=lambda span: span.to_json(indent=None) + os.linesep
+            )
+        elif settings.TRACING_EXPORTER == "otlp":
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            exporter = OTLPSpanExporter(endpoint=settings.TRACING_OTLP_ENDPOINT)
+        else:
+            raise ValueError(f"Unknown TRACING_EXPORTER {settings.TRACING_EXPORTER!r}")
+        span_processor = BatchSpanProcessor(exporter)
+
+    _provider = TracerProvider(
+        resource=Resource.create({"service.name": settings.TRACING_SERVICE_NAME}),
+        sampler=ParentBased(TraceIdRatioBased(settings.TRACING_SAMPLE_RATE))
+    )
+    _provider.add_span_processor(span_processor)
+    trace.set_tracer_provider(_provider)
+    logger.info(f"Tracing to {settings.TRACING_EXPORTER} at sample rate {settings.TRACING_SAMPLE_RATE}")
+    return True
+
+def shutdown_tracing():
+    """Flush spans still queued for export"""
+    if _provider is not None:
+        _provider.shutdown()
+
+def traced(name: str, kind: SpanKind = SpanKind.INTERNAL, **attributes):
+    """Run the decorated function (sync or async) in a span; exceptions mark it as failed"""
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.start_as_current_span(name, kind=kind, attributes=attributes):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with tracer.start_as_current_span(name, kind=kind, attributes=attributes):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is None or not trace.get_current_span().is_recording():
+        return
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "SQL"
+    context._otel_span = tracer.start_span(
+        f"db {operation}",
+        kind=SpanKind.CLIENT,
+        attributes={
+            "db.system": conn.engine.dialect.name,
+            "db.operation": operation,
+            "db.statement": normalize_sql(statement)
+        }
+    )
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    span = getattr(context, "_otel_span", None)
+    if span is not None:
+        if cursor.rowcount is not None and cursor.rowcount >= 0:
+            span.set_attribute("db.rows", cursor.rowcount)
+        span.end()
+        context._otel_span = None
+
+def _handle_error(exception_context):
+    span = getattr(exception_context.execution_context, "_otel_span", None)
+    if span is not None:
+        span.record_exception(exception_context.original_exception)
+        span.set_status(Status(StatusCode.ERROR, type(exception_context.original_exception).__name__))
+        span.end()
+        exception_context.execution_context._otel_span = None
+
+def instrument_engine(engine: Engine):
+    """A client span per statement, as a child of whatever span is current"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+class TracingMiddleware:
+    """Server span per request, continuing the caller's W3C trace context.
+
+    The span is current for the whole request; sync endpoints run in the
+    threadpool with a copy of the context, so their SQL and outbound
+    calls are children of it. It is renamed to the route template once
+    routing has matched.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        parent = propagate.extract(Headers(scope=scope))
+        with tracer.start_as_current_span(
+            f"{method} {scope['path']}",
+            context=parent,
+            kind=SpanKind.SERVER,
+            attributes={"http.method": method, "http.target": scope["path"]}
+        ) as span:
+            status_code = 500
+
+            async def send_wrapper(message: Message):
+                nonlocal status_code
+                if message["type"] == "http.response.start":
+                    status_code = message["status"]
+                    if span.is_recording():
+                        MutableHeaders(scope=message).append(TRACE_ID_HEADER, format(span.get_span_context().trace_id, "032x"))
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route: Optional[str] = getattr(scope.get("route"), "path", None)
+                if route:
+                    span.update_name(f"{method} {route}")
+                    span.set_attribute("http.route", route)
+                span.set_attribute("http.status_code", status_code)
+                if status_code >= 500:
+                    span.set_status(Status(StatusCode.ERROR))
@@ -0,0 +1,17 @@
+from jose import jwt
+
+from app.auth import create_access_token
+from app.config import settings
+
+
+class BenchTokens:
+    """JWT work done on login and on every authenticated request"""
+
+    def bench_encode_access_token(self, benchmark):
+        assert benchmark(create_access_token, data={"sub": "user1@example.com"})
+
+    def bench_decode_access_token(self, benchmark):
+        token = create_access_token(data={"sub": "user1@example.com"})
+
+        payload = benchmark(jwt.decode, token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        assert payload["sub"] == "user1@example.com"
@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta
+
+from app import models
+from app.routers.bookings import check_availability
+from app.routers.listings import get_listings
+from app.services.availability import ACTIVE_BOOKING_STATUSES
+
+
+class BenchAvailability:
+    """Overlap checks at growing bookings table sizes"""
+
+    def bench_check_availability_free(self, benchmark, seeded_db):
+        listing_id = seeded_db.info["manifest"]["listings"] // 2
+        check_in = datetime.now() + timedelta(days=400)
+
+        assert benchmark(check_availability, seeded_db, listing_id, check_in, check_in + timedelta(days=3))
+
+    def bench_check_availability_taken(self, benchmark, seeded_db):
+        booking = seeded_db.query(models.Booking).filter(
+            models.Booking.status.in_(ACTIVE_BOOKING_STATUSES)
+        ).order_by(models.Booking.id).first()
+
+        assert not benchmark(
+            check_availability, seeded_db, booking.listing_id, booking.check_in_date, booking.check_out_date
+        )
+
+    def bench_search_with_dates(self, benchmark, seeded_db):
+        check_in = (datetime.now() + timedelta(days=14)).strftime("%Y-%m-%d")
+        check_out = (datetime.now() + timedelta(days=17)).strftime("%Y-%m-%d")
+
+        listings = benchmark(
+            get_listings, location="Lisbon", check_in_date=check_in, check_out_date=check_out, guests=2, db=seeded_db
+        )
+        assert listings
@@ -0,0 +1,32 @@
+import io
+
+import pytest
+from PIL import Image
+
+from app.services.s3_service import S3Service
+
+SIZES = {"800x600": (800, 600), "1920x1080": (1920, 1080), "4032x3024": (4032, 3024)}
+
+
+def photo_like(size, fmt: str) -> bytes:
+    """Detailed, deterministic content, so encoders do real work; PNG keeps an alpha channel"""
+    detail = Image.effect_mandelbrot(size, (-2.0, -1.25, 1.0, 1.25), 80)
+    gradient = Image.linear_gradient("L").resize(size)
+    mode, bands = ("RGBA", (detail, gradient, detail.transpose(Image.Transpose.FLIP_LEFT_RIGHT), gradient)) \
+        if fmt == "PNG" else ("RGB", (detail, gradient, detail.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    output = io.BytesIO()
+    Image.merge(mode, bands).save(output, format=fmt)
+    return output.getvalue()
+
+
+class BenchImageProcessing:
+    """Upload processing: decode, orientation, flatten, resize and JPEG encode"""
+
+    @pytest.mark.parametrize("fmt", ["JPEG", "PNG", "WEBP"])
+    @pytest.mark.parametrize("size", SIZES, ids=str)
+    def bench_process_image(self, benchmark, size, fmt):
+        content = photo_like(SIZES[size], fmt)
+        service = S3Service.__new__(S3Service)
+
+        processed, extension = benchmark(service._process_image, content)
+        assert extension and processed
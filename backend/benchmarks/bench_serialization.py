@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import models, schemas
+
+NOW = datetime(2030, 1, 1, 12, 0, 0)
+
+
+def make_user(user_id: int, is_host: bool = False) -> models.User:
+    return models.User(
+        id=user_id, email=f"user{user_id}@example.com", username=f"user{user_id}", hashed_password="x",
+        first_name="Ana", last_name="Silva", phone="+15550000000", is_host=is_host, is_admin=False,
+        notification_digest="immediate", created_at=NOW
+    )
+
+
+def make_listing(num_reviews: int) -> models.Listing:
+    host = make_user(1, is_host=True)
+    listing = models.Listing(
+        id=1, title="Sunny Loft in Lisbon", description="A bright loft. " * 20, price_per_night=120.0,
+        location="Lisbon, Portugal", address="12 Main Street", latitude=38.72, longitude=-9.14, max_guests=4,
+        bedrooms=2, bathrooms=1, amenities=["wifi", "kitchen", "washer", "workspace"],
+        images=[f"https://cdn.example.com/listings/1/{i}.jpg" for i in range(8)], is_active=True,
+        pricing_version=1, host_id=host.id, host=host, created_at=NOW
+    )
+    listing.reviews = [
+        models.Review(
+            id=i, listing_id=1, reviewer_id=100 + i, host_id=host.id, rating=1 + i % 5,
+            comment="Great stay, would book again.", created_at=NOW, reviewer=make_user(100 + i)
+        )
+        for i in range(num_reviews)
+    ]
+    return listing
+
+
+def make_booking(booking_id: int, listing: models.Listing) -> models.Booking:
+    check_in = NOW + timedelta(days=booking_id)
+    return models.Booking(
+        id=booking_id, listing_id=1, customer_id=2, check_in_date=check_in, check_out_date=check_in + timedelta(days=3),
+        total_price=360.0, guest_count=2, status="confirmed", special_requests=None,
+        stripe_payment_intent_id=f"pi_{booking_id}", payment_status="paid", payment_method="card", refund_amount=0.0,
+        created_at=NOW, listing=listing, customer=make_user(2)
+    )
+
+
+def listing_with_reviews(listing: models.Listing) -> schemas.ListingWithReviews:
+    """What GET /listings/{id} builds"""
+    reviews = listing.reviews
+    listing_dict = schemas.Listing.from_orm(listing).dict()
+    listing_dict["reviews"] = reviews
+    listing_dict["average_rating"] = sum(review.rating for review in reviews) / len(reviews) if reviews else None
+    return schemas.ListingWithReviews(**listing_dict)
+
+
+class BenchListingSerialization:
+    """Listing detail responses with nested host and reviewers"""
+
+    @pytest.mark.parametrize("num_reviews", [0, 10, 100])
+    def bench_build_listing_with_reviews(self, benchmark, num_reviews):
+        listing = make_listing(num_reviews)
+
+        result = benchmark(listing_with_reviews, listing)
+        assert len(result.reviews) == num_reviews
+
+    @pytest.mark.parametrize("num_reviews", [0, 10, 100])
+    def bench_dump_listing_with_reviews(self, benchmark, num_reviews):
+        model = listing_with_reviews(make_listing(num_reviews))
+
+        assert benchmark(model.model_dump_json)
+
+
+class BenchBookingSerialization:
+    """Booking responses with nested listing and guest, one and a page of them"""
+
+    def bench_validate_booking(self, benchmark):
+        booking = make_booking(1, make_listing(0))
+
+        assert benchmark(schemas.Booking.model_validate, booking).id == 1
+
+    def bench_validate_booking_page(self, benchmark):
+        listing = make_listing(0)
+        bookings = [make_booking(i, listing) for i in range(50)]
+
+        result = benchmark(lambda: [schemas.Booking.model_validate(booking).model_dump(mode="json") for booking in bookings])
+        assert len(result) == 50
@@ -0,0 +1,30 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from tools import datagen
+
+# Bookings in the seeded database; listings, users and reviews scale with it
+BOOKING_SIZES = [1000, 10000, 100000]
+
+
+@pytest.fixture(scope="module", params=BOOKING_SIZES, ids=lambda size: f"{size}_bookings")
+def seeded_db(request, tmp_path_factory):
+    """A session on a tools.datagen database, once per size.
+
+    SQLite in a temp dir by default; BENCHMARK_DATABASE_URL points at a
+    disposable migrated PostgreSQL database instead (it is truncated).
+    """
+    bookings = request.param
+    counts = {"users": max(100, bookings // 5), "listings": max(20, bookings // 20), "bookings": bookings, "reviews": bookings // 2}
+    url = os.environ.get("BENCHMARK_DATABASE_URL") or f"sqlite:///{tmp_path_factory.mktemp('bench')}/bench.db"
+    engine = create_engine(url)
+    manifest = datagen.load(engine, counts, reset=True)
+
+    db = sessionmaker(bind=engine)()
+    db.info["manifest"] = manifest
+    yield db
+    db.close()
+    engine.dispose()
@@ -24,6 +24,11 @@ except subprocess.CalledProcessError as e:
     sys.exit(1)
 "
 
+# Workers share metrics through files here; clear out the previous run's
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/stayhub-metrics}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 # Start the application
 echo "🎯 Starting FastAPI application..."
 exec uvicorn app.main:app --host 0.0.0.0 --port 8000 --workers 4 
\ No newline at end of file
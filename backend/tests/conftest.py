@@ -1,8 +1,10 @@
 import pytest
 import asyncio
+import subprocess
+from contextlib import contextmanager
 from typing import Generator, Any
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 import tempfile
@@ -10,12 +12,23 @@ import os
 
 from app.main import app
 from app.database import get_db, Base
+from app.replicas import get_read_db
 from app import models
 from app.auth import get_password_hash, create_access_token
+from app.services.pricing import rate_calendar_cache
+from app.scheduler import scheduler
+from app import query_log
 
 # Test database URL - using SQLite for tests
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 
+# Disposable PostgreSQL database for tests marked postgres; its public schema is dropped
+POSTGRES_URL = os.environ.get("TEST_POSTGRES_URL")
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# tools/datagen.py counts small enough for the load and stress tests to seed per test
+TINY_DATASET = {"users": 40, "listings": 12, "bookings": 60, "reviews": 50}
+
 # Create test engine
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
@@ -38,8 +51,60 @@ def override_get_db():
         db.close()
 
 
-# Override the database dependency
+# Override the database dependencies; reads go to the same test database
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
+
+# Time test database statements like the app's engine
+query_log.instrument_engine(engine)
+
+# Scheduled jobs run against the test database too
+scheduler.configure(engine, TestingSessionLocal)
+
+
+@contextmanager
+def app_database(engine):
+    """Serve the app's primary and read sessions from ``engine`` inside the block"""
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    previous = dict(app.dependency_overrides)
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    try:
+        yield SessionLocal
+    finally:
+        app.dependency_overrides.clear()
+        app.dependency_overrides.update(previous)
+        rate_calendar_cache.clear()
+
+
+@pytest.fixture(scope="module")
+def postgres_engine():
+    """Engine on TEST_POSTGRES_URL with the schema built by the real migrations"""
+    if not POSTGRES_URL:
+        pytest.skip("TEST_POSTGRES_URL not set")
+
+    engine = create_engine(POSTGRES_URL, pool_size=20)
+    with engine.begin() as conn:
+        conn.execute(text("DROP SCHEMA public CASCADE"))
+        conn.execute(text("CREATE SCHEMA public"))
+    subprocess.run(
+        ["alembic", "upgrade", "head"],
+        cwd=BACKEND_DIR,
+        env={**os.environ, "DATABASE_URL": POSTGRES_URL},
+        check=True,
+        capture_output=True
+    )
+
+    yield engine
+    engine.dispose()
 
 
 @pytest.fixture(scope="session")
@@ -63,6 +128,8 @@ def db_session():
         db.close()
         # Drop tables after test
         Base.metadata.drop_all(bind=engine)
+        # Listing ids are reused across tests, so drop compiled rate calendars too
+        rate_calendar_cache.clear()
 
 
 @pytest.fixture(scope="function")
@@ -262,4 +329,55 @@ def mock_s3_service(monkeypatch):
     
     mock_service = MockS3Service()
     monkeypatch.setattr("app.services.s3_service.s3_service", mock_service)
-    return mock_service 
\ No newline at end of file
+    return mock_service
+
+
+@pytest.fixture
+def test_admin(db_session):
+    """Create an admin user in the database"""
+    user = models.User(
+        email="admin@example.com",
+        username="testadmin",
+        hashed_password=get_password_hash("adminpassword123"),
+        first_name="Test",
+        last_name="Admin",
+        is_admin=True
+    )
+    db_session.add(user)
+    db_session.commit()
+    db_session.refresh(user)
+    return user
+
+
+@pytest.fixture
+def admin_auth_headers(test_admin):
+    """Create authentication headers for admin user"""
+    token = create_access_token(data={"sub": test_admin.email})
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def fake_stripe(monkeypatch):
+    """Point the Stripe client at the in-memory tools/fake_stripe.py server"""
+    import stripe
+    from app.services import stripe_service
+    from app.services.resilience import CircuitBreaker
+    from tools.fake_stripe import FakeStripe
+
+    with FakeStripe() as fake:
+        monkeypatch.setattr(stripe, "api_key", "sk_test_fake")
+        monkeypatch.setattr(stripe, "api_base", fake.url)
+        monkeypatch.setattr(stripe, "max_network_retries", 0)
+        monkeypatch.setattr(stripe, "default_http_client", stripe.http_client.RequestsClient(timeout=5))
+        monkeypatch.setattr(
+            stripe_service, "stripe_breaker", CircuitBreaker("stripe", is_failure=stripe_service._is_stripe_outage)
+        )
+        yield fake
+
+
+@pytest.fixture
+def dataset(db_session):
+    """A seeded tools/datagen.py dataset in the test database"""
+    from tools import datagen
+
+    return datagen.load(db_session.get_bind(), dict(TINY_DATASET), seed=7)
@@ -0,0 +1,113 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.config import settings
+from app.database import make_engine
+from app.scheduler import Scheduler, scheduler
+from tests.conftest import POSTGRES_URL
+
+
+class TestAdminJobs:
+    """Test admin job scheduler endpoints"""
+
+    def test_jobs_require_admin(self, client: TestClient, auth_headers):
+        """Test non-admin users cannot see jobs"""
+        response = client.get("/admin/jobs", headers=auth_headers)
+        assert response.status_code == 403
+
+    def test_list_jobs(self, client: TestClient, admin_auth_headers):
+        """Test listing registered jobs"""
+        response = client.get("/admin/jobs", headers=admin_auth_headers)
+        assert response.status_code == 200
+        jobs = {job["name"]: job for job in response.json()}
+        assert "booking_lifecycle" in jobs
+        assert jobs["booking_lifecycle"]["last_run"] is None
+
+    def test_run_job_records_history(self, client: TestClient, admin_auth_headers):
+        """Test a manual run is recorded with its result and duration"""
+        response = client.post("/admin/jobs/booking_lifecycle/run", headers=admin_auth_headers)
+        assert response.status_code == 200
+        run = response.json()
+        assert run["status"] == "succeeded"
+        assert run["result"] == {"expired": 0, "completed": 0}
+        assert run["duration_ms"] is not None
+
+        response = client.get("/admin/jobs/booking_lifecycle/runs", headers=admin_auth_headers)
+        assert response.status_code == 200
+        assert [r["id"] for r in response.json()] == [run["id"]]
+
+        response = client.get("/admin/jobs", headers=admin_auth_headers)
+        jobs = {job["name"]: job for job in response.json()}
+        assert jobs["booking_lifecycle"]["last_run"]["id"] == run["id"]
+
+    def test_run_unknown_job(self, client: TestClient, admin_auth_headers):
+        """Test running a job that is not registered"""
+        response = client.post("/admin/jobs/nope/run", headers=admin_auth_headers)
+        assert response.status_code == 404
+
+    def test_scheduled_run_skipped_within_interval(self, client: TestClient, admin_auth_headers, db_session):
+        """Test a scheduled run is skipped when another worker already ran the job this interval"""
+        first = asyncio.run(scheduler.run_job("booking_lifecycle"))
+        assert first is not None
+
+        second = asyncio.run(scheduler.run_job("booking_lifecycle"))
+        assert second is None
+        assert db_session.query(models.JobRun).count() == 1
+
+        # Forced runs ignore the interval
+        forced = asyncio.run(scheduler.run_job("booking_lifecycle", force=True))
+        assert forced is not None
+
+    def test_failed_job_is_recorded(self, db_session):
+        """Test a job that raises is recorded as failed"""
+        @scheduler.job("always_fails", interval_seconds=0)
+        def always_fails(db):
+            raise RuntimeError("boom")
+
+        try:
+            run_id = asyncio.run(scheduler.run_job("always_fails"))
+            run = db_session.query(models.JobRun).filter(models.JobRun.id == run_id).first()
+            assert run.status == "failed"
+            assert run.error == "boom"
+        finally:
+            del scheduler.jobs["always_fails"]
+
+
+@pytest.mark.postgres
+class TestSchedulerLocks:
+    """Test the advisory lock lets one worker at a time run a job on PostgreSQL"""
+
+    def _worker(self):
+        engine = make_engine(POSTGRES_URL)
+        return Scheduler(engine, sessionmaker(autocommit=False, autoflush=False, bind=engine))
+
+    @pytest.mark.parametrize("pgbouncer", [False, True], ids=["session_lock", "pgbouncer_xact_lock"])
+    def test_second_worker_excluded(self, postgres_engine, monkeypatch, pgbouncer):
+        """Test a second worker is skipped while the first runs the job, and can run it afterwards"""
+        monkeypatch.setattr(settings, "DB_PGBOUNCER_TRANSACTION_MODE", pgbouncer)
+        monkeypatch.setattr(settings, "DB_STATEMENT_TIMEOUT_MS", 15000)
+        first, second = self._worker(), self._worker()
+        seen = {}
+
+        def locked_job(db):
+            # Statement timeout comes from the startup option, or the begin listener under PgBouncer
+            seen["statement_timeout"] = db.execute(text("SHOW statement_timeout")).scalar()
+            seen["second_run"] = asyncio.run(second.run_job("locked_job", force=True))
+            return {}
+
+        for worker in (first, second):
+            worker.job("locked_job", interval_seconds=0)(locked_job)
+        try:
+            assert asyncio.run(first.run_job("locked_job", force=True)) is not None
+            assert seen == {"statement_timeout": "15s", "second_run": None}
+
+            # The lock was released with the run, in either mode
+            second.jobs["locked_job"].func = lambda db: {}
+            assert asyncio.run(second.run_job("locked_job", force=True)) is not None
+        finally:
+            first.engine.dispose()
+            second.engine.dispose()
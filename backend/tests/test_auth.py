@@ -179,4 +179,101 @@ class TestAuthHost:
         
         assert response.status_code == 200
         data = response.json()
-        assert data["is_host"] is False 
\ No newline at end of file
+        assert data["is_host"] is False 
+
+
+class TestAuthRefresh:
+    """Test refresh token rotation"""
+    
+    def _login(self, client: TestClient, test_user_data):
+        response = client.post("/auth/login", json={
+            "email": test_user_data["email"],
+            "password": test_user_data["password"]
+        })
+        assert response.status_code == 200
+        return response.json()
+    
+    def test_login_returns_refresh_token(self, client: TestClient, test_user_data, test_user):
+        """Test that login issues a refresh token"""
+        data = self._login(client, test_user_data)
+        
+        assert data["refresh_token"]
+    
+    def test_refresh_rotates_token(self, client: TestClient, test_user_data, test_user):
+        """Test that refreshing returns a new access and refresh token"""
+        tokens = self._login(client, test_user_data)
+        
+        response = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["refresh_token"] != tokens["refresh_token"]
+        
+        me = client.get("/auth/me", headers={"Authorization": f"Bearer {data['access_token']}"})
+        assert me.status_code == 200
+        assert me.json()["email"] == test_user_data["email"]
+    
+    def test_refresh_token_reuse_revokes_family(self, client: TestClient, test_user_data, test_user):
+        """Test that replaying a rotated token revokes every token in its family"""
+        tokens = self._login(client, test_user_data)
+        rotated = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).json()
+        
+        reuse = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+        assert reuse.status_code == 401
+        
+        response = client.post("/auth/refresh", json={"refresh_token": rotated["refresh_token"]})
+        assert response.status_code == 401
+    
+    def test_refresh_invalid_token(self, client: TestClient):
+        """Test refreshing with an unknown token"""
+        response = client.post("/auth/refresh", json={"refresh_token": "not-a-token"})
+        
+        assert response.status_code == 401
+    
+    def test_logout_revokes_refresh_token(self, client: TestClient, test_user_data, test_user):
+        """Test that logout invalidates the refresh token"""
+        tokens = self._login(client, test_user_data)
+        
+        response = client.post("/auth/logout", json={"refresh_token": tokens["refresh_token"]})
+        assert response.status_code == 200
+        
+        response = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+        assert response.status_code == 401
+
+
+class TestPasswordHashingPool:
+    """Test the bcrypt process pool sheds load and survives worker crashes"""
+    
+    def test_saturated_pool_returns_503(self, client: TestClient, test_user_data, test_user, monkeypatch):
+        """Test a login beyond the in-flight limit is rejected with Retry-After"""
+        from app.auth import password_hasher
+        monkeypatch.setattr(password_hasher, "_in_flight", password_hasher.max_in_flight)
+        
+        response = client.post("/auth/login", json={
+            "email": test_user_data["email"],
+            "password": test_user_data["password"]
+        })
+        
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == str(password_hasher.retry_after)
+    
+    def test_broken_pool_is_rebuilt(self):
+        """Test a pool whose worker died is replaced and the hash retried on the new one"""
+        import asyncio
+        import os
+        from app.services.password_hashing import PasswordHasher, check_password
+        
+        hasher = PasswordHasher(max_workers=1, max_pending=1)
+        try:
+            broken = hasher._get_executor()
+            # Kill the worker, which breaks the pool for every later submit
+            with pytest.raises(Exception):
+                broken.submit(os._exit, 1).result()
+            
+            hashed = asyncio.run(hasher.hash("correct horse"))
+            
+            assert check_password("correct horse", hashed)
+            assert hasher._executor is not None and hasher._executor is not broken
+            assert hasher.in_flight == 0
+        finally:
+            hasher.shutdown()
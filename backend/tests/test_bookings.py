@@ -2,6 +2,8 @@ import pytest
 from datetime import datetime, timedelta
 from fastapi.testclient import TestClient
 
+from app.config import settings
+
 
 class TestBookingsCRUD:
     """Test booking CRUD operations"""
@@ -100,6 +102,23 @@ class TestBookingsCRUD:
         assert response.status_code == 400
         assert "Check-in date cannot be in the past" in response.json()["detail"]
     
+    def test_create_booking_beyond_horizon(self, client: TestClient, auth_headers, test_listing):
+        """Test bookings past the pricing horizon or longer than the stay limit are refused"""
+        far = datetime.now() + timedelta(days=settings.PRICING_HORIZON_DAYS)
+        soon = datetime.now() + timedelta(days=7)
+        for check_in, check_out in [
+            (far - timedelta(days=1), far + timedelta(days=2)),
+            (soon, soon + timedelta(days=settings.MAX_STAY_NIGHTS + 1)),
+        ]:
+            response = client.post("/bookings/", json={
+                "listing_id": test_listing.id,
+                "check_in_date": check_in.isoformat(),
+                "check_out_date": check_out.isoformat(),
+                "guest_count": 2
+            }, headers=auth_headers)
+            
+            assert response.status_code == 400
+    
     def test_get_user_bookings(self, client: TestClient, auth_headers):
         """Test getting user's bookings"""
         response = client.get("/bookings/my-bookings", headers=auth_headers)
@@ -117,6 +136,150 @@ class TestBookingsCRUD:
         assert isinstance(data, list)
 
 
+
+class TestBookingLists:
+    """Test filtering and pagination of guest and host booking lists"""
+    
+    @pytest.fixture
+    def many_bookings(self, db_session, test_user, test_listing):
+        """Create past and upcoming bookings with mixed statuses"""
+        from app import models
+        
+        bookings = []
+        for offset, status in [(-20, "completed"), (-10, "cancelled"), (5, "pending"), (15, "confirmed"), (25, "pending")]:
+            check_in = datetime.now() + timedelta(days=offset)
+            booking = models.Booking(
+                listing_id=test_listing.id,
+                customer_id=test_user.id,
+                check_in_date=check_in,
+                check_out_date=check_in + timedelta(days=2),
+                guest_count=1,
+                total_price=240.0,
+                status=status
+            )
+            db_session.add(booking)
+            bookings.append(booking)
+        db_session.commit()
+        return bookings
+    
+    def test_cursor_pagination(self, client: TestClient, auth_headers, many_bookings):
+        """Test walking every page with the next cursor"""
+        seen = []
+        params = {"limit": 2}
+        while True:
+            response = client.get("/bookings/my-bookings", params=params, headers=auth_headers)
+            assert response.status_code == 200
+            seen.extend(booking["id"] for booking in response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+            params["cursor"] = cursor
+        
+        assert len(seen) == len(many_bookings)
+        assert len(set(seen)) == len(seen)
+    
+    def test_upcoming_window_sorted_soonest_first(self, client: TestClient, auth_headers, many_bookings):
+        """Test the upcoming window"""
+        response = client.get("/bookings/my-bookings", params={"window": "upcoming"}, headers=auth_headers)
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert [booking["status"] for booking in data] == ["pending", "confirmed", "pending"]
+    
+    def test_past_window_and_status_filter(self, client: TestClient, host_auth_headers, many_bookings):
+        """Test combining the past window with a status filter on the host list"""
+        response = client.get(
+            "/bookings/host/incoming",
+            params={"window": "past", "status": "completed"},
+            headers=host_auth_headers
+        )
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data) == 1
+        assert data[0]["status"] == "completed"
+        assert data[0]["listing"]["host"]["id"] == data[0]["listing"]["host_id"]
+    
+    def test_invalid_list_parameters(self, client: TestClient, auth_headers):
+        """Test that unknown filters and malformed cursors are rejected"""
+        assert client.get("/bookings/my-bookings", params={"status": "bogus"}, headers=auth_headers).status_code == 400
+        assert client.get("/bookings/my-bookings", params={"window": "later"}, headers=auth_headers).status_code == 400
+        assert client.get("/bookings/my-bookings", params={"cursor": "not-a-cursor"}, headers=auth_headers).status_code == 400
+
+
+class TestBookingLifecycle:
+    """Test the scheduled booking lifecycle transitions"""
+    
+    def _booking(self, db_session, test_user, test_listing, check_in, status, payment_status="unpaid", created_at=None):
+        from app import models
+        
+        booking = models.Booking(
+            listing_id=test_listing.id,
+            customer_id=test_user.id,
+            check_in_date=check_in,
+            check_out_date=check_in + timedelta(days=2),
+            guest_count=1,
+            total_price=240.0,
+            status=status,
+            payment_status=payment_status,
+            created_at=created_at
+        )
+        db_session.add(booking)
+        db_session.commit()
+        return booking
+    
+    def test_expire_stale_pending_bookings(self, db_session, test_user, test_listing):
+        """Test that only unpaid pending bookings past the hold window expire"""
+        from app.services.booking_lifecycle import expire_stale_pending_bookings
+        
+        future = datetime.now() + timedelta(days=10)
+        stale = datetime.utcnow() - timedelta(hours=3)
+        expired = [self._booking(db_session, test_user, test_listing, future + timedelta(days=i * 3), "pending", created_at=stale) for i in range(3)]
+        fresh = self._booking(db_session, test_user, test_listing, future + timedelta(days=20), "pending", created_at=datetime.utcnow())
+        paying = self._booking(db_session, test_user, test_listing, future + timedelta(days=30), "pending", payment_status="processing", created_at=stale)
+        
+        count = expire_stale_pending_bookings(db_session, timedelta(hours=1), batch_size=2)
+        
+        assert count == 3
+        for booking in expired:
+            db_session.refresh(booking)
+            assert booking.status == "expired"
+        db_session.refresh(fresh)
+        db_session.refresh(paying)
+        assert fresh.status == "pending"
+        assert paying.status == "pending"
+    
+    def test_complete_past_stays(self, db_session, test_user, test_listing):
+        """Test that finished confirmed stays become completed"""
+        from app.services.booking_lifecycle import complete_past_stays
+        
+        finished = self._booking(db_session, test_user, test_listing, datetime.now() - timedelta(days=5), "confirmed")
+        upcoming = self._booking(db_session, test_user, test_listing, datetime.now() + timedelta(days=5), "confirmed")
+        cancelled = self._booking(db_session, test_user, test_listing, datetime.now() - timedelta(days=15), "cancelled")
+        
+        assert complete_past_stays(db_session, batch_size=100) == 1
+        
+        for booking, status in [(finished, "completed"), (upcoming, "confirmed"), (cancelled, "cancelled")]:
+            db_session.refresh(booking)
+            assert booking.status == status
+    
+    def test_expired_booking_releases_dates(self, client: TestClient, auth_headers, db_session, test_user, test_listing):
+        """Test that an expired hold no longer blocks availability"""
+        from app.services.booking_lifecycle import expire_stale_pending_bookings
+        
+        future = datetime.now() + timedelta(days=10)
+        self._booking(db_session, test_user, test_listing, future, "pending", created_at=datetime.utcnow() - timedelta(hours=3))
+        expire_stale_pending_bookings(db_session, timedelta(hours=1), batch_size=100)
+        
+        response = client.post("/bookings/", json={
+            "listing_id": test_listing.id,
+            "check_in_date": future.isoformat(),
+            "check_out_date": (future + timedelta(days=2)).isoformat(),
+            "guest_count": 1
+        }, headers=auth_headers)
+        
+        assert response.status_code == 200
+
 class TestBookingStatus:
     """Test booking status management"""
     
@@ -315,4 +478,250 @@ class TestBookingValidation:
         response = client.post("/bookings/", json=conflicting_booking_data, headers=auth_headers)
         
         assert response.status_code == 400
-        assert "not available for selected dates" in response.json()["detail"] 
\ No newline at end of file
+        assert "not available for selected dates" in response.json()["detail"]
+    
+    def test_back_to_back_booking_allowed(self, client: TestClient, auth_headers, db_session, test_listing, test_user):
+        """Test that a stay starting on another stay's check-out day is available"""
+        from app import models
+        
+        future_date = datetime.now() + timedelta(days=30)
+        existing_booking = models.Booking(
+            listing_id=test_listing.id,
+            customer_id=test_user.id,
+            check_in_date=future_date,
+            check_out_date=future_date + timedelta(days=3),
+            guest_count=2,
+            total_price=360.0,
+            status="confirmed"
+        )
+        db_session.add(existing_booking)
+        db_session.commit()
+        
+        booking_data = {
+            "listing_id": test_listing.id,
+            "check_in_date": (future_date + timedelta(days=3)).isoformat(),
+            "check_out_date": (future_date + timedelta(days=5)).isoformat(),
+            "guest_count": 2
+        }
+        
+        response = client.post("/bookings/", json=booking_data, headers=auth_headers)
+        
+        assert response.status_code == 200
+    
+    def test_exclusion_violation_is_booking_conflict(self):
+        """Test that only the exclusion constraint SQLSTATE is treated as a date conflict"""
+        from sqlalchemy.exc import IntegrityError
+        from app.services.availability import is_booking_conflict
+        
+        class FakeOrig(Exception):
+            def __init__(self, pgcode):
+                self.pgcode = pgcode
+        
+        assert is_booking_conflict(IntegrityError("INSERT", {}, FakeOrig("23P01")))
+        assert not is_booking_conflict(IntegrityError("INSERT", {}, FakeOrig("23505")))
+
+
+class TestBookingIdempotency:
+    """Test Idempotency-Key handling on booking creation"""
+
+    def test_retry_replays_original_booking(self, client: TestClient, auth_headers, db_session, test_booking_data):
+        """Test a retried request returns the first booking instead of creating another"""
+        headers = {**auth_headers, "Idempotency-Key": "booking-retry-1"}
+        first = client.post("/bookings/", json=test_booking_data, headers=headers)
+        assert first.status_code == 200
+        assert "Idempotent-Replayed" not in first.headers
+
+        second = client.post("/bookings/", json=test_booking_data, headers=headers)
+        assert second.status_code == 200
+        assert second.headers["Idempotent-Replayed"] == "true"
+        assert second.json()["id"] == first.json()["id"]
+
+        from app import models
+        assert db_session.query(models.Booking).count() == 1
+
+    def test_key_reused_for_different_request(self, client: TestClient, auth_headers, test_booking_data):
+        """Test reusing a key with a different body is rejected"""
+        headers = {**auth_headers, "Idempotency-Key": "booking-retry-2"}
+        assert client.post("/bookings/", json=test_booking_data, headers=headers).status_code == 200
+
+        changed = {**test_booking_data, "guest_count": 1}
+        response = client.post("/bookings/", json=changed, headers=headers)
+        assert response.status_code == 422
+
+    def test_failed_request_releases_key(self, client: TestClient, auth_headers, test_booking_data):
+        """Test a request that failed can be retried with the same key"""
+        headers = {**auth_headers, "Idempotency-Key": "booking-retry-3"}
+        too_many = {**test_booking_data, "guest_count": 50}
+        assert client.post("/bookings/", json=too_many, headers=headers).status_code == 400
+
+        response = client.post("/bookings/", json=test_booking_data, headers=headers)
+        assert response.status_code == 200
+        assert "Idempotent-Replayed" not in response.headers
+
+    def test_keys_are_scoped_per_user(self, client: TestClient, auth_headers, db_session, test_booking_data):
+        """Test another user's identical key does not replay someone else's booking"""
+        from app import models
+        from app.auth import get_password_hash, create_access_token
+        other = models.User(
+            email="other@example.com",
+            username="otherguest",
+            hashed_password=get_password_hash("otherpassword123"),
+            first_name="Other",
+            last_name="Guest"
+        )
+        db_session.add(other)
+        db_session.commit()
+
+        first = client.post("/bookings/", json=test_booking_data, headers={**auth_headers, "Idempotency-Key": "same"})
+        assert first.status_code == 200
+
+        other_headers = {
+            "Authorization": f"Bearer {create_access_token(data={'sub': other.email})}",
+            "Idempotency-Key": "same"
+        }
+        response = client.post("/bookings/", json=test_booking_data, headers=other_headers)
+        # Runs for real, and the dates are taken
+        assert response.status_code == 400
+
+
+    def _stale_claim(self, db_session, user, key):
+        from app import models
+        from app.services.idempotency import fingerprint
+        record = models.IdempotencyKey(
+            user_id=user.id, scope="create_booking", key=key, request_hash=fingerprint({}),
+            status="in_progress", created_at=datetime.utcnow() - timedelta(hours=1)
+        )
+        db_session.add(record)
+        db_session.commit()
+        return record
+
+    def test_abandoned_key_taken_over_once(self, db_session, test_user):
+        """Test one retry takes over a claim whose request died, and the next is told it is in progress"""
+        from fastapi import HTTPException
+        from app.services.idempotency import _begin, fingerprint
+        record = self._stale_claim(db_session, test_user, "abandoned")
+
+        assert _begin(db_session, test_user.id, "create_booking", "abandoned", fingerprint({})).id == record.id
+        with pytest.raises(HTTPException) as excinfo:
+            _begin(db_session, test_user.id, "create_booking", "abandoned", fingerprint({}))
+        assert excinfo.value.status_code == 409
+
+    def test_takeover_lost_to_another_retry(self, db_session, test_user):
+        """Test a takeover based on a stale read does not restart the claim again"""
+        from types import SimpleNamespace
+        from app.services.idempotency import _take_over
+        record = self._stale_claim(db_session, test_user, "contended")
+        stale = SimpleNamespace(id=record.id, created_at=record.created_at)
+
+        assert _take_over(db_session, stale)
+        assert not _take_over(db_session, stale)
+
+    def test_key_released_while_claiming(self, db_session, test_user, monkeypatch):
+        """Test a key released between the failed insert and the lookup is claimed again"""
+        from app.services import idempotency
+        claim = idempotency._claim
+        attempts = []
+
+        def released_once(*args):
+            attempts.append(args)
+            return None if len(attempts) == 1 else claim(*args)
+
+        monkeypatch.setattr(idempotency, "_claim", released_once)
+
+        record = idempotency._begin(db_session, test_user.id, "create_booking", "released", idempotency.fingerprint({}))
+        assert record.status == "in_progress"
+        assert len(attempts) == 2
+
+
+@pytest.mark.postgres
+class TestBookingExclusionConstraint:
+    """Test the tsrange/GiST exclusion constraint on a migrated PostgreSQL database"""
+
+    @pytest.fixture
+    def pg_booking_setup(self, postgres_engine):
+        from app import models
+        from app.auth import create_access_token, get_password_hash
+        from tests.conftest import app_database
+
+        with app_database(postgres_engine) as SessionLocal:
+            db = SessionLocal()
+            host = models.User(
+                email="excl-host@example.com",
+                username="exclhost",
+                hashed_password=get_password_hash("hostpassword123"),
+                first_name="Exclusion",
+                last_name="Host",
+                is_host=True
+            )
+            guest = models.User(
+                email="excl-guest@example.com",
+                username="exclguest",
+                hashed_password=get_password_hash("guestpassword123"),
+                first_name="Exclusion",
+                last_name="Guest"
+            )
+            db.add_all([host, guest])
+            db.flush()
+            listing = models.Listing(
+                title="Exclusion Loft",
+                description="Test",
+                price_per_night=100.0,
+                location="Test City",
+                max_guests=4,
+                host_id=host.id
+            )
+            db.add(listing)
+            db.commit()
+            headers = {"Authorization": f"Bearer {create_access_token(data={'sub': guest.email})}"}
+            try:
+                yield db, listing, guest, headers
+            finally:
+                db.close()
+
+    def _stay(self, listing, guest, check_in, nights, status="confirmed"):
+        from app import models
+        return models.Booking(
+            listing_id=listing.id,
+            customer_id=guest.id,
+            check_in_date=check_in,
+            check_out_date=check_in + timedelta(days=nights),
+            guest_count=1,
+            total_price=100.0 * nights,
+            status=status
+        )
+
+    def test_overlap_rejected_by_constraint(self, pg_booking_setup, monkeypatch):
+        """Test overlapping active stays fail in the database, directly and through the API past the fast path"""
+        from sqlalchemy.exc import IntegrityError
+        from app.main import app
+        from app.routers import bookings
+        from app.services.availability import is_booking_conflict
+
+        db, listing, guest, headers = pg_booking_setup
+        check_in = datetime.now().replace(hour=15, minute=0, second=0, microsecond=0) + timedelta(days=20)
+        db.add(self._stay(listing, guest, check_in, 3))
+        db.commit()
+
+        # Directly through the session
+        db.add(self._stay(listing, guest, check_in + timedelta(days=1), 3))
+        with pytest.raises(IntegrityError) as excinfo:
+            db.commit()
+        db.rollback()
+        assert is_booking_conflict(excinfo.value)
+
+        # Checkout day is free, and cancelled stays hold no dates
+        db.add(self._stay(listing, guest, check_in + timedelta(days=3), 2))
+        db.add(self._stay(listing, guest, check_in, 3, status="cancelled"))
+        db.commit()
+
+        # Through the API, as if a concurrent booking committed after the availability check
+        monkeypatch.setattr(bookings, "check_availability", lambda *args: True)
+        response = TestClient(app).post("/bookings/", json={
+            "listing_id": listing.id,
+            "check_in_date": (check_in + timedelta(days=2)).isoformat(),
+            "check_out_date": (check_in + timedelta(days=4)).isoformat(),
+            "guest_count": 1
+        }, headers=headers)
+
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Listing is not available for selected dates"
@@ -0,0 +1,97 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool
+
+from app.config import settings
+from app.database import _set_transaction_timeout, engine_options, make_engine
+from app.replicas import create_replica
+from app.routers import listings
+
+POSTGRES_URL = "postgresql://stayhub@db:5432/stayhub"
+
+
+class QueryCanceled(Exception):
+    pgcode = "57014"
+
+
+class TestEngineOptions:
+    """Test pool and timeout settings reach create_engine()"""
+
+    def test_postgres_pool(self, monkeypatch):
+        """Test pool sizing, recycling, pre-ping and the statement timeout startup option"""
+        monkeypatch.setattr(settings, "DB_POOL_SIZE", 8)
+        monkeypatch.setattr(settings, "DB_MAX_OVERFLOW", 2)
+        monkeypatch.setattr(settings, "DB_STATEMENT_TIMEOUT_MS", 15000)
+
+        options = engine_options(POSTGRES_URL)
+
+        assert options["pool_size"] == 8 and options["max_overflow"] == 2
+        assert options["pool_recycle"] == settings.DB_POOL_RECYCLE_SECONDS
+        assert options["pool_pre_ping"] is settings.DB_POOL_PRE_PING
+        assert options["connect_args"] == {"options": "-c statement_timeout=15000"}
+
+    def test_statement_timeout_disabled(self, monkeypatch):
+        """Test a zero timeout sends no startup option"""
+        monkeypatch.setattr(settings, "DB_STATEMENT_TIMEOUT_MS", 0)
+
+        assert "connect_args" not in engine_options(POSTGRES_URL)
+
+    def test_pgbouncer_transaction_mode(self, monkeypatch):
+        """Test PgBouncer gets no app-side pool and no startup options"""
+        monkeypatch.setattr(settings, "DB_PGBOUNCER_TRANSACTION_MODE", True)
+
+        assert engine_options(POSTGRES_URL) == {"poolclass": NullPool}
+
+    def test_sqlite_untouched(self):
+        """Test SQLite keeps SQLAlchemy's defaults"""
+        assert engine_options("sqlite:///./stayhub.db") == {}
+
+
+class TestMakeEngine:
+    """Test the primary and replicas get the same per-transaction timeout"""
+
+    def test_pgbouncer_begin_listener(self, monkeypatch):
+        """Test every PgBouncer-mode engine, replicas included, sets the timeout per transaction"""
+        monkeypatch.setattr(settings, "DB_PGBOUNCER_TRANSACTION_MODE", True)
+        monkeypatch.setattr(settings, "DB_STATEMENT_TIMEOUT_MS", 15000)
+
+        primary = make_engine(POSTGRES_URL)
+        replica = create_replica("postgresql://stayhub@replica:5432/stayhub", 0)
+
+        for engine in (primary, replica.engine):
+            assert event.contains(engine, "begin", _set_transaction_timeout)
+
+    def test_no_listener_with_app_pool(self, monkeypatch):
+        """Test the startup option is used instead when the app pools connections itself"""
+        monkeypatch.setattr(settings, "DB_STATEMENT_TIMEOUT_MS", 15000)
+
+        assert not event.contains(make_engine(POSTGRES_URL), "begin", _set_transaction_timeout)
+
+
+class TestDatabaseErrors:
+    """Test pool exhaustion and statement timeouts are shed with 503"""
+
+    def _fail_search(self, monkeypatch, error):
+        def set_statement_timeout(db, milliseconds):
+            raise error
+
+        monkeypatch.setattr(listings, "set_statement_timeout", set_statement_timeout)
+
+    def test_statement_timeout(self, client: TestClient, monkeypatch):
+        """Test a cancelled search answers 503 with Retry-After"""
+        self._fail_search(monkeypatch, OperationalError("SELECT", {}, QueryCanceled()))
+
+        response = client.get("/listings/", params={"location": "a"})
+
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "5"
+
+    def test_pool_exhausted(self, client: TestClient, monkeypatch):
+        """Test a checkout that timed out answers 503"""
+        self._fail_search(monkeypatch, PoolTimeoutError("QueuePool limit of size 5 overflow 10 reached"))
+
+        response = client.get("/listings/")
+
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
@@ -0,0 +1,108 @@
+import csv
+import io
+import os
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from app import models
+from tools import datagen
+
+COUNTS = {"users": 80, "listings": 24, "bookings": 150, "reviews": 120}
+POSTGRES_URL = os.environ.get("TEST_POSTGRES_URL")
+
+
+def index_names(engine):
+    inspector = inspect(engine)
+    return {table: {index["name"] for index in inspector.get_indexes(table)} for table in datagen.TABLES}
+
+
+class TestDataset:
+    """Test the generated rows"""
+
+    def test_deterministic(self):
+        """Test the same seed gives the same rows and another seed does not"""
+        first = list(datagen.Dataset(COUNTS, seed=1, password_hash="x").bookings())
+        again = list(datagen.Dataset(COUNTS, seed=1, password_hash="x").bookings())
+        other = list(datagen.Dataset(COUNTS, seed=2, password_hash="x").bookings())
+
+        assert first == again
+        assert first != other
+        assert len(first) == COUNTS["bookings"]
+
+    def test_bookings_never_overlap(self):
+        """Test stays on a listing are sequential and booked by guests"""
+        dataset = datagen.Dataset(COUNTS, password_hash="x")
+        columns = datagen.COLUMNS["bookings"]
+        last_check_out = {}
+        for row in dataset.bookings():
+            booking = dict(zip(columns, row))
+            assert booking["check_in_date"] < booking["check_out_date"]
+            assert booking["check_in_date"] >= last_check_out.get(booking["listing_id"], "")
+            assert booking["customer_id"] > dataset.hosts
+            last_check_out[booking["listing_id"]] = booking["check_out_date"]
+
+    def test_copy_stream(self):
+        """Test the COPY stream yields every row as CSV whatever the read size"""
+        rows = list(datagen.Dataset(COUNTS, password_hash="x").reviews())
+        stream = datagen.CopyStream(iter(rows), batch_rows=7)
+
+        chunks = iter(lambda: stream.read(100), "")
+        parsed = list(csv.reader(io.StringIO("".join(chunks))))
+
+        assert len(parsed) == stream.rows == COUNTS["reviews"]
+        assert parsed[0][0] == str(rows[0][0])
+        assert (parsed[0][5] or None) == rows[0][5]
+
+
+class TestSQLiteLoad:
+    """Test the SQLite bulk path"""
+
+    def test_load(self, db_session):
+        """Test rows land readable through the ORM and indexes are rebuilt"""
+        engine = db_session.get_bind()
+        indexes = index_names(engine)
+
+        manifest = datagen.load(engine, dict(COUNTS))
+
+        assert manifest["hosts"] == 6
+        assert index_names(engine) == indexes
+        assert db_session.query(models.Review).count() == COUNTS["reviews"]
+        listing = db_session.get(models.Listing, 1)
+        assert isinstance(listing.amenities, list) and listing.host.is_host is True
+        booking = db_session.query(models.Booking).first()
+        assert booking.check_out_date > booking.check_in_date
+        assert db_session.execute(text("PRAGMA journal_mode")).scalar() != "memory"
+
+    def test_refuses_populated_database(self, db_session):
+        """Test loading twice needs an explicit reset"""
+        datagen.load(db_session.get_bind(), dict(COUNTS))
+
+        with pytest.raises(SystemExit):
+            datagen.load(db_session.get_bind(), dict(COUNTS))
+
+
+@pytest.mark.postgres
+class TestPostgresLoad:
+    """Test the COPY path against a migrated PostgreSQL database (TEST_POSTGRES_URL)"""
+
+    def test_load_restores_schema(self):
+        """Test deferred indexes and constraints come back, including the overlap guard"""
+        if not POSTGRES_URL:
+            pytest.skip("TEST_POSTGRES_URL not set")
+        engine = create_engine(POSTGRES_URL)
+        if not inspect(engine).has_table("bookings"):
+            pytest.skip("TEST_POSTGRES_URL has no schema; run alembic upgrade head")
+        with engine.connect() as conn:
+            before = conn.execute(text("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema()")).scalars().all()
+
+        datagen.load(engine, dict(COUNTS), reset=True)
+
+        with engine.connect() as conn:
+            after = conn.execute(text("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema()")).scalars().all()
+            assert sorted(after) == sorted(before)
+            assert conn.execute(text("SELECT count(*) FROM bookings")).scalar() == COUNTS["bookings"]
+            assert conn.execute(text("SELECT 1 FROM pg_constraint WHERE conname = 'bookings_no_overlap'")).scalar() == 1
+            next_id = conn.execute(text("SELECT nextval(pg_get_serial_sequence('listings', 'id'))")).scalar()
+            assert next_id == COUNTS["listings"] + 1
+        engine.dispose()
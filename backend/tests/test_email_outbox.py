@@ -0,0 +1,189 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+from app import email, models
+from app.config import settings
+from app.email import EmailService
+from app.services.email_outbox import EmailOutboxWorker, enqueue_email
+from app.services.resilience import CircuitBreaker
+from tools.fault_servers import ERROR
+from tools.smtp_sink import SMTPSink
+
+STATUS_CONTEXT = {
+    "customer_name": "Test",
+    "status": "confirmed",
+    "booking": {
+        "booking_id": 7, "listing_title": "Cozy Loft", "check_in_date": "2030-01-01",
+        "check_out_date": "2030-01-04", "guest_count": 2, "total_price": 360.0
+    }
+}
+
+
+@pytest.fixture
+def smtp_sink(monkeypatch):
+    with SMTPSink() as sink:
+        monkeypatch.setattr(settings, "SMTP_SERVER", sink.host)
+        monkeypatch.setattr(settings, "SMTP_PORT", sink.port)
+        monkeypatch.setattr(settings, "SMTP_USERNAME", "")
+        monkeypatch.setattr(settings, "SMTP_USE_TLS", False)
+        monkeypatch.setattr(settings, "SMTP_START_TLS", False)
+        monkeypatch.setattr(settings, "SMTP_TIMEOUT_SECONDS", 0.5)
+        monkeypatch.setattr(settings, "SMTP_MAX_ATTEMPTS", 1)
+        breaker = CircuitBreaker("smtp", failure_threshold=100, reset_timeout=60, is_failure=email.is_transient_smtp_error)
+        monkeypatch.setattr(email, "smtp_breaker", breaker)
+        yield sink
+
+
+@pytest.fixture
+def worker(db_session):
+    return EmailOutboxWorker(sessionmaker(bind=db_session.get_bind()), EmailService())
+
+
+def drain(worker, batch_size=50):
+    async def run():
+        count = await worker.drain_once(batch_size)
+        await worker.service.pool.close()
+        return count
+    return asyncio.run(run())
+
+
+def queue(db_session, to_email="guest@example.com", count=1, context=STATUS_CONTEXT):
+    messages = [
+        enqueue_email(db_session, to_email, "booking_status_update.html", "Booking Confirmed - Cozy Loft", context)
+        for _ in range(count)
+    ]
+    db_session.commit()
+    return messages
+
+
+class TestEmailTemplates:
+    """Test template precompilation"""
+
+    def test_warm_up_compiles_all_templates(self):
+        """Test every template compiles and renders without touching the loader again"""
+        service = EmailService()
+        assert service.warm_up() >= 4
+        html = service.render("booking_status_update.html", **STATUS_CONTEXT)
+        assert "Cozy Loft" in html and "confirmed" in html
+
+    def test_user_content_is_escaped(self):
+        """Test review comments cannot inject markup into host emails"""
+        html = EmailService().render("review_notification.html", host_name="Host", review={
+            "listing_title": "Loft", "reviewer_name": "Guest", "rating": 1, "comment": "<script>alert(1)</script>"
+        })
+        assert "<script>" not in html
+        assert "&lt;script&gt;" in html
+
+
+class TestEmailOutboxSender:
+    """Test draining the outbox into a local SMTP sink"""
+
+    def test_sends_batch_over_pooled_connections(self, db_session, smtp_sink, worker):
+        """Test a batch is delivered over at most the pool's connections and marked sent"""
+        for i in range(6):
+            queue(db_session, f"guest{i}@example.com")
+
+        assert drain(worker) == 6
+        assert len(smtp_sink.messages) == 6
+        assert smtp_sink.connections <= settings.SMTP_POOL_SIZE
+        rows = db_session.query(models.EmailOutbox).all()
+        assert {row.status for row in rows} == {"sent"}
+        message = smtp_sink.messages_to("guest0@example.com")[0]
+        assert message["Subject"] == "Booking Confirmed - Cozy Loft"
+
+    def test_throttles_per_recipient(self, db_session, smtp_sink, worker, monkeypatch):
+        """Test messages over a recipient's limit are deferred, not sent"""
+        monkeypatch.setattr(settings, "EMAIL_RECIPIENT_LIMIT", 2)
+        queue(db_session, count=4)
+        queue(db_session, "other@example.com")
+
+        drain(worker)
+
+        assert len(smtp_sink.messages_to("guest@example.com")) == 2
+        assert len(smtp_sink.messages_to("other@example.com")) == 1
+        deferred = db_session.query(models.EmailOutbox).filter_by(status="pending").all()
+        assert len(deferred) == 2
+        assert all(row.available_at > datetime.utcnow() and row.attempts == 0 for row in deferred)
+
+        # Nothing is due yet, and the sent ones still count against the window
+        assert drain(worker) == 0
+
+    def test_transient_failure_retries_with_backoff(self, db_session, smtp_sink, worker, monkeypatch):
+        """Test a failed send goes back with backoff and is given up after the attempt limit"""
+        monkeypatch.setattr(settings, "EMAIL_OUTBOX_MAX_ATTEMPTS", 2)
+        smtp_sink.mode = ERROR
+        [message] = queue(db_session)
+
+        drain(worker)
+        db_session.refresh(message)
+        assert (message.status, message.attempts) == ("pending", 1)
+        assert message.available_at > datetime.utcnow() + timedelta(seconds=20)
+        assert message.last_error
+
+        message.available_at = datetime.utcnow()
+        db_session.commit()
+        drain(worker)
+        db_session.refresh(message)
+        assert (message.status, message.attempts) == ("failed", 2)
+
+    def test_rejected_recipient_fails_without_retry(self, db_session, smtp_sink, worker):
+        """Test a permanent rejection is not retried"""
+        smtp_sink.rejected_recipients.add("nobody@example.com")
+        [rejected] = queue(db_session, "nobody@example.com")
+        [accepted] = queue(db_session, "guest@example.com")
+
+        drain(worker)
+
+        db_session.refresh(rejected)
+        db_session.refresh(accepted)
+        assert (rejected.status, rejected.attempts) == ("failed", 1)
+        assert accepted.status == "sent"
+
+    def test_expired_lease_is_reclaimed(self, db_session, smtp_sink, worker):
+        """Test a message left in sending by a dead worker is sent once its lease expires"""
+        [message] = queue(db_session)
+        message.status = "sending"
+        message.attempts = 1
+        message.available_at = datetime.utcnow() - timedelta(seconds=1)
+        db_session.commit()
+
+        assert drain(worker) == 1
+        db_session.refresh(message)
+        assert (message.status, message.attempts) == ("sent", 2)
+
+
+class TestOutboxWrites:
+    """Test application changes write their emails in the same transaction"""
+
+    def test_booking_creation_queues_host_notification(
+        self, client: TestClient, db_session, auth_headers, test_host, test_booking_data
+    ):
+        """Test a new booking queues the host email, and a rejected one queues nothing"""
+        response = client.post("/bookings/", json=test_booking_data, headers=auth_headers)
+        assert response.status_code == 200
+
+        [message] = db_session.query(models.EmailOutbox).all()
+        assert message.to_email == test_host.email
+        assert message.template == "new_booking_notification.html"
+        assert message.context["booking"]["guest_name"] == "Test User"
+
+        response = client.post("/bookings/", json=test_booking_data, headers=auth_headers)
+        assert response.status_code == 400
+        assert db_session.query(models.EmailOutbox).count() == 1
+
+    def test_status_change_queues_guest_update(
+        self, client: TestClient, db_session, auth_headers, host_auth_headers, test_user, test_booking_data
+    ):
+        """Test the guest is emailed when the host confirms their booking"""
+        booking_id = client.post("/bookings/", json=test_booking_data, headers=auth_headers).json()["id"]
+
+        response = client.put(f"/bookings/{booking_id}/status", json={"status": "confirmed"}, headers=host_auth_headers)
+        assert response.status_code == 200
+
+        message = db_session.query(models.EmailOutbox).filter_by(to_email=test_user.email).one()
+        assert message.subject.startswith("Booking Confirmed")
+        assert message.context["booking"]["booking_id"] == booking_id
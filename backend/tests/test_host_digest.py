@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+from app import models
+from app.email import EmailService
+from app.services.email_outbox import queue_new_booking_notification, queue_review_notification
+from app.services.host_digest import DIGEST_MAX_ITEMS, run_daily_digests, run_hourly_digests
+
+
+def add_booking_event(db_session, listing, guest, days_ahead):
+    booking = models.Booking(
+        listing=listing,
+        customer=guest,
+        check_in_date=datetime.now() + timedelta(days=days_ahead),
+        check_out_date=datetime.now() + timedelta(days=days_ahead + 2),
+        total_price=240.0,
+        guest_count=2
+    )
+    db_session.add(booking)
+    queue_new_booking_notification(db_session, booking)
+    db_session.commit()
+
+
+def add_review_event(db_session, listing, guest, rating):
+    review = models.Review(listing=listing, reviewer=guest, host=listing.host, rating=rating, comment="Lovely <b>stay</b>")
+    db_session.add(review)
+    queue_review_notification(db_session, review)
+    db_session.commit()
+
+
+class TestDigestPreference:
+    """Test hosts choosing how notifications reach them"""
+
+    def test_update_preference(self, client: TestClient, host_auth_headers):
+        """Test a host can switch to a daily digest"""
+        response = client.put("/auth/me", json={"notification_digest": "daily"}, headers=host_auth_headers)
+
+        assert response.status_code == 200
+        assert response.json()["notification_digest"] == "daily"
+
+    def test_invalid_preference(self, client: TestClient, host_auth_headers):
+        """Test unknown digest modes are rejected"""
+        response = client.put("/auth/me", json={"notification_digest": "weekly"}, headers=host_auth_headers)
+
+        assert response.status_code == 422
+
+    def test_null_preference(self, client: TestClient, host_auth_headers):
+        """Test an explicit null is rejected instead of reaching the NOT NULL column"""
+        response = client.put("/auth/me", json={"notification_digest": None}, headers=host_auth_headers)
+
+        assert response.status_code == 422
+
+    def test_other_fields_keep_preference(self, client: TestClient, host_auth_headers):
+        """Test omitting the preference leaves it unchanged"""
+        response = client.put("/auth/me", json={"first_name": "Renamed"}, headers=host_auth_headers)
+
+        assert response.status_code == 200
+        assert response.json()["notification_digest"] == "immediate"
+
+    def test_immediate_host_gets_email(self, db_session, test_user, test_listing):
+        """Test the default still emails each booking right away"""
+        add_booking_event(db_session, test_listing, test_user, 10)
+
+        assert db_session.query(models.EmailOutbox).count() == 1
+        assert db_session.query(models.HostNotification).count() == 0
+
+
+class TestHostDigests:
+    """Test building digest emails from held notification events"""
+
+    def test_daily_digest_groups_events_per_host(self, db_session, test_user, test_host, test_listing):
+        """Test a day of events becomes one email, and a rerun sends nothing"""
+        test_host.notification_digest = "daily"
+        db_session.commit()
+        for i in range(3):
+            add_booking_event(db_session, test_listing, test_user, 10 + 3 * i)
+        add_review_event(db_session, test_listing, test_user, 5)
+        assert db_session.query(models.EmailOutbox).count() == 0
+
+        assert run_hourly_digests(db_session) == {"hosts": 0, "notifications": 0}
+        assert run_daily_digests(db_session) == {"hosts": 1, "notifications": 4}
+
+        [digest] = db_session.query(models.EmailOutbox).all()
+        assert digest.to_email == test_host.email
+        assert digest.subject == "Your daily StayHub summary: 3 new bookings, 1 new review"
+        assert (digest.context["booking_count"], digest.context["review_count"]) == (3, 1)
+        assert db_session.query(models.HostNotification).filter(models.HostNotification.digested_at.is_(None)).count() == 0
+
+        assert run_daily_digests(db_session) == {"hosts": 0, "notifications": 0}
+
+    def test_digest_renders(self, db_session, test_user, test_host, test_listing):
+        """Test the queued digest renders with long lists truncated"""
+        test_host.notification_digest = "hourly"
+        db_session.commit()
+        for i in range(DIGEST_MAX_ITEMS + 2):
+            add_booking_event(db_session, test_listing, test_user, 10 + 3 * i)
+        add_review_event(db_session, test_listing, test_user, 4)
+        run_hourly_digests(db_session)
+
+        digest = db_session.query(models.EmailOutbox).one()
+        html = EmailService().render(digest.template, **digest.context)
+        assert f"{DIGEST_MAX_ITEMS + 2} new booking requests" in html
+        assert "and 2 more" in html
+        assert "Lovely &lt;b&gt;stay&lt;/b&gt;" in html
+
+    def test_leftovers_flushed_after_switching_back(self, db_session, test_user, test_host, test_listing):
+        """Test events held before switching to immediate go out with the hourly run"""
+        test_host.notification_digest = "daily"
+        db_session.commit()
+        add_booking_event(db_session, test_listing, test_user, 10)
+        test_host.notification_digest = "immediate"
+        db_session.commit()
+
+        assert run_hourly_digests(db_session) == {"hosts": 1, "notifications": 1}
+        assert db_session.query(models.EmailOutbox).one().context["period"] == "hourly"
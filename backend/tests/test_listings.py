@@ -1,8 +1,10 @@
 import pytest
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from fastapi.testclient import TestClient
 from io import BytesIO
 
+from app.config import settings
+
 
 class TestListingsCRUD:
     """Test listing CRUD operations"""
@@ -268,4 +270,257 @@ class TestListingValidation:
                             headers=host_auth_headers)
         
         # Now we have validation, so negative prices should be rejected
-        assert response.status_code == 422 
\ No newline at end of file
+        assert response.status_code == 422
+
+
+class TestListingRates:
+    """Test the nightly rate calendar and stay quotes"""
+    
+    @pytest.fixture
+    def next_monday(self):
+        today = datetime.now().date()
+        return today + timedelta(days=7 - today.weekday() + 7)
+    
+    def _quote(self, client: TestClient, listing_id, check_in, check_out):
+        response = client.get(
+            f"/listings/{listing_id}/quote",
+            params={"check_in_date": check_in.isoformat(), "check_out_date": check_out.isoformat()}
+        )
+        assert response.status_code == 200
+        return response.json()
+    
+    def test_quote_without_rules_uses_base_price(self, client: TestClient, test_listing, next_monday):
+        """Test that a listing without rules is priced per night"""
+        data = self._quote(client, test_listing.id, next_monday, next_monday + timedelta(days=3))
+        
+        assert data["nights"] == 3
+        assert data["total_price"] == 3 * test_listing.price_per_night
+    
+    def test_weekend_and_date_range_rules(self, client: TestClient, host_auth_headers, test_listing, next_monday):
+        """Test that date ranges override weekday prices"""
+        response = client.post(f"/listings/{test_listing.id}/rates", json={
+            "rule_type": "weekday", "weekdays": [5, 6], "price": 200.0
+        }, headers=host_auth_headers)
+        assert response.status_code == 200
+        
+        # Monday to Monday: 5 weekday nights at 120 and 2 weekend nights at 200
+        data = self._quote(client, test_listing.id, next_monday, next_monday + timedelta(days=7))
+        assert data["total_price"] == 5 * 120.0 + 2 * 200.0
+        
+        saturday = next_monday + timedelta(days=5)
+        response = client.post(f"/listings/{test_listing.id}/rates", json={
+            "rule_type": "date_range",
+            "start_date": saturday.isoformat(),
+            "end_date": saturday.isoformat(),
+            "price": 300.0
+        }, headers=host_auth_headers)
+        assert response.status_code == 200
+        
+        data = self._quote(client, test_listing.id, next_monday, next_monday + timedelta(days=7))
+        assert data["total_price"] == 5 * 120.0 + 300.0 + 200.0
+    
+    def test_length_of_stay_discount(self, client: TestClient, host_auth_headers, test_listing, next_monday):
+        """Test that the longest qualifying stay discount applies"""
+        for min_nights, discount in [(3, 10.0), (7, 20.0)]:
+            response = client.post(f"/listings/{test_listing.id}/rates", json={
+                "rule_type": "length_of_stay", "min_nights": min_nights, "discount_percent": discount
+            }, headers=host_auth_headers)
+            assert response.status_code == 200
+        
+        assert self._quote(client, test_listing.id, next_monday, next_monday + timedelta(days=2))["total_price"] == 240.0
+        assert self._quote(client, test_listing.id, next_monday, next_monday + timedelta(days=3))["total_price"] == 324.0
+        assert self._quote(client, test_listing.id, next_monday, next_monday + timedelta(days=7))["total_price"] == 672.0
+    
+    def test_batch_quotes(self, client: TestClient, test_listing, next_monday):
+        """Test pricing several stays in one request"""
+        stays = [
+            {"check_in_date": next_monday.isoformat(), "check_out_date": (next_monday + timedelta(days=1)).isoformat()},
+            {"check_in_date": next_monday.isoformat(), "check_out_date": (next_monday + timedelta(days=300)).isoformat()},
+        ]
+        
+        response = client.post(f"/listings/{test_listing.id}/quotes", json={"stays": stays})
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert [quote["total_price"] for quote in data] == [120.0, 300 * 120.0]
+    
+    def test_quotes_outside_horizon_rejected(self, client: TestClient, test_listing, next_monday):
+        """Test that past, too distant and too long stays are refused before pricing"""
+        today = datetime.now().date()
+        far = today + timedelta(days=settings.PRICING_HORIZON_DAYS)
+        for check_in, check_out in [
+            (date(1, 1, 1), date(9999, 12, 31)),
+            (today - timedelta(days=3), today + timedelta(days=1)),
+            (far - timedelta(days=1), far + timedelta(days=1)),
+            (next_monday, next_monday + timedelta(days=settings.MAX_STAY_NIGHTS + 1)),
+        ]:
+            params = {"check_in_date": check_in.isoformat(), "check_out_date": check_out.isoformat()}
+            assert client.get(f"/listings/{test_listing.id}/quote", params=params).status_code == 400
+            response = client.post(f"/listings/{test_listing.id}/quotes", json={"stays": [params]})
+            assert response.status_code == 400
+    
+    def test_pricing_version_bumped_per_edit(self, client: TestClient, host_auth_headers, db_session, test_listing):
+        """Test every rate or price edit increments the listing's pricing version in the database"""
+        before = test_listing.pricing_version
+        rule = client.post(f"/listings/{test_listing.id}/rates", json={
+            "rule_type": "weekday", "weekdays": [5, 6], "price": 200.0
+        }, headers=host_auth_headers).json()
+        client.delete(f"/listings/{test_listing.id}/rates/{rule['id']}", headers=host_auth_headers)
+        client.put(f"/listings/{test_listing.id}", json={"price_per_night": 150.0}, headers=host_auth_headers)
+        
+        db_session.refresh(test_listing)
+        assert test_listing.pricing_version == before + 3
+    
+    def test_price_change_invalidates_quotes(self, client: TestClient, host_auth_headers, test_listing, next_monday):
+        """Test that updating the base price is reflected in new quotes"""
+        self._quote(client, test_listing.id, next_monday, next_monday + timedelta(days=1))
+        
+        response = client.put(f"/listings/{test_listing.id}", json={"price_per_night": 150.0}, headers=host_auth_headers)
+        assert response.status_code == 200
+        
+        data = self._quote(client, test_listing.id, next_monday, next_monday + timedelta(days=1))
+        assert data["total_price"] == 150.0
+    
+    def test_invalid_rate_rule(self, client: TestClient, host_auth_headers, test_listing):
+        """Test that a rule missing its required fields is rejected"""
+        response = client.post(f"/listings/{test_listing.id}/rates", json={
+            "rule_type": "weekday", "price": 200.0
+        }, headers=host_auth_headers)
+        
+        assert response.status_code == 400
+    
+    def test_create_rate_rule_not_owner(self, client: TestClient, auth_headers, test_listing):
+        """Test that only the host can add rate rules"""
+        response = client.post(f"/listings/{test_listing.id}/rates", json={
+            "rule_type": "weekday", "weekdays": [5], "price": 200.0
+        }, headers=auth_headers)
+        
+        assert response.status_code == 403
+
+
+class TestHostBulkCancellation:
+    """Test host-initiated cancellation of a listing's future bookings"""
+    
+    def _booking(self, db_session, listing, user, days_ahead, status="confirmed", payment_status="unpaid", intent_id=None):
+        from app import models
+        booking = models.Booking(
+            listing_id=listing.id,
+            customer_id=user.id,
+            check_in_date=datetime.now() + timedelta(days=days_ahead),
+            check_out_date=datetime.now() + timedelta(days=days_ahead + 3),
+            total_price=360.0,
+            status=status,
+            payment_status=payment_status,
+            stripe_payment_intent_id=intent_id
+        )
+        db_session.add(booking)
+        db_session.commit()
+        return booking
+    
+    def _paid_booking(self, db_session, fake_stripe, listing, user, days_ahead):
+        intent = fake_stripe.add_payment_intent(36000, status="succeeded")
+        return self._booking(db_session, listing, user, days_ahead, payment_status="paid", intent_id=intent["id"])
+    
+    def test_cancels_and_refunds_future_bookings(
+        self, client: TestClient, db_session, host_auth_headers, test_user, test_listing, fake_stripe
+    ):
+        """Test paid bookings are refunded in parallel, others cancelled, and guests emailed"""
+        from app import models
+        paid = [self._paid_booking(db_session, fake_stripe, test_listing, test_user, 10 + 5 * i) for i in range(4)]
+        unpaid = self._booking(db_session, test_listing, test_user, 40, status="pending")
+        processing = self._booking(db_session, test_listing, test_user, 50, payment_status="processing", intent_id="pi_inflight")
+        started = self._booking(db_session, test_listing, test_user, -1)
+        
+        response = client.post(
+            f"/listings/{test_listing.id}/cancel-bookings",
+            json={"reason": "Maintenance"},
+            headers=host_auth_headers
+        )
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert (data["cancelled"], data["refunded"], data["failed"], data["skipped"]) == (5, 4, 0, 1)
+        assert len(fake_stripe.refunds) == 4
+        assert {r["amount"] for r in fake_stripe.refunds.values()} == {36000}
+        
+        for booking in paid:
+            db_session.refresh(booking)
+            assert (booking.status, booking.payment_status, booking.refund_amount) == ("cancelled", "refunded", 360.0)
+        for booking, status in ((unpaid, "cancelled"), (processing, "confirmed"), (started, "confirmed")):
+            db_session.refresh(booking)
+            assert booking.status == status
+        
+        records = db_session.query(models.BookingCancellation).filter_by(batch_id=data["batch_id"]).all()
+        assert sorted(r.outcome for r in records) == ["cancelled", "payment_in_progress"] + ["refunded"] * 4
+        assert all(r.reason == "Maintenance" for r in records)
+        emails = db_session.query(models.EmailOutbox).filter_by(template="booking_status_update.html").all()
+        assert len(emails) == 5
+        assert {e.context["booking"]["refund_amount"] for e in emails} == {360.0, None}
+    
+    def test_failed_refund_leaves_booking_for_retry(
+        self, client: TestClient, db_session, host_auth_headers, test_user, test_listing, fake_stripe
+    ):
+        """Test a failed refund leaves the booking cancelled pending refund, and a retry does not refund twice"""
+        refunded = self._paid_booking(db_session, fake_stripe, test_listing, test_user, 10)
+        unknown = self._booking(db_session, test_listing, test_user, 20, payment_status="paid", intent_id="pi_missing")
+        
+        data = client.post(f"/listings/{test_listing.id}/cancel-bookings", json={}, headers=host_auth_headers).json()
+        assert (data["refunded"], data["failed"]) == (1, 1)
+        failed = next(o for o in data["outcomes"] if o["booking_id"] == unknown.id)
+        assert failed["outcome"] == "refund_failed"
+        db_session.refresh(unknown)
+        assert (unknown.status, unknown.payment_status) == ("cancelled", "refund_pending")
+        
+        fake_stripe.add_payment_intent(36000, status="succeeded", intent_id="pi_missing")
+        data = client.post(f"/listings/{test_listing.id}/cancel-bookings", json={}, headers=host_auth_headers).json()
+        assert [o["booking_id"] for o in data["outcomes"]] == [unknown.id]
+        assert data["refunded"] == 1
+        assert len(fake_stripe.refunds) == 2
+        db_session.refresh(refunded)
+        assert refunded.refund_amount == 360.0
+        db_session.refresh(unknown)
+        assert (unknown.status, unknown.payment_status, unknown.refund_amount) == ("cancelled", "refunded", 360.0)
+    
+    def test_ranged_retry_after_failed_refund(
+        self, client: TestClient, db_session, host_auth_headers, test_user, test_listing, fake_stripe
+    ):
+        """Test re-running a ranged cancellation retries the booking whose refund failed"""
+        unknown = self._booking(db_session, test_listing, test_user, 10, payment_status="paid", intent_id="pi_missing")
+        start = (datetime.now() + timedelta(days=9)).date()
+        body = {"start_date": start.isoformat(), "end_date": (start + timedelta(days=5)).isoformat()}
+        
+        data = client.post(f"/listings/{test_listing.id}/cancel-bookings", json=body, headers=host_auth_headers).json()
+        assert data["failed"] == 1
+        
+        fake_stripe.add_payment_intent(36000, status="succeeded", intent_id="pi_missing")
+        data = client.post(f"/listings/{test_listing.id}/cancel-bookings", json=body, headers=host_auth_headers).json()
+        
+        assert [o["booking_id"] for o in data["outcomes"]] == [unknown.id]
+        assert data["refunded"] == 1
+        assert len(fake_stripe.refunds) == 1
+        db_session.refresh(unknown)
+        assert (unknown.status, unknown.payment_status) == ("cancelled", "refunded")
+    
+    def test_date_range_limits_cancellation(
+        self, client: TestClient, db_session, host_auth_headers, test_user, test_listing
+    ):
+        """Test only bookings overlapping the range are cancelled"""
+        inside = self._booking(db_session, test_listing, test_user, 10)
+        outside = self._booking(db_session, test_listing, test_user, 30)
+        start = (datetime.now() + timedelta(days=9)).date()
+        
+        response = client.post(f"/listings/{test_listing.id}/cancel-bookings", json={
+            "start_date": start.isoformat(),
+            "end_date": (start + timedelta(days=5)).isoformat()
+        }, headers=host_auth_headers)
+        
+        assert response.status_code == 200
+        assert [o["booking_id"] for o in response.json()["outcomes"]] == [inside.id]
+        db_session.refresh(outside)
+        assert outside.status == "confirmed"
+    
+    def test_cancel_bookings_not_owner(self, client: TestClient, auth_headers, test_listing):
+        """Test only the listing's host can cancel its bookings"""
+        response = client.post(f"/listings/{test_listing.id}/cancel-bookings", json={}, headers=auth_headers)
+        
+        assert response.status_code == 403
@@ -0,0 +1,68 @@
+import copy
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from tests.conftest import TINY_DATASET
+from tools import loadtest
+
+
+def report_with(p95=100.0, rps=50.0, queries=3.0, error_rate=0.0):
+    scenario = {
+        "requests": 500, "errors": 0, "rejected": 0, "error_rate": error_rate, "throughput_rps": rps,
+        "latency_ms": {"mean": 40.0, "p50": 30.0, "p95": p95, "p99": p95 * 1.5, "max": p95 * 2},
+        "db_queries_per_request": queries, "db_ms_per_request": 5.0
+    }
+    return {"scenarios": {"search": scenario, "detail": copy.deepcopy(scenario)}}
+
+
+class TestWorkload:
+    """Test driving the mix against the app"""
+
+    def test_report(self, dataset, client: TestClient):
+        """Test every scenario is measured with latency percentiles and statement counts"""
+        report = loadtest.run_workload(lambda: client, dataset, duration=1.0, concurrency=1, seed=3)
+
+        assert report["overall"]["requests"] > 0
+        assert report["overall"]["errors"] == 0
+        for name in loadtest.DEFAULT_MIX:
+            scenario = report["scenarios"][name]
+            if scenario["requests"]:
+                latency = scenario["latency_ms"]
+                assert latency["p50"] <= latency["p95"] <= latency["p99"] <= latency["max"]
+                assert scenario["db_queries_per_request"] >= 1
+        assert report["meta"]["dataset"]["listings"] == TINY_DATASET["listings"]
+
+    def test_bad_credentials_abort(self, client: TestClient, db_session):
+        """Test the run stops before measuring when users cannot log in"""
+        with pytest.raises(RuntimeError):
+            loadtest.run_workload(lambda: TestClient(app), {**TINY_DATASET, "hosts": 3, "cities": ["Lisbon"]}, duration=0.1, concurrency=2)
+
+
+class TestBaselineComparison:
+    """Test regressions against a stored report fail the run"""
+
+    def test_within_tolerance(self):
+        """Test noise inside the tolerance passes"""
+        assert loadtest.compare_reports(report_with(p95=110.0, rps=46.0), report_with(), tolerance=0.15) == []
+
+    def test_regressions_reported(self):
+        """Test slower, slower-throughput and chattier scenarios are all flagged"""
+        regressions = loadtest.compare_reports(report_with(p95=130.0, rps=30.0, queries=5.0), report_with(), tolerance=0.15)
+
+        assert any("search: p95" in message for message in regressions)
+        assert any("detail: throughput" in message for message in regressions)
+        assert any("5.0 SQL statements" in message for message in regressions)
+
+    def test_missing_scenario(self):
+        """Test a scenario that stopped running counts as a regression"""
+        current = report_with()
+        del current["scenarios"]["detail"]
+
+        assert loadtest.compare_reports(current, report_with()) == ["detail: no requests in this run"]
+
+    def test_server_timing(self):
+        """Test the statement count is read from the app's header"""
+        assert loadtest.parse_server_timing('db;dur=12.5;desc="4 queries", app;dur=20.1') == (12.5, 4)
+        assert loadtest.parse_server_timing(None) == (None, None)
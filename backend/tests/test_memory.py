@@ -0,0 +1,98 @@
+import os
+import tracemalloc
+
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from app import memory
+from app.config import settings
+
+retained = []
+
+
+@pytest.fixture
+def tracing(client: TestClient, admin_auth_headers):
+    response = client.post("/admin/memory/tracing?frames=5", headers=admin_auth_headers)
+    assert response.status_code == 200
+    yield response.json()
+    client.delete("/admin/memory/tracing", headers=admin_auth_headers)
+    memory.request_sampler.samples.clear()
+    retained.clear()
+
+
+class TestMemoryStats:
+    """Test the per-worker memory report"""
+
+    def test_stats(self, client: TestClient, admin_auth_headers):
+        """Test RSS and GC figures come from the serving worker"""
+        response = client.get("/admin/memory", headers=admin_auth_headers)
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["pid"] == os.getpid()
+        assert data["rss_bytes"] > 0
+        assert len(data["gc_generations"]) == 3
+        assert data["tracing"] is False and data["traced_bytes"] is None
+
+    def test_gauges(self):
+        """Test RSS and GC counts are exported for Prometheus"""
+        memory.export_memory_gauges()
+
+        assert REGISTRY.get_sample_value("worker_resident_memory_bytes") > 0
+        assert REGISTRY.get_sample_value("worker_gc_collections", {"generation": "0"}) is not None
+
+    def test_requires_admin(self, client: TestClient, auth_headers):
+        """Test regular users cannot reach the memory surface"""
+        assert client.get("/admin/memory", headers=auth_headers).status_code == 403
+        assert client.post("/admin/memory/tracing", headers=auth_headers).status_code == 403
+
+
+class TestAllocationSnapshots:
+    """Test tracemalloc snapshots and diffs"""
+
+    def test_snapshot_needs_tracing(self, client: TestClient, admin_auth_headers):
+        """Test snapshots are refused while tracing is off"""
+        assert client.post("/admin/memory/snapshots", headers=admin_auth_headers).status_code == 409
+
+    def test_diff_points_at_growing_site(self, client: TestClient, admin_auth_headers, tracing):
+        """Test the second snapshot's diff ranks the allocation site that grew"""
+        assert tracing["tracing"] is True and tracing["traced_frames"] == 5
+        first = client.post("/admin/memory/snapshots", headers=admin_auth_headers).json()
+        assert first["diff"] is None
+
+        retained.extend(bytearray(1024) for _ in range(2000))
+        second = client.post("/admin/memory/snapshots?limit=5", headers=admin_auth_headers).json()
+
+        top_change = second["diff"][0]
+        assert "test_memory.py" in top_change["location"]
+        assert top_change["size_diff_bytes"] >= 2000 * 1024
+        assert len(second["top"]) <= 5
+
+
+class TestRequestAllocation:
+    """Test per-request allocation sampling"""
+
+    def test_sampled_requests_by_route(self, client: TestClient, admin_auth_headers, tracing, test_listing, monkeypatch):
+        """Test sampled requests are summarised per route template"""
+        monkeypatch.setattr(settings, "MEMORY_REQUEST_SAMPLE_RATE", 1.0)
+        for _ in range(3):
+            assert client.get(f"/listings/{test_listing.id}").status_code == 200
+
+        routes = {item["route"]: item for item in client.get("/admin/memory/requests", headers=admin_auth_headers).json()}
+
+        listing = routes["/listings/{listing_id}"]
+        assert listing["samples"] == 3
+        assert listing["max_peak_bytes"] > 0
+        assert REGISTRY.get_sample_value(
+            "http_request_peak_allocation_bytes_count", {"route": "/listings/{listing_id}"}
+        ) >= 3
+
+    def test_not_sampled_without_tracing(self, client: TestClient, test_listing, monkeypatch):
+        """Test nothing is measured while tracemalloc is off"""
+        monkeypatch.setattr(settings, "MEMORY_REQUEST_SAMPLE_RATE", 1.0)
+        assert not tracemalloc.is_tracing()
+
+        client.get(f"/listings/{test_listing.id}")
+
+        assert len(memory.request_sampler.samples) == 0
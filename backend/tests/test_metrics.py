@@ -0,0 +1,142 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY, CollectorRegistry, multiprocess
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+from app.metrics import instrument_engine
+from app.services.resilience import CircuitBreaker, CircuitOpenError
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+class TestRequestMetrics:
+    """Test the /metrics endpoint and per-route request metrics"""
+
+    def test_requests_labelled_by_route_template(self, client: TestClient, test_listing):
+        """Test requests for different listings share one route series"""
+        labels = {"method": "GET", "route": "/listings/{listing_id}", "status": "200"}
+        before = sample("http_requests_total", **labels)
+        timed = sample("http_request_duration_seconds_count", method="GET", route="/listings/{listing_id}")
+
+        client.get(f"/listings/{test_listing.id}")
+        client.get(f"/listings/{test_listing.id}")
+        client.get("/listings/999999")
+
+        assert sample("http_requests_total", **labels) == before + 2
+        assert sample("http_requests_total", **{**labels, "status": "404"}) >= 1
+        assert sample(
+            "http_request_duration_seconds_count", method="GET", route="/listings/{listing_id}"
+        ) == timed + 3
+
+    def test_metrics_endpoint(self, client: TestClient):
+        """Test the exposition format is served, unmatched paths collapse into one label"""
+        client.get("/no-such-path/123")
+
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        body = response.text
+        assert 'route="<unmatched>"' in body
+        assert "/no-such-path/123" not in body
+        assert "http_requests_in_progress" in body
+
+
+class TestDependencyMetrics:
+    """Test circuit breakers record dependency latency"""
+
+    def test_outcomes_and_rejections(self):
+        """Test successes, failures and fast-failed calls are told apart"""
+        breaker = CircuitBreaker("metrics_dep", failure_threshold=1, reset_timeout=60)
+        breaker.call(lambda: "ok")
+        with pytest.raises(ConnectionError):
+            breaker.call(self._fail)
+        with pytest.raises(CircuitOpenError):
+            breaker.call(lambda: "ok")
+
+        count = "dependency_request_duration_seconds_count"
+        assert sample(count, dependency="metrics_dep", outcome="success") == 1
+        assert sample(count, dependency="metrics_dep", outcome="failure") == 1
+        assert sample("dependency_circuit_rejections_total", dependency="metrics_dep") == 1
+
+    def _fail(self):
+        raise ConnectionError("down")
+
+
+class TestPoolMetrics:
+    """Test pool occupancy and checkout wait metrics"""
+
+    def test_pool_gauges_follow_checkouts(self, tmp_path):
+        """Test checked-out and overflow gauges track connections in use"""
+        engine = create_engine(
+            f"sqlite:///{tmp_path / 'pool.db'}", poolclass=QueuePool, pool_size=1, max_overflow=2
+        )
+        instrument_engine(engine)
+        waits = sample("db_pool_wait_seconds_count")
+
+        first, second = engine.connect(), engine.connect()
+        first.execute(text("SELECT 1"))
+        assert sample("db_pool_checked_out") == 2
+        assert sample("db_pool_overflow") == 1
+        assert sample("db_pool_size") == 1
+
+        second.close()
+        assert sample("db_pool_checked_out") == 1
+        assert sample("db_pool_overflow") == 1
+        first.close()
+        assert sample("db_pool_checked_out") == 0
+        assert sample("db_pool_overflow") == 0
+        assert sample("db_pool_wait_seconds_count") == waits + 2
+
+        # A disposed engine gets a new pool, which is instrumented too
+        engine.dispose()
+        with engine.connect():
+            assert sample("db_pool_checked_out") == 1
+        assert sample("db_pool_wait_seconds_count") == waits + 3
+
+    def test_pool_timeout_counted_and_logged(self, tmp_path, caplog):
+        """Test a checkout that gives up is counted and its wait logged with the pool status"""
+        engine = create_engine(
+            f"sqlite:///{tmp_path / 'pool.db'}", poolclass=QueuePool, pool_size=1, max_overflow=0, pool_timeout=0.05
+        )
+        instrument_engine(engine, slow_checkout_seconds=0.01)
+        timeouts = sample("db_pool_timeouts_total")
+
+        with engine.connect():
+            with pytest.raises(PoolTimeoutError):
+                engine.connect()
+        assert sample("db_pool_timeouts_total") == timeouts + 1
+        assert "for a database connection (Pool size: 1" in caplog.text
+
+
+class TestMultiprocessMetrics:
+    """Test metrics from several worker processes are merged"""
+
+    def test_counters_sum_across_processes(self, tmp_path):
+        """Test each worker's samples land in the shared directory and add up"""
+        script = (
+            "from app.metrics import HTTP_REQUESTS, HTTP_REQUESTS_IN_PROGRESS, mark_process_dead\n"
+            "HTTP_REQUESTS.labels('GET', '/listings/', '200').inc(3)\n"
+            "HTTP_REQUESTS_IN_PROGRESS.labels('GET').inc()\n"
+            "mark_process_dead()\n"
+        )
+        env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}
+        for _ in range(2):
+            subprocess.run([sys.executable, "-c", script], cwd=BACKEND_DIR, env=env, check=True)
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=str(tmp_path))
+        labels = {"method": "GET", "route": "/listings/", "status": "200"}
+        assert registry.get_sample_value("http_requests_total", labels) == 6
+        # Live gauges of exited workers are dropped
+        assert not registry.get_sample_value("http_requests_in_progress", {"method": "GET"})
@@ -397,4 +397,129 @@ class TestStripeService:
         assert result == mock_event
         mock_construct.assert_called_once_with(
             b'payload', 'signature', None  # webhook secret would be None in test
-        ) 
\ No newline at end of file
+        )
+
+
+class TestWebhookInbox:
+    """Test Stripe webhook inbox storage and processing"""
+
+    @pytest.fixture
+    def processing_booking(self, db_session, test_user, test_listing):
+        from datetime import datetime, timedelta
+        booking = models.Booking(
+            listing_id=test_listing.id,
+            customer_id=test_user.id,
+            check_in_date=datetime.now() + timedelta(days=7),
+            check_out_date=datetime.now() + timedelta(days=10),
+            guest_count=2,
+            total_price=360.0,
+            status="pending",
+            payment_status="processing",
+            stripe_payment_intent_id="pi_inbox_123"
+        )
+        db_session.add(booking)
+        db_session.commit()
+        db_session.refresh(booking)
+        return booking
+
+    @staticmethod
+    def make_event(event_id, event_type, created, payment_intent_id="pi_inbox_123"):
+        return {
+            "id": event_id,
+            "type": event_type,
+            "created": created,
+            "data": {"object": {"object": "payment_intent", "id": payment_intent_id}}
+        }
+
+    def post_event(self, client, event):
+        with patch.object(StripeService, "construct_webhook_event", return_value=event):
+            return client.post("/payments/webhook", content=b"{}", headers={"stripe-signature": "sig"})
+
+    def test_webhook_stores_event_without_applying_it(self, client: TestClient, db_session, processing_booking):
+        """Test the webhook acknowledges after storing the event"""
+        response = self.post_event(client, self.make_event("evt_1", "payment_intent.succeeded", 100))
+        assert response.status_code == 200
+        assert response.json() == {"status": "success"}
+
+        event = db_session.query(models.WebhookEvent).one()
+        assert event.status == "pending"
+        assert event.payment_intent_id == "pi_inbox_123"
+        db_session.refresh(processing_booking)
+        assert processing_booking.payment_status == "processing"
+
+    def test_duplicate_delivery_is_ignored(self, client: TestClient, db_session, processing_booking):
+        """Test a redelivered event id is acknowledged but not stored again"""
+        event = self.make_event("evt_1", "payment_intent.succeeded", 100)
+        assert self.post_event(client, event).json() == {"status": "success"}
+        response = self.post_event(client, event)
+        assert response.status_code == 200
+        assert response.json() == {"status": "duplicate"}
+        assert db_session.query(models.WebhookEvent).count() == 1
+
+    def test_events_applied_in_stripe_order(self, client: TestClient, db_session, processing_booking):
+        """Test a late-delivered failure does not override a later success"""
+        from app.services.webhook_inbox import process_pending_events
+        self.post_event(client, self.make_event("evt_2", "payment_intent.succeeded", 200))
+        self.post_event(client, self.make_event("evt_1", "payment_intent.payment_failed", 100))
+
+        assert process_pending_events(db_session) == 2
+        db_session.refresh(processing_booking)
+        assert processing_booking.payment_status == "paid"
+        assert processing_booking.status == "confirmed"
+        statuses = {e.event_id: e.status for e in db_session.query(models.WebhookEvent)}
+        assert statuses == {"evt_1": "processed", "evt_2": "processed"}
+
+    def test_failed_event_blocks_later_events_until_retried(self, client: TestClient, db_session, processing_booking):
+        """Test a failing event is retried with backoff and holds back later events for its payment intent"""
+        from app.services import webhook_inbox
+        self.post_event(client, self.make_event("evt_1", "payment_intent.payment_failed", 100))
+        self.post_event(client, self.make_event("evt_2", "payment_intent.succeeded", 200))
+
+        with patch.dict(webhook_inbox.EVENT_HANDLERS, {"payment_intent.payment_failed": Mock(side_effect=RuntimeError("db down"))}):
+            assert webhook_inbox.process_pending_events(db_session) == 1
+
+        first = db_session.query(models.WebhookEvent).filter_by(event_id="evt_1").one()
+        assert first.status == "pending"
+        assert first.attempts == 1
+        assert first.last_error == "db down"
+        # evt_2 waits behind evt_1, which is not due again yet
+        assert webhook_inbox.process_pending_events(db_session) == 0
+        db_session.refresh(processing_booking)
+        assert processing_booking.payment_status == "processing"
+
+
+class TestPaymentIdempotency:
+    """Test Idempotency-Key handling on payment intents"""
+
+    def test_payment_intent_retry_calls_stripe_once(self, client: TestClient, auth_headers, db_session, test_user, test_listing):
+        """Test a retried intent request is replayed and the key reaches Stripe"""
+        from datetime import datetime, timedelta
+        booking = models.Booking(
+            listing_id=test_listing.id,
+            customer_id=test_user.id,
+            check_in_date=datetime.now() + timedelta(days=7),
+            check_out_date=datetime.now() + timedelta(days=10),
+            total_price=360.0,
+            status="pending"
+        )
+        db_session.add(booking)
+        db_session.commit()
+
+        headers = {**auth_headers, "Idempotency-Key": "intent-retry-1"}
+        with patch.object(StripeService, "create_payment_intent") as mock_create:
+            mock_create.return_value = {
+                "client_secret": "pi_idem_secret",
+                "payment_intent_id": "pi_idem_123",
+                "amount": 360.0,
+                "currency": "usd"
+            }
+            first = client.post("/payments/create-payment-intent", json={"booking_id": booking.id}, headers=headers)
+            second = client.post("/payments/create-payment-intent", json={"booking_id": booking.id}, headers=headers)
+
+        assert first.status_code == 200
+        assert second.status_code == 200
+        assert second.json() == first.json()
+        assert second.headers["Idempotent-Replayed"] == "true"
+        mock_create.assert_called_once()
+        assert mock_create.call_args[1]["idempotency_key"].startswith("stayhub-payment_intent-")
+
@@ -0,0 +1,121 @@
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import profiling
+from app.config import settings
+from app.main import app
+
+
+def busy_handler():
+    time.sleep(0.05)
+    return {"ok": True}
+
+
+@pytest.fixture
+def profiled(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(settings, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "PROFILE_INTERVAL_MS", 1.0)
+    return tmp_path
+
+
+@pytest.fixture
+def profiled_client(profiled, db_session):
+    """The app behind the profiling middleware, as main.py installs it when enabled"""
+    return TestClient(profiling.ProfilingMiddleware(app))
+
+
+@pytest.fixture
+def profile_headers(client: TestClient, admin_auth_headers, profiled):
+    response = client.post("/admin/profiles/token", headers=admin_auth_headers)
+    assert response.status_code == 200
+    return {response.json()["header"]: response.json()["token"]}
+
+
+class TestStackSampler:
+    """Test sampling endpoints that run in the threadpool"""
+
+    def test_samples_sync_endpoint(self, profiled, monkeypatch):
+        """Test a sync handler's stacks are captured, rooted at the endpoint"""
+        monkeypatch.setattr(settings, "PROFILE_SAMPLE_RATE", 1.0)
+        busy = FastAPI()
+        busy.get("/busy/{item_id}")(busy_handler)
+
+        response = TestClient(profiling.ProfilingMiddleware(busy)).get("/busy/1")
+
+        capture = profiling.load_capture(response.headers[profiling.PROFILE_ID_HEADER])
+        assert capture["trigger"] == "sampled"
+        assert capture["route"] == "/busy/{item_id}"
+        assert capture["samples"] > 5
+        assert all(stack.startswith("busy_handler (test_profiling.py") for stack in capture["stacks"])
+
+
+class TestProfilingMiddleware:
+    """Test choosing and storing profiled requests"""
+
+    def test_token_triggers_profile(self, profiled_client, profile_headers, test_listing):
+        """Test a request with a valid token is profiled and others are not"""
+        plain = profiled_client.get(f"/listings/{test_listing.id}")
+        assert profiling.PROFILE_ID_HEADER not in plain.headers
+
+        response = profiled_client.get(f"/listings/{test_listing.id}", headers=profile_headers)
+
+        assert response.status_code == 200
+        [capture] = profiling.list_captures()
+        assert capture["id"] == response.headers[profiling.PROFILE_ID_HEADER]
+        assert (capture["trigger"], capture["route"], capture["status"]) == ("token", "/listings/{listing_id}", 200)
+
+    def test_invalid_token_ignored(self, profiled_client, test_listing):
+        """Test forged or access tokens do not trigger profiling"""
+        response = profiled_client.get(f"/listings/{test_listing.id}", headers={"X-Profile-Token": "forged"})
+
+        assert response.status_code == 200
+        assert profiling.list_captures() == []
+
+    def test_profile_token_cannot_authenticate(self, client: TestClient, profile_headers):
+        """Test the profile token is not usable as an access token"""
+        token = profile_headers[profiling.PROFILE_TOKEN_HEADER]
+        response = client.get("/auth/me", headers={"Authorization": f"Bearer {token}"})
+
+        assert response.status_code == 401
+
+    def test_ring_buffer_keeps_newest(self, profiled, monkeypatch):
+        """Test only the newest captures are kept on disk"""
+        monkeypatch.setattr(settings, "PROFILE_MAX_CAPTURES", 3)
+        for i in range(5):
+            profiling.save_capture({"id": f"{1000 + i}_1", "stacks": {}})
+
+        assert [c["id"] for c in profiling.list_captures()] == ["1004_1", "1003_1", "1002_1"]
+        assert len(list(profiled.iterdir())) == 3
+
+
+class TestProfileAdmin:
+    """Test the admin profile endpoints"""
+
+    def test_list_and_download(self, client: TestClient, admin_auth_headers, profiled):
+        """Test captures are listed and served as folded stacks"""
+        profiling.save_capture({
+            "id": "1000_1", "created_at": "2030-01-01T00:00:00", "trigger": "token", "method": "GET",
+            "path": "/listings/1", "route": "/listings/{listing_id}", "status": 200, "duration_ms": 12.5,
+            "interval_ms": 1.0, "samples": 3, "stacks": {"get_listing (listings.py:113);query (orm.py:1)": 3}
+        })
+
+        listed = client.get("/admin/profiles", headers=admin_auth_headers)
+        assert listed.status_code == 200
+        assert listed.json()[0]["route"] == "/listings/{listing_id}"
+
+        folded = client.get("/admin/profiles/1000_1", headers=admin_auth_headers)
+        assert folded.text == "get_listing (listings.py:113);query (orm.py:1) 3\n"
+        assert client.get("/admin/profiles/..%2Fsecret", headers=admin_auth_headers).status_code == 404
+
+    def test_requires_admin(self, client: TestClient, auth_headers, profiled):
+        """Test non-admins cannot mint tokens or read captures"""
+        assert client.post("/admin/profiles/token", headers=auth_headers).status_code == 403
+        assert client.get("/admin/profiles", headers=auth_headers).status_code == 403
+
+    def test_token_refused_when_disabled(self, client: TestClient, admin_auth_headers):
+        """Test no token is issued while profiling is off"""
+        assert client.post("/admin/profiles/token", headers=admin_auth_headers).status_code == 400
@@ -0,0 +1,84 @@
+import logging
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app.config import settings
+from app.query_log import normalize_sql
+
+
+def server_timing(response):
+    db, app = response.headers["server-timing"].split(", ")
+    name, duration, desc = db.split(";")
+    return name, float(duration.split("=")[1]), desc, app
+
+
+class TestNormalizeSql:
+    """Test slow-query SQL normalization"""
+
+    def test_literals_and_in_lists(self):
+        """Test literals become placeholders and expanded IN lists collapse"""
+        sql = normalize_sql(
+            "SELECT bookings.id\nFROM bookings\n  WHERE bookings.status = 'confirmed' AND bookings.listing_id IN "
+            "(%(listing_id_1_1)s, %(listing_id_1_2)s, %(listing_id_1_3)s) LIMIT 20"
+        )
+        assert sql == "SELECT bookings.id FROM bookings WHERE bookings.status = ? AND bookings.listing_id IN (...) LIMIT ?"
+
+    def test_identifiers_untouched(self):
+        """Test digits inside aliases survive and qmark IN lists collapse"""
+        assert normalize_sql("SELECT anon_1.id FROM t AS anon_1 WHERE x IN (?, ?)") == (
+            "SELECT anon_1.id FROM t AS anon_1 WHERE x IN (...)"
+        )
+
+
+class TestRequestQueryTiming:
+    """Test per-request SQL accounting"""
+
+    def test_server_timing_header(self, client: TestClient, test_listing):
+        """Test responses report statement count and time"""
+        response = client.get(f"/listings/{test_listing.id}")
+
+        assert response.status_code == 200
+        name, duration, desc, app = server_timing(response)
+        assert name == "db" and duration >= 0
+        assert int(desc.split('"')[1].split()[0]) >= 1
+        assert app.startswith("app;dur=")
+
+    def test_header_can_be_disabled(self, client: TestClient, monkeypatch):
+        """Test Server-Timing is left out when disabled"""
+        monkeypatch.setattr(settings, "SERVER_TIMING_ENABLED", False)
+
+        assert "server-timing" not in client.get("/health").headers
+
+    def test_slow_query_logged_with_route(self, client: TestClient, test_listing, monkeypatch, caplog):
+        """Test statements over the threshold are logged with the issuing route"""
+        monkeypatch.setattr(settings, "SLOW_QUERY_THRESHOLD_MS", 1e-6)
+
+        with caplog.at_level(logging.WARNING, logger="app.query_log"):
+            client.get(f"/listings/{test_listing.id}")
+
+        slow = [r.getMessage() for r in caplog.records if r.getMessage().startswith("Slow query")]
+        assert slow
+        assert all("from /listings/{listing_id}: SELECT" in message for message in slow)
+        assert all(f"= {test_listing.id}" not in message for message in slow)
+
+    def test_query_budget(self, client: TestClient, test_listing, monkeypatch, caplog):
+        """Test requests running more statements than the budget are logged"""
+        monkeypatch.setattr(settings, "SQL_QUERY_BUDGET", 1)
+
+        with caplog.at_level(logging.WARNING, logger="app.query_log"):
+            client.get(f"/listings/{test_listing.id}")
+
+        assert any(
+            "GET /listings/{listing_id} ran" in r.getMessage() and "over the budget of 1" in r.getMessage()
+            for r in caplog.records
+        )
+
+    def test_background_queries(self, db_session, monkeypatch, caplog):
+        """Test statements outside a request are logged but not attributed to one"""
+        monkeypatch.setattr(settings, "SLOW_QUERY_THRESHOLD_MS", 1e-6)
+
+        with caplog.at_level(logging.WARNING, logger="app.query_log"):
+            db_session.execute(text("SELECT 1"))
+
+        assert any("from <background>: SELECT ?" in r.getMessage() for r in caplog.records)
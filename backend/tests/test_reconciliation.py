@@ -0,0 +1,148 @@
+from datetime import datetime, timedelta
+
+from app import models
+from app.services.payment_reconciliation import reconcile_payments
+from app.services.stripe_service import StripeService
+
+
+class TestStripeIntentListing:
+    """Test listing PaymentIntents follows Stripe pagination"""
+
+    def test_iterates_all_pages_newest_first(self, fake_stripe):
+        """Test every intent in the window is returned across pages"""
+        now = int(datetime.now().timestamp())
+        for i in range(25):
+            fake_stripe.add_payment_intent(1000, status="succeeded", created=now - i, intent_id=f"pi_{i:03d}")
+        fake_stripe.add_payment_intent(1000, created=now - 10_000, intent_id="pi_old")
+
+        intents = list(StripeService.iter_payment_intents(now - 100, page_size=10))
+        assert [intent["id"] for intent in intents] == [f"pi_{i:03d}" for i in range(25)]
+        assert intents[0] == {"id": "pi_000", "status": "succeeded", "amount_received": 10.0, "has_payment_error": False}
+        assert fake_stripe.request_count == 3
+
+
+class TestPaymentReconciliation:
+    """Test the batch payment reconciliation job"""
+
+    def add_booking(self, db_session, listing, user, index, payment_status, intent_id):
+        check_in = datetime.now() + timedelta(days=7 + 4 * index)
+        booking = models.Booking(
+            listing_id=listing.id,
+            customer_id=user.id,
+            check_in_date=check_in,
+            check_out_date=check_in + timedelta(days=3),
+            total_price=300.0,
+            status="pending",
+            payment_status=payment_status,
+            stripe_payment_intent_id=intent_id
+        )
+        db_session.add(booking)
+        return booking
+
+    def test_corrects_bookings_in_batches(self, db_session, test_user, test_listing, fake_stripe):
+        """Test processing bookings are corrected from listed intents with few API calls"""
+        outcomes = {}
+        for i in range(250):
+            intent_status = ["succeeded", "canceled", "requires_payment_method", "processing"][i % 4]
+            intent = fake_stripe.add_payment_intent(
+                30000,
+                status=intent_status,
+                last_payment_error={"code": "card_declined"} if i % 8 == 2 else None
+            )
+            booking = self.add_booking(db_session, test_listing, test_user, i, "processing", intent["id"])
+            outcomes[intent["id"]] = (booking, intent_status)
+        db_session.commit()
+
+        summary = reconcile_payments(db_session, lookback=timedelta(days=1), batch_size=100)
+
+        assert summary["checked"] == 250
+        assert summary["marked_paid"] == 63
+        assert summary["marked_canceled"] == 63
+        assert summary["marked_failed"] == 31
+        assert summary["missing"] == 0
+        # Three list pages instead of one retrieve per booking
+        assert fake_stripe.request_count == 3
+
+        expected = {"succeeded": "paid", "canceled": "canceled", "processing": "processing"}
+        for booking, intent_status in outcomes.values():
+            db_session.refresh(booking)
+            if intent_status == "requires_payment_method":
+                declined = fake_stripe.payment_intents[booking.stripe_payment_intent_id]["last_payment_error"]
+                assert booking.payment_status == ("failed" if declined else "processing")
+            else:
+                assert booking.payment_status == expected[intent_status]
+            assert booking.status == ("confirmed" if intent_status == "succeeded" else "pending")
+
+    def test_confirmed_bookings_queue_confirmation(self, db_session, test_user, test_listing, fake_stripe):
+        """Test a booking confirmed by reconciliation gets its confirmation email, like the webhook path"""
+        intent = fake_stripe.add_payment_intent(30000, status="succeeded")
+        booking = self.add_booking(db_session, test_listing, test_user, 0, "processing", intent["id"])
+        db_session.commit()
+
+        summary = reconcile_payments(db_session, lookback=timedelta(days=1), batch_size=100)
+
+        assert summary["marked_paid"] == 1
+        emails = db_session.query(models.EmailOutbox).filter(
+            models.EmailOutbox.template == "booking_confirmation.html"
+        ).all()
+        assert [email.to_email for email in emails] == [test_user.email]
+        assert emails[0].context["booking"]["booking_id"] == booking.id
+
+    def test_streams_intents_batch_by_batch(self, db_session, test_user, test_listing):
+        """Test each batch of intents is applied before the next is fetched, not collected up front"""
+        from app import models
+        for i in range(5):
+            self.add_booking(db_session, test_listing, test_user, i, "processing", f"pi_stream_{i}")
+        db_session.commit()
+        paid_when_fetched = []
+
+        def list_intents(created_gte):
+            for i in range(5):
+                paid_when_fetched.append(db_session.query(models.Booking).filter(
+                    models.Booking.payment_status == "paid"
+                ).count())
+                yield {"id": f"pi_stream_{i}", "status": "succeeded", "amount_received": 300.0, "has_payment_error": False}
+
+        summary = reconcile_payments(db_session, lookback=timedelta(days=1), batch_size=2, list_intents=list_intents)
+
+        assert (summary["checked"], summary["marked_paid"], summary["missing"]) == (5, 5, 0)
+        assert paid_when_fetched == [0, 0, 2, 2, 4]
+
+    def test_paid_mismatches_are_only_reported(self, db_session, test_user, test_listing, fake_stripe):
+        """Test paid bookings Stripe disagrees with are left alone"""
+        refunded = fake_stripe.add_payment_intent(30000, status="canceled")
+        paid = self.add_booking(db_session, test_listing, test_user, 0, "paid", refunded["id"])
+        unknown = self.add_booking(db_session, test_listing, test_user, 1, "processing", "pi_unknown")
+        db_session.commit()
+
+        summary = reconcile_payments(db_session, lookback=timedelta(days=1), batch_size=100)
+
+        assert summary["inconsistent"] == 1
+        assert summary["missing"] == 1
+        db_session.refresh(paid)
+        db_session.refresh(unknown)
+        assert paid.payment_status == "paid"
+        assert unknown.payment_status == "processing"
+
+    def test_reconciles_processing_bookings_older_than_lookback(self, db_session, test_user, test_listing, fake_stripe):
+        """Test processing bookings of any age are retrieved and corrected, while old paid ones are not rechecked"""
+        created = int((datetime.now() - timedelta(days=40)).timestamp())
+        stuck_intent = fake_stripe.add_payment_intent(30000, status="succeeded", created=created)
+        paid_intent = fake_stripe.add_payment_intent(30000, status="canceled", created=created)
+        stuck = self.add_booking(db_session, test_listing, test_user, 0, "processing", stuck_intent["id"])
+        lost = self.add_booking(db_session, test_listing, test_user, 1, "processing", "pi_lost")
+        paid = self.add_booking(db_session, test_listing, test_user, 2, "paid", paid_intent["id"])
+        db_session.commit()
+        for booking in (stuck, lost, paid):
+            booking.created_at = datetime.now() - timedelta(days=40)
+        db_session.commit()
+
+        summary = reconcile_payments(db_session, lookback=timedelta(days=30), batch_size=100)
+
+        assert (summary["checked"], summary["marked_paid"], summary["missing"], summary["inconsistent"]) == (2, 1, 1, 0)
+        # One empty list page, then a retrieve per stale booking
+        assert fake_stripe.request_count == 3
+        db_session.refresh(stuck)
+        db_session.refresh(paid)
+        assert (stuck.payment_status, stuck.status) == ("paid", "confirmed")
+        assert paid.payment_status == "paid"
@@ -0,0 +1,143 @@
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from app import replicas
+from app.config import settings
+from app.main import app
+from app.replicas import READ_PRIMARY_COOKIE, READ_PRIMARY_HEADER, Replica, ReplicaRouter, get_read_db
+from tests.conftest import TestingSessionLocal, engine
+
+
+def sessions(target):
+    return REGISTRY.get_sample_value("db_read_sessions_total", {"target": target}) or 0.0
+
+
+def replica_with_lag(name, lag):
+    replica = Replica(name, engine)
+
+    def measure_lag():
+        if isinstance(lag, Exception):
+            raise lag
+        return lag
+
+    replica.measure_lag = measure_lag
+    return replica
+
+
+def request_with(headers=None, cookies=None):
+    raw = [(key.lower().encode(), value.encode()) for key, value in (headers or {}).items()]
+    if cookies:
+        raw.append((b"cookie", "; ".join(f"{key}={value}" for key, value in cookies.items()).encode()))
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw})
+
+
+class TestReplicaRouter:
+    """Test replicas are chosen by lag and health"""
+
+    def test_lagging_replica_skipped(self):
+        """Test only replicas within the lag limit are used"""
+        router = ReplicaRouter([replica_with_lag("slow", 30.0), replica_with_lag("fast", 0.5)], max_lag=5.0, check_interval=60)
+
+        assert {router.choose().name for _ in range(20)} == {"fast"}
+
+    def test_primary_when_no_replica_usable(self):
+        """Test a failing check takes a replica out, leaving the primary"""
+        router = ReplicaRouter([replica_with_lag("down", ConnectionError("refused"))], max_lag=5.0, check_interval=60)
+
+        assert router.choose() is None
+        assert router.replicas[0].lag is None
+
+    def test_replica_not_streaming_unusable(self):
+        """Test a replica whose WAL receiver is not streaming is taken out of rotation"""
+        replica_engine = MagicMock()
+        replica_engine.dialect.name = "postgresql"
+        replica_engine.connect.return_value.__enter__.return_value.execute.return_value.scalar.return_value = None
+        router = ReplicaRouter([Replica("disconnected", replica_engine)], max_lag=5.0, check_interval=60)
+
+        assert router.choose() is None
+        assert router.replicas[0].lag is None
+
+    def test_lag_rechecked_after_interval(self):
+        """Test lag is cached between checks and a caught-up replica returns"""
+        replica = replica_with_lag("r1", 30.0)
+        router = ReplicaRouter([replica], max_lag=5.0, check_interval=60)
+        assert router.choose() is None
+
+        replica.measure_lag = lambda: 0.0
+        assert router.choose() is None
+        router.check_interval = 0
+        assert router.choose() is replica
+
+
+class TestReadYourWrites:
+    """Test clients that just wrote read from the primary"""
+
+    def test_deadline_from_header_or_cookie(self):
+        """Test a current deadline is honoured from either source"""
+        until = time.time() + 5
+
+        assert replicas.read_primary_until(request_with(headers={READ_PRIMARY_HEADER: str(until)})) == until
+        assert replicas.read_primary_until(request_with(cookies={READ_PRIMARY_COOKIE: str(until)})) == until
+
+    def test_stale_or_forged_deadline_ignored(self):
+        """Test expired, malformed and too distant deadlines route normally"""
+        for value in (str(time.time() - 1), "soon", str(time.time() + settings.DB_READ_YOUR_WRITES_SECONDS + 60)):
+            assert replicas.read_primary_until(request_with(headers={READ_PRIMARY_HEADER: value})) is None
+        assert replicas.read_primary_until(request_with()) is None
+
+    def test_middleware_marks_successful_writes(self):
+        """Test writes that succeeded set the cookie and header, reads and failures do not"""
+        demo = FastAPI()
+        demo.add_middleware(replicas.ReadYourWritesMiddleware)
+
+        @demo.get("/thing")
+        def read_thing():
+            return {}
+
+        @demo.post("/thing")
+        def write_thing(fail: bool = False):
+            if fail:
+                raise HTTPException(status_code=400)
+            return {}
+
+        client = TestClient(demo)
+
+        written = client.post("/thing")
+        assert float(written.headers[READ_PRIMARY_HEADER]) > time.time()
+        assert READ_PRIMARY_COOKIE in written.cookies
+        assert READ_PRIMARY_HEADER not in client.get("/thing").headers
+        assert READ_PRIMARY_HEADER not in client.post("/thing", params={"fail": True}).headers
+
+
+class TestReadRouting:
+    """Test read endpoints go to a replica unless the client is sticky"""
+
+    @pytest.fixture
+    def with_replica(self, db_session, monkeypatch):
+        monkeypatch.delitem(app.dependency_overrides, get_read_db)
+        monkeypatch.setattr(replicas, "SessionLocal", TestingSessionLocal)
+        replica = replica_with_lag("test-replica", 0.0)
+        replica.session_factory = TestingSessionLocal
+        monkeypatch.setattr(replicas.replica_router, "replicas", [replica])
+
+    def test_reads_use_replica(self, with_replica, client: TestClient, test_listing):
+        """Test listing detail and reviews are served from the replica"""
+        before = sessions("replica")
+
+        assert client.get(f"/listings/{test_listing.id}").status_code == 200
+        assert client.get(f"/reviews/listing/{test_listing.id}").status_code == 200
+        assert sessions("replica") == before + 2
+
+    def test_sticky_client_reads_primary(self, with_replica, client: TestClient, test_listing):
+        """Test a client inside its read-your-writes window reads from the primary"""
+        before = sessions("primary_sticky")
+
+        response = client.get(f"/listings/{test_listing.id}", headers={READ_PRIMARY_HEADER: str(time.time() + 5)})
+
+        assert response.status_code == 200
+        assert sessions("primary_sticky") == before + 1
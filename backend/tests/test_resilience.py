@@ -0,0 +1,221 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+import stripe
+from botocore.exceptions import EndpointConnectionError
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock
+
+from app import email, models
+from app.config import settings
+from app.services import s3_service, stripe_service
+from app.services.resilience import CircuitBreaker, CircuitOpenError
+from app.services.stripe_service import StripeService
+from tools.fault_servers import ERROR, OK, RESET, SLOW, FaultyHTTPServer, FaultySMTPServer
+
+PAYMENT_INTENT = {
+    "id": "pi_fault_123",
+    "object": "payment_intent",
+    "status": "succeeded",
+    "amount_received": 36000,
+    "charges": {"object": "list", "data": []}
+}
+
+
+class TestCircuitBreaker:
+    """Test circuit breaker state transitions"""
+
+    def fail(self):
+        raise ConnectionError("down")
+
+    def test_opens_after_threshold_and_fails_fast(self):
+        """Test the circuit opens after consecutive failures"""
+        breaker = CircuitBreaker("dep", failure_threshold=2, reset_timeout=60)
+        for _ in range(2):
+            with pytest.raises(ConnectionError):
+                breaker.call(self.fail)
+        assert breaker.state == CircuitBreaker.OPEN
+
+        called = MagicMock()
+        with pytest.raises(CircuitOpenError) as exc_info:
+            breaker.call(called)
+        called.assert_not_called()
+        assert exc_info.value.retry_after > 0
+
+    def test_half_open_trial_closes_on_success(self):
+        """Test a successful trial call after the reset timeout closes the circuit"""
+        breaker = CircuitBreaker("dep", failure_threshold=1, reset_timeout=0.05)
+        with pytest.raises(ConnectionError):
+            breaker.call(self.fail)
+        time.sleep(0.06)
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert breaker.call(lambda: "ok") == "ok"
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_half_open_trial_failure_reopens(self):
+        """Test a failed trial call opens the circuit again"""
+        breaker = CircuitBreaker("dep", failure_threshold=1, reset_timeout=0.05)
+        with pytest.raises(ConnectionError):
+            breaker.call(self.fail)
+        time.sleep(0.06)
+        with pytest.raises(ConnectionError):
+            breaker.call(self.fail)
+        assert breaker.state == CircuitBreaker.OPEN
+
+    def test_non_failures_do_not_count(self):
+        """Test errors the breaker is told to ignore leave it closed"""
+        breaker = CircuitBreaker("dep", failure_threshold=1, is_failure=lambda e: isinstance(e, ConnectionError))
+        with pytest.raises(ValueError):
+            breaker.call(lambda: int("card declined"))
+        assert breaker.state == CircuitBreaker.CLOSED
+
+
+class TestStripeResilience:
+    """Test Stripe calls against a fault-injecting stand-in"""
+
+    @pytest.fixture
+    def fake_stripe(self, monkeypatch):
+        with FaultyHTTPServer(delay=2.0) as server:
+            server.default_response = PAYMENT_INTENT
+            monkeypatch.setattr(stripe, "api_key", "sk_test_fault")
+            monkeypatch.setattr(stripe, "api_base", server.url)
+            monkeypatch.setattr(stripe, "max_network_retries", 0)
+            monkeypatch.setattr(stripe, "default_http_client", stripe.http_client.RequestsClient(timeout=(0.5, 0.2)))
+            breaker = CircuitBreaker(
+                "stripe", failure_threshold=2, reset_timeout=60, is_failure=stripe_service._is_stripe_outage
+            )
+            monkeypatch.setattr(stripe_service, "stripe_breaker", breaker)
+            yield server
+
+    @pytest.mark.parametrize("mode", [SLOW, ERROR, RESET])
+    def test_faults_open_circuit(self, fake_stripe, mode):
+        """Test timeouts, 5xx replies and resets open the circuit, after which Stripe is not called"""
+        fake_stripe.mode = mode
+        for _ in range(2):
+            started = time.monotonic()
+            with pytest.raises(Exception, match="Stripe error"):
+                StripeService.confirm_payment("pi_fault_123")
+            assert time.monotonic() - started < 1.5
+        assert stripe_service.stripe_breaker.state == CircuitBreaker.OPEN
+
+        requests_before = fake_stripe.request_count
+        with pytest.raises(CircuitOpenError):
+            StripeService.confirm_payment("pi_fault_123")
+        assert fake_stripe.request_count == requests_before
+
+    def test_recovers_after_reset_timeout(self, fake_stripe):
+        """Test the circuit closes once Stripe answers again"""
+        stripe_service.stripe_breaker.reset_timeout = 0.2
+        fake_stripe.mode = ERROR
+        for _ in range(2):
+            with pytest.raises(Exception):
+                StripeService.confirm_payment("pi_fault_123")
+
+        fake_stripe.mode = OK
+        time.sleep(0.25)
+        assert StripeService.confirm_payment("pi_fault_123")["status"] == "succeeded"
+        assert stripe_service.stripe_breaker.state == CircuitBreaker.CLOSED
+
+    def test_confirm_payment_returns_503_when_open(
+        self, client: TestClient, db_session, auth_headers, test_user, test_listing, fake_stripe
+    ):
+        """Test an open circuit surfaces as 503 and leaves the booking's payment state alone"""
+        booking = models.Booking(
+            listing_id=test_listing.id,
+            customer_id=test_user.id,
+            check_in_date=datetime.now() + timedelta(days=7),
+            check_out_date=datetime.now() + timedelta(days=10),
+            total_price=360.0,
+            payment_status="processing",
+            stripe_payment_intent_id="pi_fault_123"
+        )
+        db_session.add(booking)
+        db_session.commit()
+
+        fake_stripe.mode = ERROR
+        for _ in range(2):
+            with pytest.raises(Exception):
+                StripeService.confirm_payment("pi_fault_123")
+
+        response = client.post(
+            "/payments/confirm-payment",
+            json={"payment_intent_id": "pi_fault_123"},
+            headers=auth_headers
+        )
+        assert response.status_code == 503
+        assert "Retry-After" in response.headers
+        db_session.refresh(booking)
+        assert booking.payment_status == "processing"
+
+
+class TestS3Resilience:
+    """Test S3 calls are guarded by the breaker"""
+
+    @pytest.fixture
+    def failing_s3(self, monkeypatch):
+        service = object.__new__(s3_service.S3Service)
+        service.bucket_name = "test-bucket"
+        service.region = "us-east-1"
+        service.s3_client = MagicMock()
+        service.s3_client.delete_object.side_effect = EndpointConnectionError(endpoint_url="http://s3.invalid")
+        breaker = CircuitBreaker("s3", failure_threshold=2, reset_timeout=60, is_failure=s3_service._is_s3_outage)
+        monkeypatch.setattr(s3_service, "s3_breaker", breaker)
+        return service
+
+    def test_connection_errors_open_circuit(self, failing_s3):
+        """Test deletes stop reaching S3 once the circuit opens"""
+        assert failing_s3.delete_image("a.jpg") is False
+        assert failing_s3.delete_image("b.jpg") is False
+        assert s3_service.s3_breaker.state == CircuitBreaker.OPEN
+
+        assert failing_s3.delete_image("c.jpg") is False
+        assert failing_s3.s3_client.delete_object.call_count == 2
+
+
+class TestSMTPResilience:
+    """Test the pooled SMTP sender against a fault-injecting stand-in"""
+
+    @pytest.fixture
+    def smtp_server(self, monkeypatch):
+        with FaultySMTPServer(delay=2.0) as server:
+            monkeypatch.setattr(settings, "SMTP_SERVER", server.host)
+            monkeypatch.setattr(settings, "SMTP_PORT", server.port)
+            monkeypatch.setattr(settings, "SMTP_USERNAME", "")
+            monkeypatch.setattr(settings, "SMTP_USE_TLS", False)
+            monkeypatch.setattr(settings, "SMTP_START_TLS", False)
+            monkeypatch.setattr(settings, "SMTP_TIMEOUT_SECONDS", 0.3)
+            monkeypatch.setattr(settings, "SMTP_MAX_ATTEMPTS", 2)
+            breaker = CircuitBreaker("smtp", failure_threshold=2, reset_timeout=60, is_failure=email.is_transient_smtp_error)
+            monkeypatch.setattr(email, "smtp_breaker", breaker)
+            yield server
+
+    def send_many(self, service, count):
+        async def send():
+            results = [
+                await service.send_email(f"guest{i}@example.com", "Hello", "<p>Hi</p>") for i in range(count)
+            ]
+            await service.pool.close()
+            return results
+        return asyncio.run(send())
+
+    def test_connection_reused_across_messages(self, smtp_server):
+        """Test several messages go over one pooled connection"""
+        assert self.send_many(email.EmailService(), 3) == [True, True, True]
+        assert len(smtp_server.messages) == 3
+        assert smtp_server.connections == 1
+
+    @pytest.mark.parametrize("mode", [SLOW, ERROR, RESET])
+    def test_faults_open_circuit(self, smtp_server, mode):
+        """Test failing sends are retried, then the circuit opens and stops new connections"""
+        smtp_server.mode = mode
+        service = email.EmailService()
+        assert self.send_many(service, 1) == [False]
+        assert email.smtp_breaker.state == CircuitBreaker.OPEN
+
+        connections = smtp_server.connections
+        started = time.monotonic()
+        assert self.send_many(service, 1) == [False]
+        assert time.monotonic() - started < 0.1
+        assert smtp_server.connections == connections
@@ -0,0 +1,100 @@
+from datetime import date, datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.main import app
+from app.services import webhook_inbox
+from tests.conftest import TINY_DATASET, app_database
+from tools import datagen, stress
+
+
+class TestInvariants:
+    """Test the checks the stress runs rely on"""
+
+    def test_double_booked_nights(self):
+        """Test only nights held by two stays are reported; checkout day is free"""
+        stays = [
+            (date(2030, 1, 1), date(2030, 1, 3)),
+            (date(2030, 1, 3), date(2030, 1, 5)),
+            (date(2030, 1, 4), date(2030, 1, 6))
+        ]
+
+        assert stress.double_booked_nights(stays) == ["2030-01-04"]
+
+    def test_webhook_signature(self, monkeypatch):
+        """Test signed events pass the app's Stripe verification"""
+        from app.services.stripe_service import StripeService
+
+        monkeypatch.setattr(settings, "STRIPE_WEBHOOK_SECRET", "whsec_stress")
+        payload = stress.payment_succeeded_event({"id": "pi_1", "object": "payment_intent"})
+
+        event = StripeService.construct_webhook_event(payload, stress.sign_webhook(payload, "whsec_stress"))
+        assert event["data"]["object"]["id"] == "pi_1"
+
+
+class TestScenarios:
+    """Test the scenarios end to end against the app, one request at a time"""
+
+    def test_overlapping_bookings(self, dataset, client: TestClient, db_session):
+        """Test overlapping requests are turned away and no night is sold twice"""
+        report = stress.stress_bookings(
+            lambda: client, dataset, requests=30, concurrency=1, window_nights=5, engine=db_session.get_bind()
+        )
+
+        assert report["violations"] == []
+        assert report["accepted"] > 0 and report["conflicts"] > 0
+        assert report["accepted"] + report["conflicts"] == 30
+        assert report["nights_booked"] <= 5
+
+    def test_payment_race(self, dataset, client: TestClient, db_session, fake_stripe, monkeypatch):
+        """Test confirm-payment plus duplicate webhooks leave each booking paid with one email"""
+        monkeypatch.setattr(settings, "STRIPE_WEBHOOK_SECRET", "whsec_stress")
+        since = datetime.utcnow()
+
+        report = stress.race_payments(lambda: client, dataset, fake_stripe, "whsec_stress", bookings=3, concurrency=1)
+        assert report["violations"] == []
+        webhook_inbox.process_pending_events(db_session)
+
+        assert stress.verify_payments(db_session.get_bind(), report, since, timeout=1.0) == []
+
+
+@pytest.mark.postgres
+class TestConcurrentScenarios:
+    """Test the scenarios with concurrent requests against a migrated PostgreSQL database"""
+
+    @pytest.fixture
+    def pg_dataset(self, postgres_engine):
+        with app_database(postgres_engine) as SessionLocal:
+            yield datagen.load(postgres_engine, dict(TINY_DATASET), seed=7, reset=True), SessionLocal
+
+    def test_overlapping_bookings(self, pg_dataset, postgres_engine):
+        """Test the exclusion constraint holds while many guests book the same nights at once"""
+        dataset, _ = pg_dataset
+
+        report = stress.stress_bookings(
+            lambda: TestClient(app), dataset, requests=80, concurrency=16, window_nights=5, engine=postgres_engine
+        )
+
+        assert report["violations"] == []
+        assert report["accepted"] > 0 and report["conflicts"] > 0
+        assert report["errors"] == 0
+
+    def test_payment_race(self, pg_dataset, postgres_engine, fake_stripe, monkeypatch):
+        """Test concurrent confirm-payment and duplicate webhooks leave each booking paid with one email"""
+        dataset, SessionLocal = pg_dataset
+        monkeypatch.setattr(settings, "STRIPE_WEBHOOK_SECRET", "whsec_stress")
+        since = datetime.utcnow()
+
+        report = stress.race_payments(
+            lambda: TestClient(app), dataset, fake_stripe, "whsec_stress", bookings=10, concurrency=16
+        )
+        assert report["violations"] == []
+        db = SessionLocal()
+        try:
+            webhook_inbox.process_pending_events(db)
+        finally:
+            db.close()
+
+        assert stress.verify_payments(postgres_engine, report, since, timeout=5.0) == []
@@ -0,0 +1,128 @@
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.trace import SpanKind, StatusCode
+from PIL import Image
+
+from app import tracing
+from app.config import settings
+from app.main import app
+from app.services.s3_service import S3Service
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+exporter = InMemorySpanExporter()
+instrumented = False
+
+
+@pytest.fixture
+def spans(db_session, monkeypatch):
+    """Trace everything into memory; the provider can only be installed once per process"""
+    global instrumented
+    if not instrumented:
+        monkeypatch.setattr(settings, "TRACING_SAMPLE_RATE", 1.0)
+        tracing.configure_tracing(SimpleSpanProcessor(exporter))
+        tracing.instrument_engine(db_session.get_bind())
+        instrumented = True
+    exporter.clear()
+    yield exporter
+    exporter.clear()
+
+
+@pytest.fixture
+def traced_client(spans):
+    """The app behind the tracing middleware, as main.py installs it when an exporter is set"""
+    return TestClient(tracing.TracingMiddleware(app))
+
+
+def by_name(spans, name):
+    return [span for span in spans.get_finished_spans() if span.name == name]
+
+
+class TestRequestTracing:
+    """Test request spans and their SQL children"""
+
+    def test_server_span_with_sql_children(self, traced_client, spans, test_listing):
+        """Test a request span is named by route and parents its statements"""
+        response = traced_client.get(f"/listings/{test_listing.id}")
+
+        [server] = by_name(spans, "GET /listings/{listing_id}")
+        assert server.kind == SpanKind.SERVER
+        assert server.attributes["http.status_code"] == 200
+        trace_id = format(server.context.trace_id, "032x")
+        assert response.headers[tracing.TRACE_ID_HEADER] == trace_id
+
+        queries = by_name(spans, "db SELECT")
+        assert len(queries) >= 2
+        assert all(span.parent.span_id == server.context.span_id for span in queries)
+        assert all(span.attributes["db.system"] == "sqlite" for span in queries)
+        assert str(test_listing.id) not in queries[0].attributes["db.statement"]
+
+    def test_continues_incoming_trace(self, traced_client, spans):
+        """Test a W3C traceparent from the proxy becomes the parent"""
+        traced_client.get("/health", headers={"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"})
+
+        [server] = by_name(spans, "GET /health")
+        assert format(server.context.trace_id, "032x") == TRACE_ID
+        assert format(server.parent.span_id, "016x") == PARENT_ID
+
+    def test_honours_unsampled_parent(self, traced_client, spans):
+        """Test nothing is recorded when the caller decided not to sample"""
+        response = traced_client.get("/health", headers={"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-00"})
+
+        assert response.status_code == 200
+        assert spans.get_finished_spans() == ()
+        assert tracing.TRACE_ID_HEADER not in response.headers
+
+    def test_payment_intent_trace(self, traced_client, spans, fake_stripe, auth_headers, test_booking_data):
+        """Test the Stripe call shows up inside the payment intent request"""
+        booking_id = traced_client.post("/bookings/", json=test_booking_data, headers=auth_headers).json()["id"]
+
+        response = traced_client.post(
+            "/payments/create-payment-intent", json={"booking_id": booking_id}, headers=auth_headers
+        )
+
+        assert response.status_code == 200
+        [server] = by_name(spans, "POST /payments/create-payment-intent")
+        [stripe_call] = by_name(spans, "stripe.create_payment_intent")
+        assert stripe_call.kind == SpanKind.CLIENT
+        assert stripe_call.context.trace_id == server.context.trace_id
+        assert by_name(spans, "db UPDATE")
+
+
+class TestTracedCalls:
+    """Test spans around outbound calls and image processing"""
+
+    def test_failure_marks_span(self, spans):
+        """Test an exception is recorded on the span and re-raised"""
+        @tracing.traced("test.failing")
+        def failing():
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError):
+            failing()
+
+        [span] = by_name(spans, "test.failing")
+        assert span.status.status_code == StatusCode.ERROR
+        assert span.events[0].name == "exception"
+
+    def test_image_processing_span(self, spans):
+        """Test Pillow processing is traced with its sizes"""
+        source = io.BytesIO()
+        Image.new("RGB", (2400, 1200), (200, 10, 10)).save(source, format="PNG")
+
+        S3Service.__new__(S3Service)._process_image(source.getvalue())
+
+        [span] = by_name(spans, "image.process")
+        assert span.attributes["image.bytes_in"] == len(source.getvalue())
+        assert (span.attributes["image.width"], span.attributes["image.height"]) == (1920, 960)
+
+    def test_disabled_by_default(self, monkeypatch):
+        """Test no provider is installed when no exporter is configured"""
+        monkeypatch.setattr(settings, "TRACING_EXPORTER", "none")
+
+        assert tracing.configure_tracing() is False
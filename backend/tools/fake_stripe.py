@@ -0,0 +1,288 @@
+"""In-memory fake of the parts of the Stripe API StayHub uses.
+
+Supports creating, retrieving and listing PaymentIntents (with ``created``
+filters and ``starting_after`` pagination, newest first like Stripe),
+creating refunds, and Idempotency-Key replay on POSTs. Requests are
+counted so tests and benchmarks can assert on API usage.
+
+Run it for offline development (STRIPE_API_BASE=http://127.0.0.1:12111):
+
+    python -m tools.fake_stripe serve --port 12111
+
+or benchmark the payment reconciliation job against it:
+
+    python -m tools.fake_stripe benchmark --bookings 100000
+"""
+import argparse
+import bisect
+import json
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+MAX_LIST_LIMIT = 100
+
+def _error(status: int, message: str, error_type: str = "invalid_request_error"):
+    return status, {"error": {"type": error_type, "message": message}}
+
+class FakeStripe:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.payment_intents: Dict[str, dict] = {}
+        self.refunds: Dict[str, dict] = {}
+        self.request_count = 0
+        self._idempotent_responses: Dict[str, tuple] = {}
+        # (-created, id) keys kept sorted for newest-first listing
+        self._order: List[tuple] = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def add_payment_intent(
+        self,
+        amount: int,
+        status: str = "requires_payment_method",
+        created: Optional[int] = None,
+        metadata: Optional[dict] = None,
+        intent_id: Optional[str] = None,
+        last_payment_error: Optional[dict] = None
+    ) -> dict:
+        """Store an intent directly, e.g. to seed a benchmark"""
+        intent_id = intent_id or f"pi_{uuid.uuid4().hex[:24]}"
+        intent = {
+            "id": intent_id,
+            "object": "payment_intent",
+            "amount": amount,
+            "amount_received": amount if status == "succeeded" else 0,
+            "currency": "usd",
+            "status": status,
+            "client_secret": f"{intent_id}_secret_{uuid.uuid4().hex[:12]}",
+            "created": created if created is not None else int(time.time()),
+            "metadata": metadata or {},
+            "last_payment_error": last_payment_error,
+            "charges": {"object": "list", "data": []}
+        }
+        with self._lock:
+            self.payment_intents[intent_id] = intent
+            bisect.insort(self._order, (-intent["created"], intent_id))
+        return intent
+
+    def set_status(self, intent_id: str, status: str) -> dict:
+        """Move an intent on, e.g. to succeeded as if the customer had paid"""
+        with self._lock:
+            intent = self.payment_intents[intent_id]
+            intent["status"] = status
+            intent["amount_received"] = intent["amount"] if status == "succeeded" else 0
+        return intent
+
+    def _list_payment_intents(self, query: dict):
+        limit = min(int(query.get("limit", 10)), MAX_LIST_LIMIT)
+        created_gte = int(query.get("created[gte]", 0))
+        with self._lock:
+            start = 0
+            if "starting_after" in query:
+                after = self.payment_intents.get(query["starting_after"])
+                if after is None:
+                    return _error(400, "Invalid starting_after")
+                start = bisect.bisect_right(self._order, (-after["created"], after["id"]))
+            # Newest first, so everything at or after the first too-old intent is excluded
+            end = bisect.bisect_left(self._order, (-created_gte + 1, ""), lo=start)
+            keys = self._order[start:min(end, start + limit + 1)]
+            data = [self.payment_intents[intent_id] for _, intent_id in keys[:limit]]
+        return 200, {"object": "list", "url": "/v1/payment_intents", "has_more": len(keys) > limit, "data": data}
+
+    def _create_refund(self, form: dict):
+        intent = self.payment_intents.get(form.get("payment_intent", ""))
+        if intent is None:
+            return _error(404, "No such payment_intent")
+        amount = int(form.get("amount", intent["amount_received"]))
+        refund = {
+            "id": f"re_{uuid.uuid4().hex[:24]}",
+            "object": "refund",
+            "amount": amount,
+            "payment_intent": intent["id"],
+            "status": "succeeded",
+            "created": int(time.time())
+        }
+        with self._lock:
+            self.refunds[refund["id"]] = refund
+        return 200, refund
+
+    def handle(self, method: str, path: str, query: dict, form: dict):
+        parts = path.strip("/").split("/")
+        if parts[:2] != ["v1", "payment_intents"] and parts[:2] != ["v1", "refunds"]:
+            return _error(404, f"Unrecognized request URL ({method}: {path})")
+
+        if parts[1] == "refunds" and method == "POST" and len(parts) == 2:
+            return self._create_refund(form)
+        if parts[1] == "payment_intents" and len(parts) == 2:
+            if method == "GET":
+                return self._list_payment_intents(query)
+            metadata = {key[9:-1]: value for key, value in form.items() if key.startswith("metadata[")}
+            return 200, self.add_payment_intent(int(form.get("amount", 0)), metadata=metadata)
+        if parts[1] == "payment_intents" and len(parts) == 3 and method == "GET":
+            intent = self.payment_intents.get(parts[2])
+            if intent is None:
+                return _error(404, f"No such payment_intent: '{parts[2]}'")
+            return 200, intent
+        return _error(404, f"Unrecognized request URL ({method}: {path})")
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _handle(self):
+                url = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length).decode() if length else ""
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                form = {k: v[0] for k, v in parse_qs(body).items()}
+                with fake._lock:
+                    fake.request_count += 1
+
+                key = self.headers.get("Idempotency-Key") if self.command == "POST" else None
+                with fake._lock:
+                    replay = fake._idempotent_responses.get(key) if key else None
+                if replay is not None:
+                    status, payload = replay
+                else:
+                    status, payload = fake.handle(self.command, url.path, query, form)
+                    # Like Stripe, requests rejected during validation are not saved against the key
+                    if key and status < 400:
+                        with fake._lock:
+                            fake._idempotent_responses[key] = (status, payload)
+
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("Request-Id", f"req_{uuid.uuid4().hex[:14]}")
+                if replay is not None:
+                    self.send_header("Idempotent-Replayed", "true")
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_DELETE = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "FakeStripe":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def benchmark(num_bookings: int, database_url: str, batch_size: int):
+    """Seed bookings and matching intents, then time one reconciliation run"""
+    from datetime import datetime, timedelta
+
+    import stripe
+    from sqlalchemy import create_engine, insert
+    from sqlalchemy.orm import sessionmaker
+
+    from app import models
+    from app.database import Base
+    from app.services.payment_reconciliation import reconcile_payments
+
+    if database_url.startswith("sqlite:///") and os.path.exists(database_url[10:]):
+        os.remove(database_url[10:])
+    engine = create_engine(database_url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+    # Processing bookings whose intent succeeded, was canceled, failed or is still open; plus paid ones
+    outcomes = [("processing", "succeeded")] * 6 + [("processing", "canceled"), ("processing", "requires_payment_method"),
+                                                      ("paid", "succeeded"), ("paid", "succeeded")]
+    now = datetime.now()
+    with FakeStripe() as fake:
+        with engine.begin() as conn:
+            conn.execute(insert(models.User), [
+                {"id": 1, "email": "host@bench.test", "username": "host", "hashed_password": "x", "first_name": "H", "last_name": "B", "is_host": True},
+                {"id": 2, "email": "guest@bench.test", "username": "guest", "hashed_password": "x", "first_name": "G", "last_name": "B", "is_host": False},
+            ])
+            conn.execute(insert(models.Listing), [
+                {"id": i, "title": f"Listing {i}", "price_per_night": 100.0, "location": "Bench", "max_guests": 4, "host_id": 1}
+                for i in range(1, 101)
+            ])
+            rows = []
+            for i in range(num_bookings):
+                payment_status, intent_status = outcomes[i % len(outcomes)]
+                intent = fake.add_payment_intent(
+                    30000,
+                    status=intent_status,
+                    created=int(time.time()) - (num_bookings - i) // 100,
+                    last_payment_error={"code": "card_declined"} if intent_status == "requires_payment_method" and i % 20 == 7 else None
+                )
+                check_in = now + timedelta(days=7 * (i // 100) + 1)
+                rows.append({
+                    "listing_id": 1 + i % 100, "customer_id": 2, "check_in_date": check_in,
+                    "check_out_date": check_in + timedelta(days=3), "total_price": 300.0, "status": "pending",
+                    "payment_status": payment_status, "stripe_payment_intent_id": intent["id"]
+                })
+            conn.execute(insert(models.Booking), rows)
+
+        stripe.api_key = "sk_test_fake"
+        stripe.api_base = fake.url
+        db = sessionmaker(bind=engine)()
+        requests_before = fake.request_count
+        started = time.perf_counter()
+        summary = reconcile_payments(db, lookback=timedelta(days=1), batch_size=batch_size)
+        elapsed = time.perf_counter() - started
+        db.close()
+
+    print(json.dumps({
+        "bookings": num_bookings,
+        "batch_size": batch_size,
+        "seconds": round(elapsed, 3),
+        "bookings_per_second": round(num_bookings / elapsed),
+        "stripe_requests": fake.request_count - requests_before,
+        "summary": summary
+    }, indent=2))
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Stripe API for offline testing")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="run the fake until interrupted")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=12111)
+    bench = sub.add_parser("benchmark", help="time payment reconciliation against the fake")
+    bench.add_argument("--bookings", type=int, default=100000)
+    bench.add_argument("--batch-size", type=int, default=500)
+    bench.add_argument("--database-url", default="sqlite:///./reconcile_bench.db")
+    args = parser.parse_args()
+
+    if args.command == "benchmark":
+        benchmark(args.bookings, args.database_url, args.batch_size)
+        return
+
+    fake = FakeStripe(args.host, args.port).start()
+    print(f"Fake Stripe listening on {fake.url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""Local fault-injecting stand-ins for the outbound dependencies.
+
+``FaultyHTTPServer`` answers any request with a canned JSON body and can be
+switched to respond slowly, fail with a 5xx or reset the connection. Point
+STRIPE_API_BASE or S3_ENDPOINT_URL at it. ``FaultySMTPServer`` is a minimal
+plain-text SMTP server with the same kind of switches; point SMTP_SERVER and
+SMTP_PORT at it with SMTP_USE_TLS=false.
+
+Both run on a background thread so they can be used from tests, or from the
+command line against a locally running app:
+
+    python -m tools.fault_servers http --port 12111 --mode slow --delay 30
+    python -m tools.fault_servers smtp --port 2525 --mode error
+"""
+import argparse
+import asyncio
+import json
+import socket
+import threading
+import time
+from email import message_from_bytes
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+# Fault modes shared by both servers
+OK = "ok"          # answer normally
+SLOW = "slow"      # answer after ``delay`` seconds
+ERROR = "error"    # HTTP 500 / SMTP 421 reply
+RESET = "reset"    # close the connection without answering
+MODES = (OK, SLOW, ERROR, RESET)
+
+class FaultyHTTPServer:
+    """Threaded HTTP server whose behaviour can be switched while it runs"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, mode: str = OK, delay: float = 1.0):
+        self.mode = mode
+        self.delay = delay
+        self.responses: Dict[str, dict] = {}  # path prefix -> JSON body
+        self.default_response: dict = {}
+        self.requests: List[tuple] = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def request_count(self) -> int:
+        with self._lock:
+            return len(self.requests)
+
+    def response_for(self, path: str) -> dict:
+        for prefix, body in self.responses.items():
+            if path.startswith(prefix):
+                return body
+        return self.default_response
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _handle(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                with server._lock:
+                    server.requests.append((self.command, self.path, body))
+
+                if server.mode == RESET:
+                    self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, b"\x01\x00\x00\x00\x00\x00\x00\x00")
+                    self.close_connection = True
+                    self.connection.close()
+                    return
+                if server.mode == SLOW:
+                    time.sleep(server.delay)
+
+                status = 500 if server.mode == ERROR else 200
+                payload = {"error": {"type": "api_error", "message": "Injected fault"}} if status == 500 else server.response_for(self.path)
+                data = json.dumps(payload).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up (timed out) while we were sleeping
+                    self.close_connection = True
+
+            do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "FaultyHTTPServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+class FaultySMTPServer:
+    """Plain-text SMTP server (no TLS or AUTH) recording accepted messages.
+
+    In ``error`` mode every command after the greeting gets ``421``; in
+    ``reset`` mode the connection is closed right after the greeting.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, mode: str = OK, delay: float = 1.0):
+        self.host = host
+        self.port = port
+        self.mode = mode
+        self.delay = delay
+        self.messages: List = []
+        self.connections = 0
+        self.rejected_recipients: set = set()  # RCPT TO these addresses gets 550
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+
+    async def _reply(self, writer: asyncio.StreamWriter, line: str):
+        if self.mode == SLOW:
+            await asyncio.sleep(self.delay)
+        writer.write(f"{line}\r\n".encode())
+        await writer.drain()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            await self._reply(writer, "220 localhost fault SMTP ready")
+            if self.mode == RESET:
+                return
+            mail_from, rcpt_to = None, []
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                command = line.decode(errors="replace").strip()
+                verb = command.split(" ", 1)[0].upper()
+                if self.mode == ERROR and verb != "QUIT":
+                    await self._reply(writer, "421 Service not available, injected fault")
+                    continue
+                if verb == "EHLO":
+                    writer.write(b"250-localhost\r\n250-8BITMIME\r\n")
+                    await self._reply(writer, "250 SMTPUTF8")
+                elif verb == "HELO":
+                    await self._reply(writer, "250 localhost")
+                elif verb == "MAIL":
+                    mail_from, rcpt_to = command[10:].strip(), []
+                    await self._reply(writer, "250 OK")
+                elif verb == "RCPT":
+                    recipient = command[8:].strip()
+                    if recipient.strip("<>") in self.rejected_recipients:
+                        await self._reply(writer, "550 No such user here")
+                        continue
+                    rcpt_to.append(recipient)
+                    await self._reply(writer, "250 OK")
+                elif verb == "DATA":
+                    await self._reply(writer, "354 End data with <CR><LF>.<CR><LF>")
+                    data = bytearray()
+                    while True:
+                        chunk = await reader.readline()
+                        if not chunk or chunk in (b".\r\n", b".\n"):
+                            break
+                        data.extend(chunk[1:] if chunk.startswith(b"..") else chunk)
+                    self.messages.append((mail_from, rcpt_to, message_from_bytes(bytes(data))))
+                    await self._reply(writer, "250 OK queued")
+                elif verb in ("RSET", "NOOP"):
+                    await self._reply(writer, "250 OK")
+                elif verb == "QUIT":
+                    await self._reply(writer, "221 Bye")
+                    return
+                else:
+                    await self._reply(writer, "502 Command not implemented")
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _drop_connections(self):
+        # Cancel handlers still talking to clients (e.g. parked in slow mode)
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        self._server = self._loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+        self._server.close()
+        self._loop.run_until_complete(self._drop_connections())
+        self._loop.run_until_complete(self._server.wait_closed())
+        self._loop.close()
+
+    def start(self) -> "FaultySMTPServer":
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fault-injecting dependency stand-in")
+    parser.add_argument("kind", choices=["http", "smtp"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--mode", choices=MODES, default=OK)
+    parser.add_argument("--delay", type=float, default=1.0, help="seconds per reply in slow mode")
+    args = parser.parse_args()
+
+    server_class = FaultyHTTPServer if args.kind == "http" else FaultySMTPServer
+    server = server_class(args.host, args.port, args.mode, args.delay).start()
+    where = server.url if args.kind == "http" else f"{server.host}:{server.port}"
+    print(f"{args.kind} stand-in listening on {where} in {args.mode} mode (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Local SMTP sink for developing and benchmarking the email outbox.
+
+Accepts every message (except for addresses in ``rejected_recipients``)
+and keeps it in memory. Point the app at it with SMTP_SERVER=127.0.0.1,
+SMTP_PORT=2525 and SMTP_USE_TLS=false:
+
+    python -m tools.smtp_sink serve --port 2525
+
+or time the outbox sender draining a backlog into it:
+
+    python -m tools.smtp_sink benchmark --emails 5000 --pool-size 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+from typing import List
+
+from .fault_servers import FaultySMTPServer
+
+class SMTPSink(FaultySMTPServer):
+    """Always-healthy SMTP server recording what it receives"""
+
+    def messages_to(self, address: str) -> List:
+        return [message for _, rcpt_to, message in self.messages if f"<{address}>" in rcpt_to]
+
+    def wait_for(self, count: int, timeout: float = 10.0) -> bool:
+        """Block until ``count`` messages arrived; False on timeout"""
+        deadline = time.monotonic() + timeout
+        while len(self.messages) < count:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+def benchmark(num_emails: int, num_recipients: int, pool_size: int, batch_size: int, database_url: str):
+    """Fill an outbox and time the sender draining it into the sink"""
+    from sqlalchemy import create_engine, insert
+    from sqlalchemy.orm import sessionmaker
+
+    from app import models
+    from app.config import settings
+    from app.database import Base
+    from app.email import EmailService
+    from app.services.email_outbox import EmailOutboxWorker
+
+    if database_url.startswith("sqlite:///") and os.path.exists(database_url[10:]):
+        os.remove(database_url[10:])
+    engine = create_engine(database_url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(models.EmailOutbox), [{
+            "to_email": f"guest{i % num_recipients}@bench.test",
+            "template": "booking_status_update.html",
+            "subject": "Booking Confirmed - Benchmark Loft",
+            "context": {
+                "customer_name": "Guest",
+                "status": "confirmed",
+                "booking": {
+                    "booking_id": i, "listing_title": "Benchmark Loft", "check_in_date": "2030-01-01",
+                    "check_out_date": "2030-01-04", "guest_count": 2, "total_price": 360.0
+                }
+            },
+            "status": "pending", "attempts": 0, "available_at": now, "created_at": now
+        } for i in range(num_emails)])
+
+    with SMTPSink() as sink:
+        settings.SMTP_SERVER = sink.host
+        settings.SMTP_PORT = sink.port
+        settings.SMTP_USERNAME = ""
+        settings.SMTP_USE_TLS = False
+        settings.SMTP_START_TLS = False
+        settings.SMTP_POOL_SIZE = pool_size
+        settings.EMAIL_RECIPIENT_LIMIT = 0
+
+        service = EmailService()
+        compile_started = time.perf_counter()
+        templates = service.warm_up()
+        compile_seconds = time.perf_counter() - compile_started
+        worker = EmailOutboxWorker(sessionmaker(bind=engine), service)
+
+        async def drain():
+            while await worker.drain_once(batch_size):
+                pass
+            await service.pool.close()
+
+        started = time.perf_counter()
+        asyncio.run(drain())
+        elapsed = time.perf_counter() - started
+
+    print(json.dumps({
+        "emails": num_emails,
+        "delivered": len(sink.messages),
+        "pool_size": pool_size,
+        "batch_size": batch_size,
+        "smtp_connections": sink.connections,
+        "templates_compiled": templates,
+        "warm_up_ms": round(compile_seconds * 1000, 1),
+        "seconds": round(elapsed, 3),
+        "emails_per_second": round(num_emails / elapsed)
+    }, indent=2))
+
+def main():
+    parser = argparse.ArgumentParser(description="Local SMTP sink")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="accept mail until interrupted")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=2525)
+    bench = sub.add_parser("benchmark", help="time the outbox sender against the sink")
+    bench.add_argument("--emails", type=int, default=5000)
+    bench.add_argument("--recipients", type=int, default=500)
+    bench.add_argument("--pool-size", type=int, default=4)
+    bench.add_argument("--batch-size", type=int, default=100)
+    bench.add_argument("--database-url", default="sqlite:///./outbox_bench.db")
+    args = parser.parse_args()
+
+    if args.command == "benchmark":
+        benchmark(args.emails, args.recipients, args.pool_size, args.batch_size, args.database_url)
+        return
+
+    sink = SMTPSink(args.host, args.port).start()
+    print(f"SMTP sink listening on {sink.host}:{sink.port} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"{len(sink.messages)} messages received over {sink.connections} connections")
+    except KeyboardInterrupt:
+        sink.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,463 @@
+"""Concurrency stress tests against a running, PostgreSQL-backed app.
+
+Load a small dataset and start the app with Stripe pointed at the fake
+this tool runs, and with a webhook secret it can sign events with:
+
+    python -m tools.datagen --database-url $DATABASE_URL --scale tiny --reset
+    STRIPE_API_BASE=http://127.0.0.1:12111 STRIPE_SECRET_KEY=sk_test_fake STRIPE_WEBHOOK_SECRET=whsec_stress \\
+        uvicorn app.main:app --workers 4
+
+Hundreds of guests booking overlapping stays on one listing at once; at
+most one booking may hold any night:
+
+    python -m tools.stress bookings --requests 400 --concurrency 100 --database-url $DATABASE_URL
+
+``confirm-payment`` racing (twice delivered) ``payment_intent.succeeded``
+webhooks for the same bookings; every booking must end up paid with
+exactly one confirmation email:
+
+    python -m tools.stress payments --bookings 50 --stripe-port 12111 --webhook-secret whsec_stress \\
+        --database-url $DATABASE_URL
+
+Reports are JSON on stdout; the exit status is 1 when an invariant broke.
+With ``--database-url`` the tool also checks the database directly and
+samples ``pg_stat_activity`` for sessions waiting on locks.
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from . import datagen
+from .loadtest import parse_server_timing, percentile
+
+# Well beyond the stays tools.datagen seeds, so the window starts empty, yet
+# with the payment bookings still inside the default pricing horizon
+DEFAULT_DAYS_AHEAD = 300
+
+def login(client, user_id: int) -> dict:
+    response = client.post("/auth/login", json={"email": datagen.email_for(user_id), "password": datagen.PASSWORD})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def latency_summary(seconds: List[float]) -> dict:
+    latencies = sorted(value * 1000 for value in seconds)
+    return {
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "max": latencies[-1] if latencies else None
+    }
+
+def double_booked_nights(stays: List[Tuple[date, date]]) -> List[str]:
+    """Nights held by more than one of the half-open [check_in, check_out) stays"""
+    held: Dict[date, int] = {}
+    for check_in, check_out in stays:
+        night = check_in
+        while night < check_out:
+            held[night] = held.get(night, 0) + 1
+            night += timedelta(days=1)
+    return sorted(night.isoformat() for night, count in held.items() if count > 1)
+
+class LockWaitSampler:
+    """Polls pg_stat_activity for sessions of this database waiting on a lock"""
+
+    def __init__(self, engine, interval: float = 0.02):
+        self.engine = engine
+        self.interval = interval
+        self.samples: List[Tuple[int, float]] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self):
+        if self.engine is not None and self.engine.dialect.name == "postgresql":
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        from sqlalchemy import text
+
+        query = text("""
+            SELECT count(*), coalesce(max(extract(epoch FROM clock_timestamp() - query_start)), 0)
+            FROM pg_stat_activity
+            WHERE wait_event_type = 'Lock' AND datname = current_database()
+        """)
+        with self.engine.connect() as conn:
+            while not self._stop.wait(self.interval):
+                waiting, longest = conn.execute(query).one()
+                self.samples.append((waiting, float(longest)))
+                conn.rollback()
+
+    def summary(self) -> Optional[dict]:
+        if self._thread is None:
+            return None
+        waiting = [count for count, _ in self.samples]
+        return {
+            "samples": len(self.samples),
+            "samples_with_waiters": sum(1 for count in waiting if count),
+            "max_waiting_sessions": max(waiting, default=0),
+            "longest_wait_ms": round(max((longest for _, longest in self.samples), default=0.0) * 1000, 1)
+        }
+
+def pool_wait(client) -> Optional[Tuple[float, float]]:
+    """(sum, count) of the app's db_pool_wait_seconds histogram, if /metrics answers"""
+    try:
+        response = client.get("/metrics")
+    except Exception:
+        return None
+    if response.status_code != 200:
+        return None
+    values = {}
+    for line in response.text.splitlines():
+        name, _, value = line.partition(" ")
+        if name in ("db_pool_wait_seconds_sum", "db_pool_wait_seconds_count"):
+            values[name] = float(value)
+    if len(values) < 2:
+        return None
+    return values["db_pool_wait_seconds_sum"], values["db_pool_wait_seconds_count"]
+
+def pool_wait_delta(before, after) -> Optional[dict]:
+    if before is None or after is None or after[1] == before[1]:
+        return None
+    checkouts = after[1] - before[1]
+    return {"checkouts": int(checkouts), "mean_wait_ms": round((after[0] - before[0]) / checkouts * 1000, 3)}
+
+def _burst(jobs: List[Callable[[], dict]], concurrency: int) -> Tuple[List[dict], float]:
+    """Run the jobs on ``concurrency`` threads released together; returns results and wall time"""
+    start = threading.Event()
+
+    def gated(job):
+        start.wait()
+        return job()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(gated, job) for job in jobs]
+        time.sleep(0.2)  # let every thread reach the gate
+        started = time.perf_counter()
+        start.set()
+        results = [future.result() for future in futures]
+    return results, time.perf_counter() - started
+
+def _timed(scenario: str, send: Callable) -> dict:
+    started = time.perf_counter()
+    try:
+        response = send()
+    except Exception as e:
+        return {"scenario": scenario, "status": None, "seconds": time.perf_counter() - started, "error": repr(e)}
+    db_ms, _ = parse_server_timing(response.headers.get("server-timing"))
+    return {
+        "scenario": scenario, "status": response.status_code, "seconds": time.perf_counter() - started,
+        "body": response.json() if response.headers.get("content-type", "").startswith("application/json") else None,
+        "db_ms": db_ms
+    }
+
+def _mean_db_ms(results: List[dict]) -> Optional[float]:
+    timed = [r["db_ms"] for r in results if r.get("db_ms") is not None]
+    return round(sum(timed) / len(timed), 2) if timed else None
+
+def _guests(dataset: dict, count: int, rng: random.Random) -> List[int]:
+    return rng.sample(range(dataset["hosts"] + 1, dataset["users"] + 1), min(count, dataset["users"] - dataset["hosts"]))
+
+def _login_all(client_factory, user_ids: List[int], concurrency: int) -> Dict[int, dict]:
+    def one(user_id):
+        return user_id, login(client_factory(), user_id)
+
+    with ThreadPoolExecutor(max_workers=min(concurrency, 16)) as pool:
+        return dict(pool.map(one, user_ids))
+
+def _first_active_listing(client) -> int:
+    response = client.get("/listings/", params={"limit": 1})
+    response.raise_for_status()
+    return response.json()[0]["id"]
+
+def stress_bookings(
+    client_factory: Callable[[], object],
+    dataset: dict,
+    requests: int = 400,
+    concurrency: int = 100,
+    window_nights: int = 10,
+    days_ahead: int = DEFAULT_DAYS_AHEAD,
+    listing_id: Optional[int] = None,
+    engine=None,
+    seed: int = 1
+) -> dict:
+    """Overlapping POST /bookings/ for one listing from many guests at once"""
+    rng = random.Random(seed)
+    client = client_factory()
+    listing_id = listing_id or _first_active_listing(client)
+    window_start = date.today() + timedelta(days=days_ahead)
+    window_end = window_start + timedelta(days=window_nights)
+    if engine is not None and _stored_bookings(engine, listing_id, window_start, window_end):
+        raise SystemExit(f"Listing {listing_id} already has bookings from {window_start}; pass another --days-ahead")
+    guests = _login_all(client_factory, _guests(dataset, min(requests, concurrency * 2), rng), concurrency)
+    guest_ids = list(guests)
+
+    def job(index: int):
+        first = rng.randrange(window_nights)
+        nights = rng.randint(1, min(3, window_nights - first))
+        check_in = window_start + timedelta(days=first)
+        headers = guests[guest_ids[index % len(guest_ids)]]
+        payload = {
+            "listing_id": listing_id,
+            "check_in_date": f"{check_in.isoformat()}T15:00:00",
+            "check_out_date": f"{(check_in + timedelta(days=nights)).isoformat()}T11:00:00",
+            "guest_count": 1
+        }
+        http = client_factory()
+
+        def send():
+            return _timed("book", lambda: http.post("/bookings/", json=payload, headers=headers))
+
+        return lambda: {**send(), "stay": (check_in, check_in + timedelta(days=nights))}
+
+    jobs = [job(i) for i in range(requests)]
+    pool_before = pool_wait(client)
+    with LockWaitSampler(engine) as sampler:
+        results, elapsed = _burst(jobs, concurrency)
+    pool_after = pool_wait(client)
+
+    accepted = [r for r in results if r["status"] == 200]
+    conflicts = [r for r in results if r["status"] == 400]
+    errors = [r for r in results if r["status"] not in (200, 400)]
+    violations = [f"night {night} booked more than once" for night in double_booked_nights([r["stay"] for r in accepted])]
+    violations += [f"unexpected response {r['status']}: {r.get('error') or r.get('body')}" for r in errors[:10]]
+
+    if engine is not None:
+        stored = _stored_bookings(engine, listing_id, window_start, window_end)
+        violations += [f"night {night} held by more than one stored booking" for night in double_booked_nights(stored)]
+        if len(stored) != len(accepted):
+            violations.append(f"{len(stored)} active bookings stored but {len(accepted)} requests accepted")
+
+    return {
+        "scenario": "bookings",
+        "listing_id": listing_id,
+        "window": [window_start.isoformat(), window_end.isoformat()],
+        "requests": len(results),
+        "concurrency": concurrency,
+        "accepted": len(accepted),
+        "conflicts": len(conflicts),
+        "errors": len(errors),
+        "throughput_rps": round(len(results) / elapsed, 1),
+        "latency_ms": {
+            "accepted": latency_summary([r["seconds"] for r in accepted]),
+            "conflict": latency_summary([r["seconds"] for r in conflicts])
+        },
+        "db_ms_per_request": _mean_db_ms(results),
+        "nights_booked": sum((check_out - check_in).days for check_in, check_out in (r["stay"] for r in accepted)),
+        "lock_waits": sampler.summary(),
+        "pool_wait": pool_wait_delta(pool_before, pool_after),
+        "violations": violations
+    }
+
+def _stored_bookings(engine, listing_id: int, start: date, end: date) -> List[Tuple[date, date]]:
+    from sqlalchemy import and_, select
+
+    from app import models
+    from app.services.availability import ACTIVE_BOOKING_STATUSES
+
+    booking = models.Booking.__table__
+    with engine.connect() as conn:
+        rows = conn.execute(select(booking.c.check_in_date, booking.c.check_out_date).where(and_(
+            booking.c.listing_id == listing_id,
+            booking.c.status.in_(ACTIVE_BOOKING_STATUSES),
+            booking.c.check_in_date < datetime.combine(end, datetime.min.time()),
+            booking.c.check_out_date > datetime.combine(start, datetime.min.time())
+        ))).all()
+    return [(check_in.date(), check_out.date()) for check_in, check_out in rows]
+
+def sign_webhook(payload: bytes, secret: str, timestamp: Optional[int] = None) -> str:
+    """A Stripe-Signature header value for ``payload``"""
+    timestamp = timestamp or int(time.time())
+    signature = hmac.new(secret.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+def payment_succeeded_event(intent: dict) -> bytes:
+    return json.dumps({
+        "id": f"evt_{uuid.uuid4().hex[:24]}",
+        "object": "event",
+        "type": "payment_intent.succeeded",
+        "created": int(time.time()),
+        "data": {"object": intent}
+    }).encode()
+
+def race_payments(
+    client_factory: Callable[[], object],
+    dataset: dict,
+    fake,
+    webhook_secret: str,
+    bookings: int = 50,
+    concurrency: int = 50,
+    days_ahead: int = DEFAULT_DAYS_AHEAD,
+    listing_id: Optional[int] = None,
+    seed: int = 1
+) -> dict:
+    """Pay ``bookings`` bookings, then fire confirm-payment and two webhook deliveries for each at once"""
+    rng = random.Random(seed)
+    client = client_factory()
+    listing_id = listing_id or _first_active_listing(client)
+    guests = _login_all(client_factory, _guests(dataset, bookings, rng), concurrency)
+
+    paid = []
+    for index, (guest_id, headers) in enumerate(guests.items()):
+        check_in = date.today() + timedelta(days=days_ahead + 200 + 3 * index)
+        response = client.post("/bookings/", headers=headers, json={
+            "listing_id": listing_id,
+            "check_in_date": f"{check_in.isoformat()}T15:00:00",
+            "check_out_date": f"{(check_in + timedelta(days=2)).isoformat()}T11:00:00",
+            "guest_count": 1
+        })
+        response.raise_for_status()
+        booking_id = response.json()["id"]
+        response = client.post("/payments/create-payment-intent", headers=headers, json={"booking_id": booking_id})
+        response.raise_for_status()
+        intent = fake.set_status(response.json()["payment_intent_id"], "succeeded")
+        paid.append((booking_id, headers, intent))
+
+    jobs = []
+    for booking_id, headers, intent in paid:
+        event = payment_succeeded_event(intent)
+        http = client_factory()
+        jobs.append(lambda http=http, headers=headers, intent=intent: _timed(
+            "confirm", lambda: http.post("/payments/confirm-payment", headers=headers, json={"payment_intent_id": intent["id"]})
+        ))
+        # Stripe may deliver an event more than once; both copies race the confirmation
+        for _ in range(2):
+            jobs.append(lambda http=http, event=event: _timed(
+                "webhook", lambda: http.post("/payments/webhook", content=event, headers={
+                    "stripe-signature": sign_webhook(event, webhook_secret), "content-type": "application/json"
+                })
+            ))
+    rng.shuffle(jobs)
+    results, elapsed = _burst(jobs, concurrency)
+
+    confirms = [r for r in results if r["scenario"] == "confirm"]
+    webhooks = [r for r in results if r["scenario"] == "webhook"]
+    stored = sum(1 for r in webhooks if r["status"] == 200 and r["body"] == {"status": "success"})
+    violations = [f"confirm-payment returned {r['status']}: {r.get('error') or r.get('body')}" for r in confirms if r["status"] != 200]
+    violations += [f"webhook returned {r['status']}: {r.get('error') or r.get('body')}" for r in webhooks if r["status"] != 200]
+    if stored != len(paid):
+        violations.append(f"{stored} webhook events stored for {len(paid)} distinct events")
+
+    return {
+        "scenario": "payments",
+        "bookings": [booking_id for booking_id, _, _ in paid],
+        "payment_intents": [intent["id"] for _, _, intent in paid],
+        "requests": len(results),
+        "concurrency": concurrency,
+        "throughput_rps": round(len(results) / elapsed, 1),
+        "latency_ms": {
+            "confirm": latency_summary([r["seconds"] for r in confirms]),
+            "webhook": latency_summary([r["seconds"] for r in webhooks])
+        },
+        "violations": violations
+    }
+
+def verify_payments(engine, report: dict, since: datetime, timeout: float = 30.0) -> List[str]:
+    """Wait for the inbox to apply the events, then check each booking was confirmed and emailed once"""
+    from sqlalchemy import func, select
+
+    from app import models
+
+    events = models.WebhookEvent.__table__
+    deadline = time.monotonic() + timeout
+    with engine.connect() as conn:
+        while True:
+            pending = conn.execute(select(func.count()).select_from(events).where(
+                events.c.payment_intent_id.in_(report["payment_intents"]), events.c.status == "pending"
+            )).scalar()
+            conn.rollback()
+            if not pending or time.monotonic() > deadline:
+                break
+            time.sleep(0.2)
+
+        violations = [f"{pending} webhook events still pending after {timeout}s"] if pending else []
+        bookings = models.Booking.__table__
+        for booking_id, status, payment_status in conn.execute(select(
+            bookings.c.id, bookings.c.status, bookings.c.payment_status
+        ).where(bookings.c.id.in_(report["bookings"]))):
+            if (status, payment_status) != ("confirmed", "paid"):
+                violations.append(f"booking {booking_id} ended {status}/{payment_status}")
+
+        outbox = models.EmailOutbox.__table__
+        emails: Dict[int, int] = {}
+        for (context,) in conn.execute(select(outbox.c.context).where(
+            outbox.c.template == "booking_confirmation.html", outbox.c.created_at >= since
+        )):
+            booking_id = context["booking"]["booking_id"]
+            emails[booking_id] = emails.get(booking_id, 0) + 1
+    violations += [
+        f"booking {booking_id} got {emails.get(booking_id, 0)} confirmation emails"
+        for booking_id in report["bookings"] if emails.get(booking_id, 0) != 1
+    ]
+    return violations
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("bookings", "payments"):
+        command = sub.add_parser(name)
+        command.add_argument("--base-url", default="http://127.0.0.1:8000")
+        command.add_argument("--dataset", default="dataset.json", help="manifest written by tools.datagen")
+        command.add_argument("--database-url", help="check invariants in the database and sample lock waits")
+        command.add_argument("--listing-id", type=int, help="defaults to the first active listing")
+        command.add_argument("--days-ahead", type=int, default=DEFAULT_DAYS_AHEAD)
+        command.add_argument("--seed", type=int, default=1)
+    sub.choices["bookings"].add_argument("--requests", type=int, default=400)
+    sub.choices["bookings"].add_argument("--concurrency", type=int, default=100)
+    sub.choices["bookings"].add_argument("--window-nights", type=int, default=10)
+    sub.choices["payments"].add_argument("--bookings", type=int, default=50)
+    sub.choices["payments"].add_argument("--concurrency", type=int, default=50)
+    sub.choices["payments"].add_argument("--stripe-port", type=int, default=12111, help="where the app's STRIPE_API_BASE points")
+    sub.choices["payments"].add_argument("--webhook-secret", required=True, help="the app's STRIPE_WEBHOOK_SECRET")
+    args = parser.parse_args()
+
+    import httpx
+    from sqlalchemy import create_engine
+
+    with open(args.dataset) as f:
+        dataset = json.load(f)
+    engine = create_engine(args.database_url) if args.database_url else None
+    limits = httpx.Limits(max_connections=args.concurrency * 2)
+    shared = httpx.Client(base_url=args.base_url, timeout=60.0, limits=limits)
+
+    def client_factory():
+        return shared
+
+    if args.command == "bookings":
+        report = stress_bookings(
+            client_factory, dataset, args.requests, args.concurrency, args.window_nights,
+            args.days_ahead, args.listing_id, engine, args.seed
+        )
+    else:
+        from .fake_stripe import FakeStripe
+
+        since = datetime.utcnow()
+        with FakeStripe(port=args.stripe_port) as fake:
+            report = race_payments(
+                client_factory, dataset, fake, args.webhook_secret, args.bookings, args.concurrency,
+                args.days_ahead, args.listing_id, args.seed
+            )
+        if engine is not None:
+            report["violations"] += verify_payments(engine, report, since)
+
+    print(json.dumps(report, indent=2, default=str))
+    for violation in report["violations"]:
+        print(f"VIOLATION {violation}", file=sys.stderr)
+    sys.exit(1 if report["violations"] else 0)
+
+if __name__ == "__main__":
+    main()